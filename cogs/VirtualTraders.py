@@ -7,11 +7,14 @@ import datetime
 from typing import List, Dict, Tuple, Optional
 from models.stocks import Stock
 from models.currency import Currency
-from utils.database import get_db_connection, execute_query
+from utils.database import get_db_connection, execute_query, execute_batch, attach_database
 
 class VirtualTrader:
     """虛擬交易者模型"""
-    
+
+    # 使用 __slots__ 減少每個交易者的記憶體用量
+    __slots__ = ('trader_id', 'name', 'balance', 'strategy', 'risk_level', 'active', 'last_trade_time')
+
     def __init__(self, trader_id: int, name: str, balance: int = 50000, strategy: str = "random", risk_level: float = 0.5, active: bool = True):
         self.trader_id = trader_id
         self.name = name
@@ -21,6 +24,16 @@ class VirtualTrader:
         self.active = active
         self.last_trade_time = None
 
+    @classmethod
+    def from_row(cls, row):
+        """由資料庫列 (trader_id, name, balance, strategy, risk_level, active) 建立"""
+        trader_id, name, balance, strategy, risk_level, active = row
+        return cls(trader_id, name, balance, strategy, risk_level, bool(active))
+
+    def to_row(self):
+        """轉換為與 from_row 相同順序的資料列"""
+        return (self.trader_id, self.name, self.balance, self.strategy, self.risk_level, int(self.active))
+
 class TradeStrategy:
     """交易策略基類"""
     
@@ -202,6 +215,11 @@ class VirtualTraderManager:
         self.traders = {}  # {trader_id: VirtualTrader}
         self.stock_system = Stock(bot)
         self.loaded = False
+
+        # 延遲寫入：餘額變動的交易者與待寫入的交易紀錄，定期批次寫回資料庫
+        self.dirty_traders = set()
+        self.pending_trades = []
+        self.flush_lock = asyncio.Lock()
         
     async def setup_database(self):
         """初始化資料庫表格"""
@@ -253,15 +271,8 @@ class VirtualTraderManager:
         result = await execute_query(self.db_name, query, fetch_type='all')
         
         if result:
-            for trader_id, name, balance, strategy, risk_level, active in result:
-                self.traders[trader_id] = VirtualTrader(
-                    trader_id=trader_id,
-                    name=name,
-                    balance=balance,
-                    strategy=strategy,
-                    risk_level=risk_level,
-                    active=bool(active)
-                )
+            for row in result:
+                self.traders[row[0]] = VirtualTrader.from_row(row)
                 
         self.loaded = True
         
@@ -300,6 +311,75 @@ class VirtualTraderManager:
             
         return trader_id
         
+    async def create_traders_bulk(self, count: int, balance: int = 50000) -> List[VirtualTrader]:
+        """批次創建虛擬交易者，並一次為所有交易者在 Currency 系統中注資"""
+        await self.load_traders()
+
+        rows = [
+            (
+                f"虛擬交易者{random.randint(1000, 9999)}",
+                balance,
+                random.choice(["random", "trend", "reverse"]),
+                random.uniform(0.1, 1.0)
+            )
+            for _ in range(count)
+        ]
+
+        # 與延遲寫入共用鎖，確保插入前後的 ID 範圍只包含這批交易者
+        async with self.flush_lock:
+            result = await execute_query(self.db_name, 'SELECT COALESCE(MAX(trader_id), 0) FROM virtual_traders', fetch_type='one')
+            last_id = result[0] if result else 0
+
+            success = await execute_batch(self.db_name, [
+                (
+                    '''
+                    INSERT INTO virtual_traders (name, balance, strategy, risk_level)
+                    VALUES (?, ?, ?, ?)
+                    ''',
+                    rows
+                )
+            ])
+
+            if not success:
+                return []
+
+            query = '''
+            SELECT trader_id, name, balance, strategy, risk_level, active
+            FROM virtual_traders
+            WHERE trader_id > ?
+            ORDER BY trader_id
+            '''
+            created = await execute_query(self.db_name, query, (last_id,), 'all') or []
+
+        traders = [VirtualTrader.from_row(row) for row in created]
+        if not traders:
+            return []
+
+        # 在 Currency 系統中設置相同的餘額
+        currency = Currency(self.bot)
+        funded = await currency.apply_balance_changes(
+            {trader.trader_id: trader.balance for trader in traders},
+            "初始化虛擬交易者資金",
+            {trader.trader_id: trader.name for trader in traders}
+        )
+
+        if not funded:
+            # 注資失敗時刪除這批交易者，避免留下沒有 Currency 帳戶的交易者
+            deleted = await execute_query(
+                self.db_name,
+                'DELETE FROM virtual_traders WHERE trader_id BETWEEN ? AND ?',
+                (traders[0].trader_id, traders[-1].trader_id)
+            )
+            if deleted is None:
+                print("刪除未注資的虛擬交易者失敗，請執行 /syncvirtualtraders 修正餘額")
+            return []
+
+        # 直接加入記憶體，不需重新加載
+        for trader in traders:
+            self.traders[trader.trader_id] = trader
+
+        return traders
+
     async def get_all_traders(self) -> List[VirtualTrader]:
         """獲取所有虛擬交易者"""
         await self.load_traders()
@@ -311,22 +391,47 @@ class VirtualTraderManager:
         return self.traders.get(trader_id)
         
     async def update_trader_balance(self, trader_id: int, amount: int):
-        """更新虛擬交易者餘額"""
+        """更新虛擬交易者餘額 (先更新記憶體，由 flush 寫回資料庫)"""
         trader = await self.get_trader(trader_id)
         if not trader:
             return False
-            
+
         trader.balance += amount
-        
-        query = '''
-        UPDATE virtual_traders
-        SET balance = ?
-        WHERE trader_id = ?
-        '''
-        
-        await execute_query(self.db_name, query, (trader.balance, trader_id))
-        
+        self.dirty_traders.add(trader_id)
+
         return True
+
+    async def flush(self):
+        """將延遲寫入的餘額與交易紀錄批次寫回資料庫"""
+        async with self.flush_lock:
+            if not self.dirty_traders and not self.pending_trades:
+                return True
+
+            dirty_ids, self.dirty_traders = self.dirty_traders, set()
+            trades, self.pending_trades = self.pending_trades, []
+
+            balances = [
+                (self.traders[trader_id].balance, trader_id)
+                for trader_id in dirty_ids if trader_id in self.traders
+            ]
+
+            success = await execute_batch(self.db_name, [
+                ('UPDATE virtual_traders SET balance = ? WHERE trader_id = ?', balances),
+                (
+                    '''
+                    INSERT INTO virtual_trades (trader_id, stock_code, action, shares, price, total_amount, trade_time)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                    ''',
+                    trades
+                )
+            ])
+
+            if not success:
+                # 寫入失敗時保留資料，等下次再寫
+                self.dirty_traders |= dirty_ids
+                self.pending_trades = trades + self.pending_trades
+
+            return success
     
     async def sync_trader_balance(self, trader_id: int):
         """同步虛擬交易者在Currency系統中的餘額"""
@@ -340,6 +445,69 @@ class VirtualTraderManager:
                 return True
         return False
         
+    async def reconcile_balances(self, apply: bool = True) -> Dict:
+        """一次比對所有交易者與 Currency 系統的餘額，並在同一個交易中修正差額
+
+        返回差額分布報告
+        """
+        await self.load_traders()
+
+        # 先寫回延遲寫入的餘額，確保比對的是最新資料
+        await self.flush()
+
+        currency = Currency(self.bot)
+        await currency.setup_database()
+
+        report = {
+            "total": len(self.traders),
+            "drifted": 0,
+            "over": 0,    # Currency 餘額高於交易者餘額
+            "under": 0,   # Currency 餘額低於交易者餘額
+            "net_drift": 0,
+            "abs_drift": 0,
+            "max_drift": 0,
+            "buckets": {"<100": 0, "<1,000": 0, "<10,000": 0, "≥10,000": 0},
+            "applied": False
+        }
+
+        if not await attach_database(self.db_name, "currency", "currency_db"):
+            return report
+
+        query = '''
+        SELECT v.trader_id, v.balance - COALESCE(u.balance, 0) AS drift
+        FROM virtual_traders v
+        LEFT JOIN currency_db.user_currency u ON u.user_id = v.trader_id
+        WHERE v.balance != COALESCE(u.balance, 0)
+        '''
+
+        drifts = await execute_query(self.db_name, query, fetch_type='all') or []
+
+        for trader_id, drift in drifts:
+            size = abs(drift)
+            report["drifted"] += 1
+            report["over" if drift < 0 else "under"] += 1
+            report["net_drift"] += drift
+            report["abs_drift"] += size
+            report["max_drift"] = max(report["max_drift"], size)
+
+            if size < 100:
+                report["buckets"]["<100"] += 1
+            elif size < 1000:
+                report["buckets"]["<1,000"] += 1
+            elif size < 10000:
+                report["buckets"]["<10,000"] += 1
+            else:
+                report["buckets"]["≥10,000"] += 1
+
+        if apply and drifts:
+            report["applied"] = await currency.apply_balance_changes(
+                dict(drifts),
+                "同步虛擬交易者餘額",
+                {trader_id: self.traders[trader_id].name for trader_id, _ in drifts if trader_id in self.traders}
+            )
+
+        return report
+
     async def toggle_trader_active(self, trader_id: int) -> bool:
         """切換虛擬交易者的活躍狀態"""
         trader = await self.get_trader(trader_id)
@@ -397,17 +565,9 @@ class VirtualTraderManager:
             return {}
             
     async def record_trade(self, trader_id: int, stock_code: str, action: str, shares: int, price: float, total_amount: float):
-        """記錄交易"""
-        query = '''
-        INSERT INTO virtual_trades (trader_id, stock_code, action, shares, price, total_amount)
-        VALUES (?, ?, ?, ?, ?, ?)
-        '''
-        
-        await execute_query(
-            self.db_name,
-            query,
-            (trader_id, stock_code, action, shares, price, total_amount)
-        )
+        """記錄交易 (暫存後由 flush 批次寫入)"""
+        trade_time = datetime.datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+        self.pending_trades.append((trader_id, stock_code, action, shares, price, total_amount, trade_time))
         
     async def execute_trader_action(self, trader: VirtualTrader):
         """執行單個交易者的交易行為"""
@@ -579,6 +739,47 @@ class VirtualTraderManager:
                     
         return stats
 
+class VirtualOrdersView(discord.ui.View):
+    def __init__(self, cog, user_id, current_page, has_next, first_key, last_key):
+        super().__init__(timeout=180)
+        self.cog = cog
+        self.user_id = user_id
+        self.current_page = current_page
+        # 本頁第一筆與最後一筆的 (trader_id, order_id)，作為翻頁游標
+        self.first_key = first_key
+        self.last_key = last_key
+
+        self.prev_button = discord.ui.Button(
+            label="上一頁",
+            style=discord.ButtonStyle.primary,
+            disabled=(current_page <= 1)
+        )
+        self.prev_button.callback = self.previous_page
+        self.add_item(self.prev_button)
+
+        self.next_button = discord.ui.Button(
+            label="下一頁",
+            style=discord.ButtonStyle.primary,
+            disabled=not has_next
+        )
+        self.next_button.callback = self.next_page
+        self.add_item(self.next_button)
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        if interaction.user.id != self.user_id:
+            await interaction.response.send_message("這不是你的委託單列表！", ephemeral=True)
+            return False
+        return True
+
+    async def previous_page(self, interaction: discord.Interaction):
+        await interaction.response.defer()
+        await self.cog._show_virtual_orders_page(interaction, self.current_page - 1, before=self.first_key)
+
+    async def next_page(self, interaction: discord.Interaction):
+        await interaction.response.defer()
+        await self.cog._show_virtual_orders_page(interaction, self.current_page + 1, after=self.last_key)
+
+
 class VirtualTradersCog(commands.Cog):
     """虛擬交易者系統指令"""
 
@@ -586,10 +787,22 @@ class VirtualTradersCog(commands.Cog):
         self.bot = bot
         self.manager = VirtualTraderManager(bot)
         self.trading_task = self.start_trading_task()
-        
-    def cog_unload(self):
-        """Cog卸載時取消任務"""
+        # 啟動延遲寫入任務
+        self.flush_trader_state.start()
+
+    async def cog_unload(self):
+        """Cog卸載時取消任務並寫回未儲存的資料"""
         self.trading_task.cancel()
+        self.flush_trader_state.cancel()
+        await self.manager.flush()
+
+    @tasks.loop(seconds=30)
+    async def flush_trader_state(self):
+        """定期寫回交易者餘額與交易紀錄"""
+        try:
+            await self.manager.flush()
+        except Exception as e:
+            print(f"寫回虛擬交易者資料時發生錯誤: {e}")
         
     def start_trading_task(self):
         """啟動交易任務"""
@@ -621,14 +834,20 @@ class VirtualTradersCog(commands.Cog):
             await interaction.response.send_message("你沒有權限使用此指令！", ephemeral=True)
             return
             
-        # 創建虛擬交易者
-        created = 0
-        for i in range(count):
-            trader_name = f"虛擬交易者{random.randint(1000, 9999)}"
-            await self.manager.create_trader(trader_name)
-            created += 1
-            
-        await interaction.response.send_message(f"✅ 已創建 {created} 個虛擬交易者！", ephemeral=False)
+        if count <= 0 or count > 5000:
+            await interaction.response.send_message("數量必須介於 1 到 5000 之間！", ephemeral=True)
+            return
+
+        await interaction.response.defer(thinking=True)
+
+        # 批次創建虛擬交易者
+        traders = await self.manager.create_traders_bulk(count)
+
+        if not traders:
+            await interaction.followup.send("❌ 創建虛擬交易者時發生錯誤，請查看日誌！")
+            return
+
+        await interaction.followup.send(f"✅ 已創建 {len(traders)} 個虛擬交易者！")
     
     @app_commands.command(name="listvirtualtraders", description="列出所有虛擬交易者 (管理員專用)")
     @app_commands.default_permissions(administrator=True)
@@ -817,116 +1036,62 @@ class VirtualTradersCog(commands.Cog):
         if not interaction.user.guild_permissions.administrator:
             await interaction.response.send_message("你沒有權限使用此指令！", ephemeral=True)
             return
-            
-        # 獲取所有虛擬交易者
-        traders = await self.manager.get_all_traders()
-        
-        if not traders:
-            await interaction.response.send_message("目前沒有任何虛擬交易者！", ephemeral=True)
-            return
-        
-        trader_ids = [trader.trader_id for trader in traders]
-        
-        # 獲取所有虛擬交易者的活躍委託單
-        orders = []
-        stock_system = Stock(self.bot)
-        
-        for trader_id in trader_ids:
-            trader_orders = await stock_system.get_user_orders(trader_id, active_only=True)
-            orders.extend([(trader_id, *order) for order in trader_orders])
-        
-        if not orders:
-            await interaction.response.send_message("目前沒有任何虛擬交易者的活躍委託單！", ephemeral=True)
-            return
-            
-        # 按交易者ID分組
-        orders_by_trader = {}
-        for trader_id, *order_data in orders:
-            if trader_id not in orders_by_trader:
-                orders_by_trader[trader_id] = []
-            orders_by_trader[trader_id].append(order_data)
-        
-        # 創建嵌入訊息
-        embeds = []
-        
-        for trader_id, trader_orders in orders_by_trader.items():
-            trader = None
-            for t in traders:
-                if t.trader_id == trader_id:
-                    trader = t
-                    break
-                    
-            if not trader:
-                continue
-                
+
+        await interaction.response.defer(thinking=True)
+        await self._show_virtual_orders_page(interaction)
+
+    async def _show_virtual_orders_page(self, interaction, page: int = 1, after=None, before=None):
+        """顯示虛擬交易者委託單的特定頁
+
+        以 (交易者ID, 委託單ID) 為游標做索引範圍查詢，每次只讀取一頁的委託單。
+        """
+        try:
+            page_size = 10  # 每頁顯示10筆委託單
+
+            # 獲取所有虛擬交易者
+            traders = await self.manager.get_all_traders()
+
+            if not traders:
+                await interaction.edit_original_response(content="目前沒有任何虛擬交易者！", embed=None, view=None)
+                return
+
+            traders_by_id = {trader.trader_id: trader for trader in traders}
+
+            orders, has_more = await Stock(self.bot).get_orders_for_users_keyset(
+                traders_by_id.keys(), page_size, after=after, before=before
+            )
+
+            if not orders:
+                await interaction.edit_original_response(content="目前沒有任何虛擬交易者的活躍委託單！", embed=None, view=None)
+                return
+
             embed = discord.Embed(
-                title=f"🤖 {trader.name} 的委託單",
-                description=f"交易者ID: {trader_id} | 餘額: {trader.balance:,} Silva幣",
+                title="🤖 虛擬交易者的委託單",
+                description=f"以下是虛擬交易者的活躍委託單 (第 {page} 頁)",
                 color=discord.Color.blue()
             )
-            
-            for order_id, stock_code, stock_name, order_type, shares, price, status, created_at in trader_orders[:5]:  # 只顯示前5個
+
+            for trader_id, order_id, stock_code, stock_name, order_type, shares, price, status, created_at in orders:
+                trader = traders_by_id.get(trader_id)
                 type_emoji = "🟢" if order_type == "buy" else "🔴"
                 type_text = "購買" if order_type == "buy" else "出售"
-                
+
                 embed.add_field(
                     name=f"#{order_id}: {type_emoji} {type_text} {stock_code}",
-                    value=f"股票: {stock_name}\n數量: {shares} 股\n價格: {price} Silva幣\n總額: {shares * price:,.2f} Silva幣\n狀態: {status}\n提交時間: {created_at}",
+                    value=f"交易者: {trader.name if trader else trader_id} (ID: {trader_id})\n股票: {stock_name}\n數量: {shares} 股\n價格: {price} Silva幣\n總額: {shares * price:,.2f} Silva幣\n提交時間: {created_at}",
                     inline=True
                 )
-                
-            embed.set_footer(text=f"共 {len(trader_orders)} 個委託單")
-            embeds.append(embed)
-        
-        if not embeds:
-            await interaction.response.send_message("無法獲取虛擬交易者的委託單信息！", ephemeral=True)
-            return
-            
-        # 發送第一個嵌入訊息
-        current_page = 0
-        
-        # 創建按鈕視圖
-        view = discord.ui.View(timeout=180)
-        
-        # 添加上一頁按鈕
-        previous_button = discord.ui.Button(label="上一頁", style=discord.ButtonStyle.primary, disabled=True)
-        
-        async def previous_callback(interaction: discord.Interaction):
-            nonlocal current_page
-            current_page -= 1
-            
-            # 更新按鈕狀態
-            previous_button.disabled = current_page == 0
-            next_button.disabled = current_page == len(embeds) - 1
-            
-            await interaction.response.edit_message(embed=embeds[current_page], view=view)
-        
-        previous_button.callback = previous_callback
-        view.add_item(previous_button)
-        
-        # 添加下一頁按鈕
-        next_button = discord.ui.Button(label="下一頁", style=discord.ButtonStyle.primary, disabled=len(embeds) == 1)
-        
-        async def next_callback(interaction: discord.Interaction):
-            nonlocal current_page
-            current_page += 1
-            
-            # 更新按鈕狀態
-            previous_button.disabled = current_page == 0
-            next_button.disabled = current_page == len(embeds) - 1
-            
-            await interaction.response.edit_message(embed=embeds[current_page], view=view)
-        
-        next_button.callback = next_callback
-        view.add_item(next_button)
-        
-        # 修復了 view=None 錯誤，改為始終提供 view
-        # 當只有一頁時，禁用兩個按鈕但仍然提供 view
-        if len(embeds) == 1:
-            previous_button.disabled = True
-            next_button.disabled = True
-            
-        await interaction.response.send_message(embed=embeds[0], view=view)
+
+            view = VirtualOrdersView(
+                self, interaction.user.id, page,
+                True if before is not None else has_more,
+                (orders[0][0], orders[0][1]), (orders[-1][0], orders[-1][1])
+            )
+
+            await interaction.edit_original_response(content=None, embed=embed, view=view)
+        except Exception as e:
+            print(f"執行 virtualorders 指令時發生錯誤: {e}")
+            await interaction.followup.send("獲取虛擬交易者的委託單時發生錯誤！", ephemeral=True)
 
     @app_commands.command(name="syncvirtualtraders", description="同步所有虛擬交易者的餘額 (管理員專用)")
     @app_commands.default_permissions(administrator=True)
@@ -937,16 +1102,39 @@ class VirtualTradersCog(commands.Cog):
             return
             
         await interaction.response.defer(thinking=True)
-        
+
         try:
-            traders = await self.manager.get_all_traders()
-            synced = 0
-            
-            for trader in traders:
-                if await self.manager.sync_trader_balance(trader.trader_id):
-                    synced += 1
-                    
-            await interaction.followup.send(f"✅ 已同步 {synced}/{len(traders)} 個虛擬交易者的餘額！")
+            report = await self.manager.reconcile_balances()
+
+            if report["drifted"] and not report["applied"]:
+                await interaction.followup.send("❌ 修正餘額差額時發生錯誤，請查看日誌！")
+                return
+
+            embed = discord.Embed(
+                title="🔄 虛擬交易者餘額同步",
+                description=f"已同步 {report['drifted']}/{report['total']} 個虛擬交易者的餘額！",
+                color=discord.Color.green()
+            )
+
+            if report["drifted"]:
+                embed.add_field(
+                    name="差額統計",
+                    value=(
+                        f"Currency 偏高: {report['over']} 個\n"
+                        f"Currency 偏低: {report['under']} 個\n"
+                        f"淨差額: {report['net_drift']:+,} Silva幣\n"
+                        f"總差額: {report['abs_drift']:,} Silva幣\n"
+                        f"最大差額: {report['max_drift']:,} Silva幣"
+                    ),
+                    inline=True
+                )
+                embed.add_field(
+                    name="差額分布",
+                    value="\n".join(f"{bucket}: {count} 個" for bucket, count in report["buckets"].items()),
+                    inline=True
+                )
+
+            await interaction.followup.send(embed=embed)
         except Exception as e:
             await interaction.followup.send(f"❌ 同步餘額時發生錯誤: {str(e)}")
 
@@ -4,28 +4,36 @@ from discord import app_commands
 from discord.ui import Button, View
 import random
 import asyncio
-from models.games import Deck, Hand
+from models.games import Shoe, Hand, card_str
 from models.currency import Currency
+from utils.sessions import session_registry
+
+# 每位玩家同時只能有一局，閒置超過存活時間會退還下注
+BLACKJACK_TTL = 180
 
 class BlackjackView(discord.ui.View):
-    """21點遊戲視圖"""
+    """21點遊戲視圖 (逾時由工作階段註冊表處理)"""
     def __init__(self, game, bet: int):
-        super().__init__(timeout=180)
+        super().__init__(timeout=None)
         self.game = game
         self.bet = bet
-        self.ended = False
+        self.interaction = None
         
     @discord.ui.button(label="抽牌", style=discord.ButtonStyle.green)
     async def hit(self, interaction: discord.Interaction, button: discord.ui.Button):
         """抽牌按鈕"""
         if interaction.user.id != self.game.player_id:
             return
+
+        # 每次操作都延長遊戲的存活時間
+        if not session_registry.touch("blackjack", self.game.player_id):
+            await interaction.response.send_message("這局遊戲已經結束了！", ephemeral=True)
+            return
         
         card = self.game.deck.draw()
         self.game.player_hand.add_card(card)
         
         if self.game.player_hand.get_value() > 21:
-            self.ended = True
             await self.end_game(interaction, "爆牌")
             return
             
@@ -36,8 +44,10 @@ class BlackjackView(discord.ui.View):
         """停牌按鈕"""
         if interaction.user.id != self.game.player_id:
             return
-            
-        self.ended = True
+
+        if not session_registry.get("blackjack", self.game.player_id):
+            await interaction.response.send_message("這局遊戲已經結束了！", ephemeral=True)
+            return
         
         # 莊家抽牌
         while self.game.dealer_hand.get_value() < 17:
@@ -53,6 +63,10 @@ class BlackjackView(discord.ui.View):
         
     async def end_game(self, interaction: discord.Interaction, result: str = None):
         """結束遊戲"""
+        # 先關閉工作階段，避免與逾時退款同時發生
+        session_registry.close("blackjack", self.game.player_id)
+        self.stop()
+
         player_value = self.game.player_hand.get_value()
         dealer_value = self.game.dealer_hand.get_value()
         
@@ -110,13 +124,34 @@ class BlackjackView(discord.ui.View):
             
         await interaction.response.edit_message(embed=embed, view=self)
 
+async def expire_blackjack(session, reason: str):
+    """遊戲逾時或被取代時退還下注並停用按鈕"""
+    view = session.state
+    view.stop()
+
+    currency = Currency(view.game.bot)
+    await currency.update_balance(view.game.player_id, view.bet, view.game.player_name)
+
+    embed = discord.Embed(
+        title="Blackjack - 遊戲超時",
+        description="遊戲已取消，已退還下注金額。",
+        color=discord.Color.red()
+    )
+    for child in view.children:
+        child.disabled = True
+
+    if view.interaction:
+        await view.interaction.edit_original_response(embed=embed, view=view)
+
+session_registry.configure("blackjack", ttl=BLACKJACK_TTL, capacity=1000, on_expire=expire_blackjack)
+
 class Blackjack:
     """21點遊戲模型"""
     def __init__(self, bot, player_id: int, player_name: str):
         self.bot = bot
         self.player_id = player_id
         self.player_name = player_name
-        self.deck = Deck()
+        self.deck = Shoe()
         self.player_hand = Hand()
         self.dealer_hand = Hand()
         
@@ -143,7 +178,7 @@ class Blackjack:
         # 只顯示莊家的第一張牌
         embed.add_field(
             name="莊家", 
-            value=f"{self.dealer_hand.cards[0]} ?",
+            value=f"{card_str(self.dealer_hand.cards[0])} ?",
             inline=False
         )
         
@@ -167,6 +202,10 @@ class BlackjackCog(commands.Cog):
         if bet <= 0:
             await interaction.response.send_message("❌ 下注金額必須大於0！", ephemeral=True)
             return
+
+        if session_registry.get("blackjack", interaction.user.id):
+            await interaction.response.send_message("❌ 你已經有一局進行中的21點了！", ephemeral=True)
+            return
         
         # 檢查玩家餘額
         currency = Currency(self.bot)
@@ -197,23 +236,10 @@ class BlackjackCog(commands.Cog):
             inline=False
         )
         
+        # 登記工作階段，逾時由註冊表退還下注，不再佔用一個等待中的協程
+        view.interaction = interaction
+        session_registry.open("blackjack", interaction.user.id, view)
         await interaction.response.send_message(embed=embed, view=view)
-        
-        # 等待遊戲結束或超時
-        await view.wait()
-        if not view.ended:
-            # 如果遊戲超時，退還下注金額
-            await currency.update_balance(interaction.user.id, bet, interaction.user.name)
-            
-            embed = discord.Embed(
-                title="Blackjack - 遊戲超時",
-                description="遊戲已取消，已退還下注金額。",
-                color=discord.Color.red()
-            )
-            for child in view.children:
-                child.disabled = True
-                
-            await interaction.edit_original_response(embed=embed, view=view)
 
 async def setup(bot):
     await bot.add_cog(BlackjackCog(bot))
\ No newline at end of file
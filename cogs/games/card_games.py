@@ -4,6 +4,11 @@ from discord import app_commands
 from discord.ui import Button, View
 import random
 import asyncio
+from utils.render import render_scheduler
+from utils.sessions import session_registry
+
+# 雙人小遊戲的存活時間 (秒)
+CARD_GAME_TTL = 60
 
 class HighCardButton(Button):
     """比大小按鈕"""
@@ -29,6 +34,9 @@ class HighCardButton(Button):
         self.number = random.randint(1, 13)
         self.disabled = True
         self.label = f"{self.user.display_name}: {self.number}點"
+
+        # 先回應互動，訊息編輯可能因頻道限速而延後，不能超過3秒期限
+        await interaction.response.defer()
         
         # 檢查是否雙方都已抽牌
         other_button = None
@@ -53,18 +61,18 @@ class HighCardButton(Button):
 
             embed.add_field(name=f"{self.user.display_name}", value=f"{self.number}點", inline=True)
             embed.add_field(name=f"{other_button.user.display_name}", value=f"{other_button.number}點", inline=True)
-            
-            await self.view.message.edit(embed=embed, view=self.view)
+
+            session_registry.close("highcard", self.view.message.id)
+            await render_scheduler.edit(self.view.message, embed=embed, view=self.view)
+            render_scheduler.forget(self.view.message.id)
             self.view.stop()
         else:
-            await interaction.message.edit(view=self.view)
-
-        await interaction.response.defer()
+            render_scheduler.submit(interaction.message, view=self.view)
 
 class HighCardView(View):
     """比大小視圖"""
     def __init__(self, user1: discord.Member, user2: discord.Member):
-        super().__init__(timeout=60)  # 60秒超時
+        super().__init__(timeout=None)  # 逾時由工作階段註冊表處理
         self.user1 = user1
         self.user2 = user2
         self.message = None
@@ -91,8 +99,9 @@ class HighCardView(View):
             
             for child in self.children:
                 child.disabled = True
-            
-            await self.message.edit(embed=embed, view=self)
+
+            await render_scheduler.edit(self.message, embed=embed, view=self)
+            render_scheduler.forget(self.message.id)
 
 class RPSButton(Button):
     """剪刀石頭布按鈕"""
@@ -107,7 +116,7 @@ class RPSButton(Button):
 class RPSView(View):
     """剪刀石頭布視圖"""
     def __init__(self, player1: discord.Member, player2: discord.Member):
-        super().__init__(timeout=60)
+        super().__init__(timeout=None)  # 逾時由工作階段註冊表處理
         self.player1 = player1
         self.player2 = player2
         self.choices = {}
@@ -157,7 +166,7 @@ class RPSView(View):
                     status.append(f"{player.mention} ⏳")
             embed.add_field(name="玩家狀態", value="\n".join(status))
 
-            await self.message.edit(embed=embed)
+            render_scheduler.submit(self.message, embed=embed)
 
             # 如果兩位玩家都已選擇，顯示結果
             if len(self.choices) == 2:
@@ -214,7 +223,9 @@ class RPSView(View):
         for item in self.children:
             item.disabled = True
 
-        await self.message.edit(embed=embed, view=self)
+        session_registry.close("rps", self.message.id)
+        await render_scheduler.edit(self.message, embed=embed, view=self)
+        render_scheduler.forget(self.message.id)
         self.stop()
 
     async def on_timeout(self):
@@ -248,7 +259,17 @@ class RPSView(View):
         for item in self.children:
             item.disabled = True
 
-        await self.message.edit(embed=embed, view=self)
+        await render_scheduler.edit(self.message, embed=embed, view=self)
+        render_scheduler.forget(self.message.id)
+
+async def expire_card_game(session, reason: str):
+    """遊戲逾時時停止視圖並顯示未完成的玩家"""
+    view = session.state
+    view.stop()
+    await view.on_timeout()
+
+session_registry.configure("highcard", ttl=CARD_GAME_TTL, capacity=500, on_expire=expire_card_game)
+session_registry.configure("rps", ttl=CARD_GAME_TTL, capacity=500, on_expire=expire_card_game)
 
 class CardGamesCog(commands.Cog):
     """卡牌遊戲指令"""
@@ -291,6 +312,7 @@ class CardGamesCog(commands.Cog):
         # 保存訊息引用以供更新
         original_message = await interaction.original_response()
         view.message = original_message
+        session_registry.open("highcard", original_message.id, view)
 
     @app_commands.command(name="paperblabla", description="開始一局剪刀石頭布")
     @app_commands.describe(opponent="要挑戰的對手")
@@ -324,6 +346,7 @@ class CardGamesCog(commands.Cog):
         # 發送遊戲訊息
         await interaction.response.send_message(embed=embed, view=view)
         view.message = await interaction.original_response()
+        session_registry.open("rps", view.message.id, view)
 
 async def setup(bot):
     await bot.add_cog(CardGamesCog(bot))
\ No newline at end of file
@@ -1,50 +1,124 @@
 import discord
 from discord.ext import commands, tasks
 from discord import app_commands
-import random
 import asyncio
 from models.currency import Currency
 from models.games import Horse, HorseRace
-from config import get_config_value
+from config import get_config_value, set_config_value
+from models.horse_odds import get_race_odds
+from utils.render import render_scheduler
 
 class HorseRaceCog(commands.Cog):
     """賽馬遊戲指令"""
 
     def __init__(self, bot):
         self.bot = bot
-        self.race_system = HorseRace(bot)
-        
-        # 從配置中獲取賽馬頻道
-        race_channel_id = get_config_value('race_channel')
-        if race_channel_id:
-            self.race_system.race_channel = bot.get_channel(race_channel_id)
-            
+        self.races = {}  # {(guild_id, channel_id): HorseRace}
+        self.race_tasks = set()
+        self.stagger_seconds = 30  # 各頻道比賽開始時間的間隔
+
         # 啟動賽馬排程
         self.race_schedule.start()
-        
+
     def cog_unload(self):
         """Cog 卸載時停止任務"""
         self.race_schedule.cancel()
-        
+        for task in self.race_tasks:
+            task.cancel()
+
+    def load_race_channels(self):
+        """從配置載入所有賽馬頻道"""
+        channel_ids = list(get_config_value('race_channels') or [])
+
+        # 相容舊的單一頻道設定
+        legacy_channel_id = get_config_value('race_channel')
+        if legacy_channel_id and legacy_channel_id not in channel_ids:
+            channel_ids.append(legacy_channel_id)
+
+        for channel_id in channel_ids:
+            channel = self.bot.get_channel(channel_id)
+            if channel:
+                self.add_race(channel)
+
+    def add_race(self, channel) -> HorseRace:
+        """為頻道建立比賽 (每個伺服器一個賽馬頻道，重設時取代舊頻道)"""
+        guild_id = channel.guild.id if channel.guild else 0
+
+        for key in [key for key in self.races if key[0] == guild_id and key[1] != channel.id]:
+            del self.races[key]
+
+        key = (guild_id, channel.id)
+        if key not in self.races:
+            race = HorseRace(self.bot)
+            race.race_channel = channel
+            self.races[key] = race
+
+        return self.races[key]
+
+    def get_race(self, guild_id: int, channel_id: int = None):
+        """取得頻道的比賽，找不到時使用該伺服器的賽馬頻道"""
+        race = self.races.get((guild_id, channel_id))
+        if race:
+            return race
+        return next((race for (race_guild_id, _), race in self.races.items() if race_guild_id == guild_id), None)
+
     @tasks.loop(minutes=60)
     async def race_schedule(self):
-        """每一小時舉行一場比賽"""
-        if self.race_system.race_channel:
-            await self.start_betting_phase()
-            
+        """每一小時在每個賽馬頻道各舉行一場比賽，開始時間互相錯開"""
+        races = list(self.races.values())
+        if not races:
+            return
+
+        spacing = min(self.stagger_seconds, 3000 / len(races))
+        for index, race in enumerate(races):
+            task = asyncio.create_task(self.run_race(race, index * spacing))
+            self.race_tasks.add(task)
+            task.add_done_callback(self.race_tasks.discard)
+
     @race_schedule.before_loop
     async def before_race_schedule(self):
         """等待機器人準備好後再開始任務"""
         await self.bot.wait_until_ready()
-        
-    async def start_betting_phase(self):
+        self.load_race_channels()
+
+    async def run_race(self, race: HorseRace, delay: float = 0):
+        """延遲後舉行一場比賽，各場比賽互不阻塞"""
+        await asyncio.sleep(delay)
+
+        try:
+            await self.start_betting_phase(race)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"舉行賽馬比賽時發生錯誤: {e}")
+
+            # 結算可能已經開始，等它完成後再決定是否退款
+            if race.settlement:
+                try:
+                    await race.settlement
+                except Exception as settle_error:
+                    print(f"結算賽馬比賽時發生錯誤: {settle_error}")
+
+            # 獎金尚未發放時才退還所有下注
+            if not race.settled:
+                refunds = {user_id: sum(bets.values()) for user_id, bets in race.bets.items()}
+                await Currency(self.bot).apply_balance_changes(refunds, "賽馬比賽中斷退款")
+
+            race.settlement = None
+            race.is_race_active = False
+            race.betting_open = False
+            race.bets = {}
+
+    async def start_betting_phase(self, race: HorseRace):
         """開始下注階段"""
-        if self.race_system.is_race_active:
+        if race.is_race_active:
             return
 
-        self.race_system.is_race_active = True
-        self.race_system.betting_open = True
-        self.race_system.bets = {}
+        race.is_race_active = True
+        race.betting_open = True
+        race.bets = {}
+        race.settlement = None
+        race.settled = False
 
         embed = discord.Embed(
             title="🏇 賽馬比賽即將開始！",
@@ -52,90 +126,60 @@ class HorseRaceCog(commands.Cog):
             color=discord.Color.green()
         )
 
-        # 顯示所有馬匹資訊
+        # 顯示所有馬匹資訊與模擬勝率
+        odds = await get_race_odds(race)
         horses_info = ""
-        for horse in self.race_system.horses:
-            horses_info += f"#{horse.number} {horse.emoji} {horse.name}\n"
+        for i, horse in enumerate(race.horses):
+            horses_info += (
+                f"#{horse.number} {horse.emoji} {horse.name} — "
+                f"勝率 {odds.win[i]:.0%} | 前二名 {odds.place[i]:.0%} | 公平賠率 {odds.display_odds(i):g}x\n"
+            )
         embed.add_field(name="參賽馬匹", value=horses_info)
+        embed.set_footer(text=f"勝率由 {odds.samples:,} 場模擬比賽估計，實際獎金依獎池分配")
+
+        await race.race_channel.send(embed=embed)
 
-        await self.race_system.race_channel.send(embed=embed)
-        
         # 等待4分鐘後發送提醒
         await asyncio.sleep(240)
-        if self.race_system.betting_open:
-            await self.race_system.race_channel.send("⚠️ 距離比賽開始還有1分鐘！請盡快下注！")
-        
+        if race.betting_open:
+            await race.race_channel.send("⚠️ 距離比賽開始還有1分鐘！請盡快下注！")
+
         # 再等待1分鐘後開始比賽
         await asyncio.sleep(60)
-        self.race_system.betting_open = False
-        await self.start_race()
+        race.betting_open = False
+        await self.start_race(race)
 
-    async def start_race(self):
+    async def start_race(self, race: HorseRace):
         """開始賽馬比賽"""
         embed = discord.Embed(
             title="🏁 賽馬比賽開始！",
             description="比賽開始！讓我們看看誰會是最後的贏家！",
             color=discord.Color.gold()
         )
-        race_msg = await self.race_system.race_channel.send(embed=embed)
+        race_msg = await race.race_channel.send(embed=embed)
 
-        # 重置所有馬匹位置
-        for horse in self.race_system.horses:
-            horse.position = 0
-            horse.finished = False
-            horse.special_event = None
+        # 整場比賽預先模擬完成，結算與畫面播放同時進行
+        frames, finished_horses = race.simulate_race()
+        race.settlement = asyncio.create_task(self.settle_race(race, finished_horses))
 
-        finished_horses = []
-        race_ongoing = True
-        
-        while race_ongoing:
-            # 更新每匹馬的位置
-            race_ongoing = False
-            for horse in self.race_system.horses:
-                if not horse.finished:
-                    race_ongoing = True
-                    # 隨機移動1-3格
-                    move = random.randint(1, 3)
-                    
-                    # 10%機率觸發特殊事件
-                    if random.random() < 0.1 and not horse.special_event:
-                        event = random.choice(self.race_system.special_events)
-                        horse.special_event = event
-                        if "向前" in event or "提升" in event or "大增" in event:
-                            move += random.randint(2, 3)
-                        elif "後退" in event or "滑倒" in event or "停下" in event or "繞路" in event:
-                            move = -random.randint(1, 2)
-                            
-                    horse.position = max(0, min(self.race_system.track_length, horse.position + move))
-                    
-                    # 檢查是否到達終點
-                    if horse.position >= self.race_system.track_length and not horse.finished:
-                        horse.finished = True
-                        finished_horses.append(horse)
-
-            # 更新賽道顯示
-            track_display = ""
-            for horse in self.race_system.horses:
-                # 建立賽道
-                track = "." * self.race_system.track_length
-                if horse.position < self.race_system.track_length:
-                    track = track[:horse.position] + horse.emoji + track[horse.position + 1:]
-                else:
-                    track = track[:self.race_system.track_length - 1] + horse.emoji
-                
-                # 添加特殊事件顯示
-                event_display = f" 👉 {horse.special_event}" if horse.special_event else ""
-                track_display += f"#{horse.number} {track}{event_display}\n"
-
-            embed.description = f"```\n{track_display}\n```"
-            await race_msg.edit(embed=embed)
+        for frame in frames:
+            embed.description = f"```\n{frame}\n```"
+            render_scheduler.submit(race_msg, embed=embed)
             await asyncio.sleep(1.5)  # 延遲1.5秒更新一次
 
+        # 確保最後的賽道畫面已送出
+        await render_scheduler.edit(race_msg, embed=embed)
+        render_scheduler.forget(race_msg.id)
+
         # 比賽結束，公布結果
-        await self.end_race(finished_horses)
+        result_embed = await race.settlement
+        race.settlement = None
+        await race.race_channel.send(embed=result_embed)
+        race.is_race_active = False
+        race.bets = {}
 
-    async def end_race(self, finished_horses):
-        """結束比賽並結算獎金"""
+    async def settle_race(self, race: HorseRace, finished_horses):
+        """計算比賽結果並發放獎金，返回結果訊息"""
         result_embed = discord.Embed(
             title="🏆 賽馬比賽結束！",
             color=discord.Color.gold()
@@ -160,7 +204,7 @@ class HorseRaceCog(commands.Cog):
         total_pool = 0
         winning_pool = 0
         
-        for user_id, bets in self.race_system.bets.items():
+        for user_id, bets in race.bets.items():
             for horse_num, amount in bets.items():
                 total_pool += amount
                 if horse_num == winning_horse.number:
@@ -170,27 +214,32 @@ class HorseRaceCog(commands.Cog):
             # 計算賠率
             odds = (total_pool * 0.9) / winning_pool  # 抽取10%作為手續費
 
-            # 發放獎金
+            # 計算獎金
             winners_text = ""
-            for user_id, bets in self.race_system.bets.items():
+            payouts = {}
+            usernames = {}
+            for user_id, bets in race.bets.items():
                 if winning_horse.number in bets:
                     user = self.bot.get_user(user_id)
                     bet_amount = bets[winning_horse.number]
                     winnings = int(bet_amount * odds)
-                    
-                    # 更新玩家金幣
-                    currency = Currency(self.bot)
-                    await currency.update_balance(user_id, winnings, user.name if user else str(user_id))
-                    
+
+                    payouts[user_id] = winnings
+                    usernames[user_id] = user.name if user else str(user_id)
                     winners_text += f"{user.mention if user else user_id} 贏得了 {winnings:,} Silva幣！\n"
 
+            # 一次發放所有獎金，失敗時由 run_race 退還下注
+            currency = Currency(self.bot)
+            if not await currency.apply_balance_changes(payouts, f"賽馬獎金: #{winning_horse.number} {winning_horse.name}", usernames):
+                raise RuntimeError("發放賽馬獎金失敗")
+
             if winners_text:
-                result_embed.add_field(name="🎉 獲獎者", value=winners_text, inline=False)
+                result_embed.add_field(name="🎉 獲獎者", value=winners_text[:1024], inline=False)
             result_embed.add_field(name="賠率", value=f"{odds:.2f}x", inline=False)
 
-        await self.race_system.race_channel.send(embed=result_embed)
-        self.race_system.is_race_active = False
-        self.race_system.bets = {}
+        # 沒有人押中時獎池歸莊家，同樣視為已結算
+        race.settled = True
+        return result_embed
         
     @app_commands.command(name="horserace", description="在賽馬比賽中下注")
     @app_commands.describe(
@@ -209,11 +258,13 @@ class HorseRaceCog(commands.Cog):
             horse_number: 馬匹號碼
             amount: 下注金額
         """
-        if not self.race_system.betting_open:
+        race = self.get_race(interaction.guild_id, interaction.channel_id)
+
+        if not race or not race.betting_open:
             await interaction.response.send_message("❌ 目前不是下注時間！", ephemeral=True)
             return
 
-        if horse_number < 1 or horse_number > 5:
+        if horse_number < 1 or horse_number > len(race.horses):
             await interaction.response.send_message("❌ 請輸入有效的馬匹號碼(1-5)！", ephemeral=True)
             return
 
@@ -236,8 +287,8 @@ class HorseRaceCog(commands.Cog):
         await currency.update_balance(interaction.user.id, -amount, interaction.user.name)
         
         # 記錄下注
-        if self.race_system.place_bet(interaction.user.id, horse_number, amount):
-            horse = next(h for h in self.race_system.horses if h.number == horse_number)
+        if race.place_bet(interaction.user.id, horse_number, amount):
+            horse = next(h for h in race.horses if h.number == horse_number)
             await interaction.response.send_message(
                 f"✅ 成功在 {horse.emoji} #{horse_number} {horse.name} 下注 {amount:,} Silva幣！",
                 ephemeral=False
@@ -262,12 +313,12 @@ class HorseRaceCog(commands.Cog):
         # 如果沒有提供頻道，使用當前頻道
         target_channel = channel or interaction.channel
         
+        # 建立該頻道的比賽 (取代本伺服器原本的賽馬頻道)
+        self.add_race(target_channel)
+
         # 更新配置
-        from config import set_config_value
-        set_config_value('race_channel', target_channel.id)
-        
-        # 更新賽馬系統的頻道
-        self.race_system.race_channel = target_channel
+        set_config_value('race_channels', [channel_id for _, channel_id in self.races])
+        set_config_value('race_channel', None)
         
         await interaction.response.send_message(
             f"✅ 已將賽馬比賽頻道設定為 {target_channel.mention}",
@@ -6,6 +6,7 @@ import random
 import asyncio
 import datetime
 from models.currency import Currency
+from utils.sessions import session_registry
 
 class RussianRouletteButton(Button):
     """俄羅斯輪盤按鈕"""
@@ -16,14 +17,18 @@ class RussianRouletteButton(Button):
             custom_id=str(position)
         )
         
+# 開局後需在此秒數內選擇位置，否則退還下注
+RUSSIAN_TTL = 30
+
 class RussianRouletteView(discord.ui.View):
-    """俄羅斯輪盤視圖"""
-    def __init__(self, death_positions: list, bet_amount: int, user_id: int):
-        super().__init__(timeout=30)
+    """俄羅斯輪盤視圖 (逾時由工作階段註冊表處理)"""
+    def __init__(self, death_positions: list, bet_amount: int, user_id: int, user_name: str):
+        super().__init__(timeout=None)
         self.death_positions = death_positions
         self.bet_amount = bet_amount
         self.user_id = user_id
-        self.ended = False
+        self.user_name = user_name
+        self.interaction = None
         
     @discord.ui.button(label="1", style=discord.ButtonStyle.gray)
     async def button_1(self, interaction: discord.Interaction, button: discord.ui.Button):
@@ -55,7 +60,12 @@ class RussianRouletteView(discord.ui.View):
             await interaction.response.send_message("這不是你的遊戲!", ephemeral=True)
             return
 
-        self.ended = True
+        # 關閉工作階段，已逾時退款的遊戲不能再開槍
+        if not session_registry.close("russian", self.user_id):
+            await interaction.response.send_message("這局遊戲已經結束了!", ephemeral=True)
+            return
+
+        self.stop()
         currency = Currency(interaction.client)
 
         if position in self.death_positions:
@@ -96,6 +106,25 @@ class RussianRouletteView(discord.ui.View):
         
         await interaction.response.edit_message(embed=embed, view=self)
 
+async def expire_russian(session, reason: str):
+    """遊戲逾時或被取代時退還下注並停用按鈕"""
+    view = session.state
+    view.stop()
+
+    currency = Currency(view.interaction.client)
+    await currency.update_balance(view.user_id, view.bet_amount, view.user_name)
+
+    embed = discord.Embed(
+        title="🎲 俄羅斯輪盤 - 遊戲超時",
+        description="遊戲已取消，已退還下注金額。",
+        color=discord.Color.red()
+    )
+    for child in view.children:
+        child.disabled = True
+    await view.interaction.edit_original_response(embed=embed, view=view)
+
+session_registry.configure("russian", ttl=RUSSIAN_TTL, capacity=1000, on_expire=expire_russian)
+
 class RussianCog(commands.Cog):
     """俄羅斯輪盤遊戲指令"""
 
@@ -123,6 +152,10 @@ class RussianCog(commands.Cog):
         if bet <= 0:
             await interaction.response.send_message("❌ 下注金額必須大於0！", ephemeral=True)
             return
+
+        if session_registry.get("russian", interaction.user.id):
+            await interaction.response.send_message("❌ 你已經有一局進行中的俄羅斯輪盤了！", ephemeral=True)
+            return
         
         # 檢查玩家餘額
         currency = Currency(self.bot)
@@ -160,23 +193,10 @@ class RussianCog(commands.Cog):
             color=discord.Color.red()
         )
         
-        view = RussianRouletteView(positions, bet, interaction.user.id)
+        view = RussianRouletteView(positions, bet, interaction.user.id, interaction.user.name)
+        view.interaction = interaction
+        session_registry.open("russian", interaction.user.id, view)
         await interaction.response.send_message(embed=embed, view=view)
-        
-        # 等待遊戲結束或超時
-        await view.wait()
-        if not view.ended:
-            # 如果遊戲超時，退還下注金額
-            await currency.update_balance(interaction.user.id, bet, interaction.user.name)
-            
-            embed = discord.Embed(
-                title="🎲 俄羅斯輪盤 - 遊戲超時",
-                description="遊戲已取消，已退還下注金額。",
-                color=discord.Color.red()
-            )
-            for child in view.children:
-                child.disabled = True
-            await interaction.edit_original_response(embed=embed, view=view)
 
 async def setup(bot):
     await bot.add_cog(RussianCog(bot))
\ No newline at end of file
@@ -1,64 +1,111 @@
-import datetime
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
 from discord import app_commands
-from discord.ui import Button, View
-import asyncio
-
-class VoteButton(Button):
-    """投票按鈕"""
-    def __init__(self, option: str, vote_data: dict):
-        super().__init__(
-            label=f"{option} (0)",
+from discord.ui import Button
+from models.polls import PollStore
+from utils.render import render_scheduler
+from utils.components import component_router, static_view
+
+def build_vote_view(poll_id: int, options: list, counts: list):
+    """依票數建立投票按鈕 (custom_id 為 vote:投票ID:選項編號，不同投票不會互相衝突)"""
+    return static_view(*(
+        Button(
+            label=f"{option} ({count})",
             style=discord.ButtonStyle.primary,
-            custom_id=f"vote_{option}"
+            custom_id=component_router.custom_id("vote", poll_id, index)
         )
-        self.option = option
-        self.vote_data = vote_data
-        self.vote_data[option] = set()  # 使用集合來儲存投票者的ID
-
-    async def callback(self, interaction: discord.Interaction):
-        """按鈕回調函數"""
-        user_id = interaction.user.id
-
-        # 檢查用戶是否已經在其他選項投票
-        for opt, voters in self.vote_data.items():
-            if user_id in voters and opt != self.option:
-                voters.remove(user_id)
-                # 更新其他按鈕的顯示
-                for child in self.view.children:
-                    if child.custom_id == f"vote_{opt}":
-                        child.label = f"{opt} ({len(voters)})"
-
-        # 處理當前選項的投票
-        if user_id in self.vote_data[self.option]:
-            self.vote_data[self.option].remove(user_id)
-            await interaction.response.send_message(f"你取消了對 {self.option} 的投票", ephemeral=True)
-        else:
-            self.vote_data[self.option].add(user_id)
-            await interaction.response.send_message(f"你投票給了 {self.option}", ephemeral=True)
-
-        # 更新按鈕顯示
-        self.label = f"{self.option} ({len(self.vote_data[self.option])})"
-        await interaction.message.edit(view=self.view)
-
-class VoteView(View):
-    """投票視圖"""
-    def __init__(self, options: list):
-        super().__init__(timeout=None)
-        self.vote_data = {}
-        
-        # 創建每個選項的按鈕
-        for option in options:
-            button = VoteButton(option, self.vote_data)
-            self.add_item(button)
+        for index, (option, count) in enumerate(zip(options, counts))
+    ))
 
 class VotingCog(commands.Cog):
     """投票系統指令"""
 
     def __init__(self, bot):
         self.bot = bot
-        self.active_votes = {}  # 儲存活動中的投票
+        self.polls = PollStore(bot)
+
+    async def cog_load(self):
+        """初始化資料庫並註冊投票按鈕的處理函數"""
+        await self.polls.setup_database()
+        component_router.register("vote", self.handle_vote)
+        self.close_expired_polls.start()
+
+    async def cog_unload(self):
+        """Cog 卸載時停止任務"""
+        component_router.unregister("vote")
+        self.close_expired_polls.cancel()
+
+    async def handle_vote(self, interaction: discord.Interaction, entity_id: str, option: str):
+        """投票按鈕：從資料庫讀寫票數，不需要保存任何視圖"""
+        poll = await self.polls.get_poll(int(entity_id))
+        option_index = int(option)
+
+        if not poll or poll['closed'] or not 0 <= option_index < len(poll['options']):
+            await interaction.response.send_message("這個投票已經結束了！", ephemeral=True)
+            return
+
+        option_name = poll['options'][option_index]
+        action, counts = await self.polls.cast_vote(
+            poll['poll_id'], interaction.user.id, option_index, len(poll['options'])
+        )
+
+        if action is None:
+            await interaction.response.send_message("投票失敗！請稍後再試", ephemeral=True)
+            return
+
+        if action == 'removed':
+            await interaction.response.send_message(f"你取消了對 {option_name} 的投票", ephemeral=True)
+        else:
+            await interaction.response.send_message(f"你投票給了 {option_name}", ephemeral=True)
+
+        # 按鈕標籤直接使用交易中更新後的票數 (短時間內的多次點擊會合併成一次編輯)
+        render_scheduler.submit(interaction.message, view=build_vote_view(poll['poll_id'], poll['options'], counts))
+
+    @tasks.loop(seconds=30)
+    async def close_expired_polls(self):
+        """結算已到期的投票"""
+        for poll in await self.polls.get_expired_polls():
+            try:
+                await self.end_vote(poll)
+            except Exception as e:
+                print(f"結束投票時發生錯誤: {e}")
+
+    @close_expired_polls.before_loop
+    async def before_close_expired_polls(self):
+        """等待機器人準備好後再開始任務"""
+        await self.bot.wait_until_ready()
+
+    async def end_vote(self, poll: dict):
+        """公布投票結果並移除按鈕"""
+        if not await self.polls.close_poll(poll['poll_id']):
+            return
+
+        channel = self.bot.get_channel(poll['channel_id'])
+        if not channel or not poll['message_id']:
+            return
+
+        # 計算結果
+        counts = await self.polls.get_counts(poll['poll_id'], len(poll['options']))
+        results = sorted(zip(poll['options'], counts), key=lambda x: x[1], reverse=True)
+
+        # 創建結果嵌入訊息
+        result_embed = discord.Embed(
+            title=f"📊 投票結果：{poll['title']}",
+            description="投票已結束！",
+            color=discord.Color.green()
+        )
+
+        for option, count in results:
+            result_embed.add_field(
+                name=option,
+                value=f"票數：{count}",
+                inline=False
+            )
+
+        # 互動的 token 只有15分鐘，結算時改用機器人身分編輯訊息
+        message = channel.get_partial_message(poll['message_id'])
+        await render_scheduler.edit(message, embed=result_embed, view=None)
+        render_scheduler.forget(poll['message_id'])
 
     @app_commands.command(name="vote", description="創建一個投票")
     @app_commands.describe(
@@ -83,7 +130,7 @@ class VotingCog(commands.Cog):
         try:
             # 分割選項
             option_list = [opt.strip() for opt in options.split('/')]
-            
+
             # 檢查選項數量
             if len(option_list) < 2:
                 await interaction.response.send_message("至少需要2個選項！", ephemeral=True)
@@ -92,9 +139,17 @@ class VotingCog(commands.Cog):
                 await interaction.response.send_message("最多只能有5個選項！", ephemeral=True)
                 return
 
-            # 創建投票視圖
-            view = VoteView(option_list)
-            
+            # 先建立投票紀錄，按鈕的 custom_id 需要投票ID
+            poll_id = await self.polls.create_poll(
+                interaction.guild_id, interaction.channel_id, interaction.user.id,
+                title, option_list, duration
+            )
+            if not poll_id:
+                await interaction.response.send_message("創建投票失敗！請稍後再試", ephemeral=True)
+                return
+
+            view = build_vote_view(poll_id, option_list, [0] * len(option_list))
+
             # 創建投票訊息
             embed = discord.Embed(
                 title=f"📊 {title}",
@@ -104,24 +159,11 @@ class VotingCog(commands.Cog):
             embed.add_field(name="創建者", value=interaction.user.mention)
             if duration:
                 embed.add_field(name="結束時間", value=f"{duration}分鐘後")
-                
+
             # 發送投票訊息
             await interaction.response.send_message(embed=embed, view=view)
-
-            # 如果設置了持續時間，設定定時器來結束投票
-            if duration:
-                original_message = await interaction.original_response()
-                
-                # 保存活動投票
-                self.active_votes[original_message.id] = {
-                    "view": view,
-                    "title": title,
-                    "options": option_list,
-                    "end_time": discord.utils.utcnow() + datetime.timedelta(minutes=duration)
-                }
-                
-                # 啟動結束投票任務
-                self.bot.loop.create_task(self.end_vote_after_duration(original_message.id, duration))
+            original_message = await interaction.original_response()
+            await self.polls.set_message(poll_id, original_message.id)
 
         except Exception as e:
             await interaction.response.send_message(
@@ -129,69 +171,5 @@ class VotingCog(commands.Cog):
                 ephemeral=True
             )
 
-    async def end_vote_after_duration(self, message_id, duration):
-        """結束投票任務"""
-        await asyncio.sleep(duration * 60)  # 轉換為秒
-        
-        if message_id not in self.active_votes:
-            return
-            
-        vote_data = self.active_votes[message_id]
-        view = vote_data["view"]
-        title = vote_data["title"]
-        option_list = vote_data["options"]
-        
-        try:
-            # 嘗試取得訊息
-            channel_id = None
-            message = None
-            
-            for ch in self.bot.get_all_channels():
-                try:
-                    message = await ch.fetch_message(message_id)
-                    if message:
-                        channel_id = ch.id
-                        break
-                except:
-                    pass
-                    
-            if not message:
-                del self.active_votes[message_id]
-                return
-                
-            # 計算結果
-            results = []
-            for option in option_list:
-                vote_count = len(view.vote_data.get(option, set()))
-                results.append((option, vote_count))
-            
-            # 排序結果
-            results.sort(key=lambda x: x[1], reverse=True)
-            
-            # 創建結果嵌入訊息
-            result_embed = discord.Embed(
-                title=f"📊 投票結果：{title}",
-                description="投票已結束！",
-                color=discord.Color.green()
-            )
-            
-            for option, count in results:
-                result_embed.add_field(
-                    name=option,
-                    value=f"票數：{count}",
-                    inline=False
-                )
-                
-            await message.edit(embed=result_embed, view=None)
-            del self.active_votes[message_id]
-            
-        except Exception as e:
-            print(f"結束投票時發生錯誤: {e}")
-            
-            try:
-                del self.active_votes[message_id]
-            except:
-                pass
-
 async def setup(bot):
-    await bot.add_cog(VotingCog(bot))
\ No newline at end of file
+    await bot.add_cog(VotingCog(bot))
@@ -2,6 +2,7 @@ import discord
 from discord.ext import commands
 from discord import app_commands
 import datetime
+from utils.sessions import session_registry
 
 # 定義時間選項的列舉
 time_choices = [
@@ -89,6 +90,34 @@ class ModerationCog(commands.Cog):
         except Exception as e:
             await interaction.response.send_message(f"解除禁言失敗！錯誤訊息: {str(e)}", ephemeral=True)
 
+    @app_commands.command(name="session_stats", description="查看進行中的遊戲與投票數量 (管理員專用)")
+    @app_commands.default_permissions(administrator=True)
+    async def session_stats(self, interaction: discord.Interaction):
+        """查看各類互動工作階段的統計"""
+        if not interaction.user.guild_permissions.administrator:
+            await interaction.response.send_message("你沒有權限使用此指令！", ephemeral=True)
+            return
+
+        embed = discord.Embed(
+            title="🧹 互動工作階段",
+            color=discord.Color.blue()
+        )
+
+        for kind, stats in session_registry.stats().items():
+            embed.add_field(
+                name=kind,
+                value=f"進行中: {stats['live']} / {stats['capacity']}\n"
+                      f"存活時間: {stats['ttl']:.0f} 秒\n"
+                      f"開啟 / 完成: {stats['opened']} / {stats['closed']}\n"
+                      f"逾時 / 淘汰: {stats['expired']} / {stats['evicted']}",
+                inline=True
+            )
+
+        if not embed.fields:
+            embed.description = "目前沒有任何工作階段"
+
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
     # 這裡可以添加其他管理類指令，如清除訊息、踢出用戶等
 
 async def setup(bot):
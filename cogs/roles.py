@@ -1,80 +1,53 @@
 import discord
 from discord.ext import commands
 from discord import app_commands
-from discord.ui import Button, View
-import json
-import os
+from discord.ui import Button
+from models.role_panels import role_panel_store
+from utils.components import component_router, static_view
 
-class RoleButton(Button):
-    """身分組按鈕"""
-    def __init__(self, role_id: int, role_name: str):
-        super().__init__(
+def build_role_view(panel_id: int, roles) -> discord.ui.View:
+    """建立身分組按鈕 (custom_id 為 role:面板ID:身分組ID，由元件路由處理點擊)"""
+    return static_view(*(
+        Button(
             label=role_name,
             style=discord.ButtonStyle.primary,
-            custom_id=f"role_{role_id}"  # 確保 custom_id 是唯一的
+            custom_id=component_router.custom_id("role", panel_id, role_id)
         )
-        self.role_id = role_id
+        for role_id, role_name in roles
+    ))
 
-    async def callback(self, interaction: discord.Interaction):
-        """按鈕回調函數"""
-        user = interaction.user
-        role = interaction.guild.get_role(self.role_id)
-        
-        if role is None:
-            await interaction.response.send_message("找不到該身分組!", ephemeral=True)
-            return
-            
-        if role in user.roles:
-            await user.remove_roles(role)
-            await interaction.response.send_message(f"已移除 {role.name} 身分組", ephemeral=True)
-        else:
-            await user.add_roles(role)
-            await interaction.response.send_message(f"已新增 {role.name} 身分組", ephemeral=True)
+async def handle_role_button(interaction: discord.Interaction, entity_id: str, option: str):
+    """身分組按鈕：切換使用者的身分組"""
+    user = interaction.user
+    role_id = int(option)
+    role = interaction.guild.get_role(role_id) if interaction.guild else None
+
+    # 只允許切換面板上設定過的身分組
+    if role is None or not role_panel_store.allows(interaction.guild_id, role_id):
+        await interaction.response.send_message("找不到該身分組!", ephemeral=True)
+        return
 
-class RoleButtonView(View):
-    """身分組按鈕視圖"""
-    def __init__(self, roles):
-        super().__init__(timeout=None)  # 設置 timeout=None 使按鈕持久化
-        self.roles = roles  # 保存角色信息
-        for role_id, role_name in roles:
-            button = RoleButton(role_id, role_name)
-            self.add_item(button)
+    if role in user.roles:
+        await user.remove_roles(role)
+        await interaction.response.send_message(f"已移除 {role.name} 身分組", ephemeral=True)
+    else:
+        await user.add_roles(role)
+        await interaction.response.send_message(f"已新增 {role.name} 身分組", ephemeral=True)
 
 class RolesCog(commands.Cog):
     """身分組管理指令"""
 
     def __init__(self, bot):
         self.bot = bot
-        self.persistent_views = {}  # 存儲所有持久化視圖的字典
-        self.bot.loop.create_task(self.load_persistent_views())
 
-    async def load_persistent_views(self):
-        """載入持久化按鈕視圖"""
-        await self.bot.wait_until_ready()
-        
-        try:
-            for guild in self.bot.guilds:
-                try:
-                    # 讀取該伺服器的持久化按鈕配置
-                    file_path = f'role_buttons_{guild.id}.json'
-                    if not os.path.exists(file_path):
-                        continue
-                        
-                    with open(file_path, 'r', encoding='utf8') as f:
-                        role_data = json.load(f)
-                        
-                    for channel_id, roles in role_data.items():
-                        view = RoleButtonView(roles)
-                        self.persistent_views[int(channel_id)] = view
-                        self.bot.add_view(view)
-                        
-                    print(f"已載入伺服器 {guild.name} 的角色按鈕")
-                except FileNotFoundError:
-                    continue  # 如果檔案不存在，跳過該伺服器
-                except Exception as e:
-                    print(f"加載伺服器 {guild.id} 的持久化按鈕時出錯: {e}")
-        except Exception as e:
-            print(f"載入持久化視圖時發生錯誤: {e}")
+    async def cog_load(self):
+        """註冊身分組按鈕的處理函數 (舊訊息的 role_<id> 按鈕也能使用)"""
+        component_router.register("role", handle_role_button)
+        component_router.register_legacy("role_", "role")
+
+    async def cog_unload(self):
+        """Cog 卸載時移除處理函數"""
+        component_router.unregister("role")
 
     @app_commands.command(name="role", description="設置角色選擇按鈕")
     @app_commands.default_permissions(administrator=True)
@@ -97,34 +70,19 @@ class RolesCog(commands.Cog):
                 name, role_id = role_input.split(':')
                 role_pairs.append((int(role_id), name))
 
-            # 創建視圖
-            view = RoleButtonView(role_pairs)
-            
-            # 發送消息並保存視圖
+            # 先保存面板設定，按鈕的 custom_id 需要面板ID
+            panel_id = await role_panel_store.create_panel(interaction.guild_id, interaction.channel_id, role_pairs)
+            if not panel_id:
+                await interaction.response.send_message("設置失敗! 無法保存身分組設定", ephemeral=True)
+                return
+
+            # 創建按鈕並發送消息
+            view = build_role_view(panel_id, role_pairs)
             await interaction.response.send_message("請點擊下方按鈕來選擇身分組：", view=view)
-            
-            # 獲取發送的消息
+
+            # 記錄發送的消息
             message = await interaction.original_response()
-            
-            # 保存該頻道的角色按鈕配置
-            file_path = f'role_buttons_{interaction.guild_id}.json'
-            try:
-                if os.path.exists(file_path):
-                    with open(file_path, 'r', encoding='utf8') as f:
-                        role_data = json.load(f)
-                else:
-                    role_data = {}
-            except:
-                role_data = {}
-                
-            role_data[str(message.channel.id)] = role_pairs
-            
-            with open(file_path, 'w', encoding='utf8') as f:
-                json.dump(role_data, f, ensure_ascii=False, indent=4)
-                
-            # 將視圖添加到持久化存儲中
-            self.persistent_views[message.channel.id] = view
-            self.bot.add_view(view)
+            await role_panel_store.set_message(panel_id, message.id)
             
         except Exception as e:
             await interaction.response.send_message(
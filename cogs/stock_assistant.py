@@ -6,11 +6,67 @@ import asyncio
 import datetime
 from models.currency import Currency
 from models.stocks import Stock
+from models.stock_registry import stock_registry, normalize_stock_code
+from models.assistant_triggers import ThresholdTriggerIndex
+from models.decision_cache import DecisionCache
+from models.assistant_optimizer import optimize_assistant_settings, shutdown_executor
 from utils.database import get_db_connection, execute_query, table_exists
 
+# 各稀有度可監控的股票數量
+MAX_STOCKS = {
+    'N': 1,
+    'R': 3,
+    'SR': 5,
+    'SSR': 100  # 實際上不限制
+}
+
+# Discord 嵌入訊息每則最多25個欄位、總長度6000字，保留一些空間給標題與頁尾
+EMBED_MAX_FIELDS = 25
+EMBED_CHAR_BUDGET = 5500
+
+class AssistantConfig:
+    """活躍助理的設定快照 (監控股票與合併後的設定)"""
+    __slots__ = (
+        'assistant_id', 'user_id', 'assistant_name', 'rarity',
+        'stocks', 'global_settings', 'stock_settings', 'settings_version'
+    )
+
+    def __init__(self, assistant_id, user_id, assistant_name, rarity, settings_version=0):
+        self.assistant_id = assistant_id
+        self.user_id = user_id
+        self.assistant_name = assistant_name
+        self.rarity = rarity
+        self.stocks = []
+        self.global_settings = {}
+        self.stock_settings = {}  # stock_code -> 合併後的設定
+        self.settings_version = settings_version
+
+    def settings_for(self, stock_code: str) -> dict:
+        """獲取特定股票的設定，沒有個別設定時使用全域設定"""
+        return self.stock_settings.get(stock_code, self.global_settings)
+
+    @property
+    def monitored_stocks(self) -> list:
+        """依稀有度限制後的監控股票"""
+        return self.stocks[:MAX_STOCKS.get(self.rarity, 0)]
+
 class TradingAssistantSystem:
     """交易助理系統模型"""
-    
+
+    # 所有實例共用的活躍助理設定快取，設定變更時失效
+    _config_cache = None
+    _config_generation = 0
+    _settings_versions = {}
+
+    # 由股價穿越門檻觸發，不在每小時循環中評估的稀有度
+    EVENT_DRIVEN_RARITIES = ('N',)
+
+    # 股價與設定都沒變時略過重新計算的稀有度
+    MEMOIZED_RARITIES = ('SR', 'SSR')
+    decision_cache = DecisionCache(maxsize=2048)
+    # 正在執行策略的決策鍵，避免價格觸發與定時迴圈同時對相同輸入下單
+    _pending_decisions = set()
+
     def __init__(self, bot):
         self.bot = bot
         self.db_name = "trading_assistants"
@@ -70,16 +126,26 @@ class TradingAssistantSystem:
             FOREIGN KEY (assistant_id) REFERENCES assistants(assistant_id)
         )
         ''')
-        
+
+        # 批次載入設定用的索引
+        await cursor.execute('CREATE INDEX IF NOT EXISTS idx_assistants_active ON assistants(active)')
+        await cursor.execute('CREATE INDEX IF NOT EXISTS idx_assistant_settings_assistant_stock ON assistant_settings(assistant_id, stock_code)')
+        await cursor.execute('CREATE INDEX IF NOT EXISTS idx_assistant_stocks_assistant ON assistant_stocks(assistant_id)')
+
         await conn.commit()
     
     async def clean_stock_code(self, stock_code: str) -> str:
         """清理股票代碼，移除或轉義可能導致SQL錯誤的特殊字符"""
+        return self.clean_stock_code_sync(stock_code)
+
+    @staticmethod
+    def clean_stock_code_sync(stock_code: str) -> str:
+        """clean_stock_code 的同步版本，結果經過快取，可在迴圈中直接使用"""
         if not stock_code:
             return "global"
             
         # 移除或替換可能導致SQL問題的字符
-        cleaned_code = stock_code.replace("#", "").replace("'", "").replace('"', "")
+        cleaned_code = normalize_stock_code(stock_code)
         
         # 確保代碼不為空
         if not cleaned_code:
@@ -261,7 +327,8 @@ class TradingAssistantSystem:
         '''
         
         await execute_query(self.db_name, query, (new_status, assistant_id))
-        
+        self.invalidate_assistant_configs(assistant_id)
+
         return True
     
     async def update_assistant_settings(self, assistant_id: int, user_id: int, settings: dict, stock_code: str = 'global') -> bool:
@@ -301,7 +368,8 @@ class TradingAssistantSystem:
             '''
             
             await execute_query(self.db_name, query, (assistant_id, clean_code, key, value))
-        
+
+        self.invalidate_assistant_configs(assistant_id)
         return True
     
     async def get_assistant_settings(self, assistant_id: int, stock_code: str = None):
@@ -355,14 +423,7 @@ class TradingAssistantSystem:
         rarity = result[0]
         
         # 檢查股票數量是否超過限制
-        max_stocks = {
-            'N': 1,
-            'R': 3,
-            'SR': 5,
-            'SSR': 100  # 實際上不限制
-        }
-        
-        if len(stocks) > max_stocks[rarity]:
+        if len(stocks) > MAX_STOCKS[rarity]:
             return False
         
         # 清除現有股票
@@ -383,7 +444,8 @@ class TradingAssistantSystem:
                 '''
                 
                 await execute_query(self.db_name, query, (assistant_id, clean_code))
-        
+
+        self.invalidate_assistant_configs(assistant_id)
         return True
     
     async def record_trade(self, assistant_id: int, stock_code: str, trade_type: str, 
@@ -408,83 +470,162 @@ class TradingAssistantSystem:
         
         return True
 
-    async def execute_trading_strategy(self):
-        """執行所有活躍助理的交易策略"""
+    @classmethod
+    def invalidate_assistant_configs(cls, assistant_id: int = None):
+        """使助理設定快取失效，下次執行策略時重新載入"""
+        if assistant_id is not None:
+            cls._settings_versions[assistant_id] = cls._settings_versions.get(assistant_id, 0) + 1
+        cls._config_generation += 1
+        cls._config_cache = None
+
+    async def load_assistant_configs(self, force: bool = False) -> dict:
+        """以三個查詢載入所有活躍助理、監控股票與設定"""
+        cls = TradingAssistantSystem
+        if cls._config_cache is not None and not force:
+            return cls._config_cache
+
         await self.setup_database()
-        
-        # 獲取所有活躍的助理
+        generation = cls._config_generation
+
+        # 1. 活躍助理
         query = '''
         SELECT assistant_id, user_id, assistant_name, rarity
         FROM assistants
         WHERE active = 1
         '''
-        
-        active_assistants = await execute_query(self.db_name, query, fetch_type='all')
-        
-        if not active_assistants:
+
+        rows = await execute_query(self.db_name, query, fetch_type='all')
+        if rows is None:
+            return {}
+
+        configs = {}
+        for assistant_id, user_id, assistant_name, rarity in rows:
+            configs[assistant_id] = AssistantConfig(
+                assistant_id, user_id, assistant_name, rarity,
+                cls._settings_versions.get(assistant_id, 0)
+            )
+
+        if not configs:
+            if generation == cls._config_generation:
+                cls._config_cache = configs
+            return configs
+
+        # 2. 監控的股票
+        query = '''
+        SELECT s.assistant_id, s.stock_code
+        FROM assistant_stocks s
+        JOIN assistants a ON a.assistant_id = s.assistant_id
+        WHERE a.active = 1
+        ORDER BY s.id
+        '''
+
+        for assistant_id, stock_code in await execute_query(self.db_name, query, fetch_type='all') or []:
+            config = configs.get(assistant_id)
+            clean_code = self.clean_stock_code_sync(stock_code)
+            if config and clean_code and clean_code != "unknown":
+                config.stocks.append(clean_code)
+
+        # 3. 設定 (全域設定與個股設定)
+        query = '''
+        SELECT st.assistant_id, st.stock_code, st.setting_key, st.setting_value
+        FROM assistant_settings st
+        JOIN assistants a ON a.assistant_id = st.assistant_id
+        WHERE a.active = 1
+        ORDER BY st.setting_id
+        '''
+
+        overrides = {}
+        for assistant_id, stock_code, key, value in await execute_query(self.db_name, query, fetch_type='all') or []:
+            config = configs.get(assistant_id)
+            if not config:
+                continue
+
+            if not stock_code or stock_code == 'global':
+                config.global_settings[key] = value
+            else:
+                overrides.setdefault(assistant_id, {}).setdefault(stock_code, {})[key] = value
+
+        # 合併個股設定與全域設定
+        for assistant_id, stock_overrides in overrides.items():
+            config = configs[assistant_id]
+            for stock_code, stock_settings in stock_overrides.items():
+                merged = dict(config.global_settings)
+                merged.update(stock_settings)
+                config.stock_settings[stock_code] = merged
+
+        # 載入期間設定被修改時不寫入快取
+        if generation == cls._config_generation:
+            cls._config_cache = configs
+        return configs
+
+    async def execute_trading_strategy(self, trigger_index: ThresholdTriggerIndex = None):
+        """執行所有活躍助理的交易策略
+
+        提供 trigger_index 時，事件觸發的助理只在設定變更後評估一次，其餘交給股價事件處理
+        """
+        configs = await self.load_assistant_configs()
+
+        if not configs:
             return
-        
+
         stock_system = Stock(self.bot)
-        currency = Currency(self.bot)
-        
-        for assistant_id, user_id, assistant_name, rarity in active_assistants:
+
+        for config in list(configs.values()):
+            if trigger_index is not None and config.rarity in self.EVENT_DRIVEN_RARITIES:
+                if trigger_index.evaluated_versions.get(config.assistant_id) == config.settings_version:
+                    continue
+                trigger_index.evaluated_versions[config.assistant_id] = config.settings_version
+
             try:
-                # 獲取監控的股票
-                query = '''
-                SELECT stock_code
-                FROM assistant_stocks
-                WHERE assistant_id = ?
-                '''
-                
-                stocks_rows = await execute_query(self.db_name, query, (assistant_id,), 'all')
-                monitored_stocks = []
-                
-                # 處理並清理每個股票代碼
-                if stocks_rows:
-                    for row in stocks_rows:
-                        clean_code = await self.clean_stock_code(row[0])
-                        if clean_code and clean_code != "unknown":
-                            monitored_stocks.append(clean_code)
-                
-                # 檢查助理能監控的股票數量
-                max_stocks = {
-                    'N': 1,
-                    'R': 3,
-                    'SR': 5,
-                    'SSR': 100  # 實際上不限制
-                }
-                
-                # 如果監控的股票超過限制，只處理前N個
-                if len(monitored_stocks) > max_stocks[rarity]:
-                    monitored_stocks = monitored_stocks[:max_stocks[rarity]]
-                
                 # 針對每支股票進行交易分析
-                for stock_code in monitored_stocks:
-                    try:
-                        # 獲取股票資訊
-                        stock_info = await stock_system.get_stock_info(stock_code)
-                        
-                        if not stock_info:
-                            print(f"無法獲取股票信息: {stock_code}")
-                            continue
-                        
-                        # 獲取該股票的特定設定
-                        settings = await self.get_assistant_settings(assistant_id, stock_code)
-                        
-                        # 根據稀有度和設定執行不同的交易策略
-                        if rarity == 'N':
-                            await self._execute_n_strategy(assistant_id, user_id, stock_code, stock_info, settings)
-                        elif rarity == 'R':
-                            await self._execute_r_strategy(assistant_id, user_id, stock_code, stock_info, settings)
-                        elif rarity == 'SR':
-                            await self._execute_sr_strategy(assistant_id, user_id, stock_code, stock_info, settings)
-                        elif rarity == 'SSR':
-                            await self._execute_ssr_strategy(assistant_id, user_id, stock_code, stock_info, settings)
-                    except Exception as e:
-                        print(f"處理股票 {stock_code} 時發生錯誤: {e}")
-                        
+                for stock_code in config.monitored_stocks:
+                    await self.evaluate_assistant_stock(config, stock_code, stock_system)
+
             except Exception as e:
-                print(f"執行交易助理 {assistant_name} 的交易策略時發生錯誤: {e}")
+                print(f"執行交易助理 {config.assistant_name} 的交易策略時發生錯誤: {e}")
+
+    async def evaluate_assistant_stock(self, config: AssistantConfig, stock_code: str, stock_system: Stock = None):
+        """對單一助理的單一股票執行交易策略"""
+        try:
+            # 獲取股票資訊
+            stock_info = await (stock_system or Stock(self.bot)).get_stock_info(stock_code)
+
+            if not stock_info:
+                print(f"無法獲取股票信息: {stock_code}")
+                return
+
+            # 獲取該股票的特定設定
+            settings = config.settings_for(stock_code)
+            assistant_id, user_id = config.assistant_id, config.user_id
+
+            # 股價版本和設定版本都與上次相同時，不重新計算也不重複下單
+            cache_key = None
+            if config.rarity in self.MEMOIZED_RARITIES:
+                stock_id = stock_info['stock_id']
+                cache_key = (assistant_id, stock_id, stock_registry.get_version(stock_id), config.settings_version)
+                if self.decision_cache.seen(cache_key) or cache_key in self._pending_decisions:
+                    return
+                self._pending_decisions.add(cache_key)
+
+            try:
+                # 根據稀有度和設定執行不同的交易策略
+                if config.rarity == 'N':
+                    await self._execute_n_strategy(assistant_id, user_id, stock_code, stock_info, settings)
+                elif config.rarity == 'R':
+                    await self._execute_r_strategy(assistant_id, user_id, stock_code, stock_info, settings)
+                elif config.rarity == 'SR':
+                    await self._execute_sr_strategy(assistant_id, user_id, stock_code, stock_info, settings)
+                elif config.rarity == 'SSR':
+                    await self._execute_ssr_strategy(assistant_id, user_id, stock_code, stock_info, settings)
+            finally:
+                if cache_key is not None:
+                    self._pending_decisions.discard(cache_key)
+
+            # 策略執行成功後才記錄，發生錯誤時下次仍會重試
+            if cache_key is not None:
+                self.decision_cache.record(cache_key)
+        except Exception as e:
+            print(f"處理股票 {stock_code} 時發生錯誤: {e}")
 
     async def _execute_n_strategy(self, assistant_id, user_id, stock_code, stock_info, settings):
         """執行N級助理的交易策略"""
@@ -606,17 +747,15 @@ class TradingAssistantSystem:
         # 檢查止損
         if stop_loss > 0:
             # 獲取用戶持股平均成本
-            user_holdings = await stock_system.get_user_stocks(user_id)
-            for stock_id, code, name, shares, avg_price in user_holdings:
-                if code == stock_code and shares > 0:
-                    stop_loss_price = avg_price * (1 - stop_loss / 100)
-                    print(f"  止損檢查: 止損價 {stop_loss_price}, 當前價 {current_price}, 買入均價 {avg_price}")
-                    
-                    if current_price <= stop_loss_price:
-                        print(f"  觸發止損: 價格跌破止損線")
-                        # 觸發止損，賣出所有持股
-                        await self._execute_sell_trade(assistant_id, user_id, stock_code, current_price, 1.0)
-                        break
+            shares, avg_price, _ = await stock_system.get_cost_basis(user_id, stock_info['stock_id'])
+            if shares > 0:
+                stop_loss_price = avg_price * (1 - stop_loss / 100)
+                print(f"  止損檢查: 止損價 {stop_loss_price}, 當前價 {current_price}, 買入均價 {avg_price}")
+
+                if current_price <= stop_loss_price:
+                    print(f"  觸發止損: 價格跌破止損線")
+                    # 觸發止損，賣出所有持股
+                    await self._execute_sell_trade(assistant_id, user_id, stock_code, current_price, 1.0)
 
     async def _execute_sr_strategy(self, assistant_id, user_id, stock_code, stock_info, settings):
         """執行SR級助理的交易策略"""
@@ -1004,13 +1143,13 @@ class TradingAssistantSystem:
         
         user_shares = 0
         avg_cost = 0
-        
-        for stock_id, code, name, shares, avg_price in user_holdings:
+
+        for stock_id, code, name, shares, _ in user_holdings:
             if code == stock_code:
-                user_shares = shares
-                avg_cost = avg_price
+                # 以先進先出帳本的平均成本計算盈虧
+                user_shares, avg_cost, _ = await stock_system.get_cost_basis(user_id, stock_id)
                 break
-        
+
         if user_shares <= 0:
             return
         
@@ -1054,11 +1193,49 @@ class TradingAssistantCog(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
         self.assistant_system = TradingAssistantSystem(bot)
+        self.trigger_index = ThresholdTriggerIndex()
+        stock_registry.add_price_listener(self.on_price_change)
         self.trading_task = self.start_trading_task()
-        
+
     def cog_unload(self):
         """Cog卸載時取消任務"""
+        stock_registry.remove_price_listener(self.on_price_change)
         self.trading_task.cancel()
+        shutdown_executor()
+
+    def on_price_change(self, stock_id: int, old_price: float, new_price: float):
+        """股價變動監聽器，只評估條件由不成立變為成立的助理"""
+        entry = stock_registry.get_by_id(stock_id)
+        if not entry:
+            return
+
+        stock_code = normalize_stock_code(entry.stock_code)
+        assistant_ids = None
+
+        if self.trigger_index.is_current(TradingAssistantSystem._config_cache):
+            assistant_ids = self.trigger_index.crossed(stock_code, old_price, new_price)
+            if not assistant_ids:
+                return
+
+        # 在獨立任務中執行，避免在更新股價的過程中遞迴下單
+        self.bot.loop.create_task(self.handle_price_trigger(stock_code, old_price, new_price, assistant_ids))
+
+    async def handle_price_trigger(self, stock_code: str, old_price: float, new_price: float, assistant_ids: set = None):
+        """執行被股價觸發的助理策略，索引過期時先重建"""
+        try:
+            configs = await self.assistant_system.load_assistant_configs()
+
+            if assistant_ids is None:
+                if not self.trigger_index.is_current(configs):
+                    self.trigger_index.rebuild(configs, TradingAssistantSystem.EVENT_DRIVEN_RARITIES)
+                assistant_ids = self.trigger_index.crossed(stock_code, old_price, new_price)
+
+            for assistant_id in assistant_ids:
+                config = configs.get(assistant_id)
+                if config and stock_code in config.monitored_stocks:
+                    await self.assistant_system.evaluate_assistant_stock(config, stock_code)
+        except Exception as e:
+            print(f"處理股價觸發的助理策略時發生錯誤: {e}")
         
     def start_trading_task(self):
         """啟動交易任務"""
@@ -1071,7 +1248,7 @@ class TradingAssistantCog(commands.Cog):
         while not self.bot.is_closed():
             try:
                 # 執行交易策略
-                await self.assistant_system.execute_trading_strategy()
+                await self.assistant_system.execute_trading_strategy(self.trigger_index)
                 
                 # 等待一段時間
                 await asyncio.sleep(3600)  # 每小時執行一次
@@ -1081,6 +1258,106 @@ class TradingAssistantCog(commands.Cog):
                 print(f"交易循環任務發生錯誤: {e}")
                 await asyncio.sleep(300)  # 發生錯誤後等待5分鐘
     
+    @app_commands.command(name="assistant_cache_stats", description="查看交易助理決策快取的命中率 (管理員專用)")
+    @app_commands.default_permissions(administrator=True)
+    async def assistant_cache_stats(self, interaction: discord.Interaction):
+        """查看交易助理決策快取的命中率"""
+        if not interaction.user.guild_permissions.administrator:
+            await interaction.response.send_message("你沒有權限使用此指令！", ephemeral=True)
+            return
+
+        stats = TradingAssistantSystem.decision_cache.stats()
+
+        embed = discord.Embed(
+            title="🧠 交易助理決策快取",
+            color=discord.Color.blue()
+        )
+        embed.add_field(name="項目數", value=f"{stats['size']} / {stats['maxsize']}", inline=True)
+        embed.add_field(name="命中率", value=f"{stats['hit_rate']:.1%}", inline=True)
+        embed.add_field(name="命中 / 未命中", value=f"{stats['hits']} / {stats['misses']}", inline=True)
+        embed.add_field(name="淘汰次數", value=str(stats['evictions']), inline=True)
+
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
+    @app_commands.command(name="optimize_assistant", description="以歷史股價回測，為交易助理找出最佳設定")
+    @app_commands.describe(assistant_id="助理ID", method="搜尋方式")
+    @app_commands.choices(method=[
+        app_commands.Choice(name="網格搜尋", value="grid"),
+        app_commands.Choice(name="隨機搜尋", value="random")
+    ])
+    async def optimize_assistant(self, interaction: discord.Interaction, assistant_id: int, method: str = "grid"):
+        """以歷史股價回測，為交易助理找出最佳設定"""
+        details = await self.assistant_system.get_assistant_details(assistant_id)
+
+        if not details or details['user_id'] != interaction.user.id:
+            await interaction.response.send_message("找不到該助理或你沒有權限查看！", ephemeral=True)
+            return
+
+        if not details['stocks']:
+            await interaction.response.send_message("這位助理尚未設定監控股票！", ephemeral=True)
+            return
+
+        await interaction.response.defer(thinking=True, ephemeral=True)
+
+        try:
+            # 回測在行程池中執行，不會阻塞事件循環
+            top_configs = await optimize_assistant_settings(
+                details['rarity'], details['stocks'], method=method, samples=100, top_n=3
+            )
+        except Exception as e:
+            print(f"最佳化助理設定時發生錯誤: {e}")
+            await interaction.followup.send(f"最佳化助理設定時發生錯誤: {str(e)}", ephemeral=True)
+            return
+
+        title = f"🔬 {details['assistant_name']} 設定最佳化結果"
+        description = f"以歷史股價回測 ({'網格搜尋' if method == 'grid' else '隨機搜尋'})，依報酬率與最大回撤排序"
+        footer = "回測結果不代表未來表現，可透過助理詳情中的設定按鈕套用"
+
+        # 報酬最好的股票排在前面
+        ranked = sorted(
+            top_configs.items(),
+            key=lambda item: item[1][0]['pnl_pct'] if item[1] else float('-inf'),
+            reverse=True
+        )
+
+        fields = []
+        for stock_code, results in ranked:
+            if not results:
+                fields.append((stock_code, "歷史資料不足，無法回測"))
+                continue
+
+            lines = []
+            for rank, result in enumerate(results, 1):
+                settings_text = ", ".join(f"{k}={v}" for k, v in result['settings'].items())
+                lines.append(
+                    f"**#{rank}** 報酬 {result['pnl_pct']:+.2f}% | 最大回撤 {result['max_drawdown']:.1%} | "
+                    f"{result['trades']} 筆\n`{settings_text}`"
+                )
+            fields.append((stock_code, "\n".join(lines)[:1024]))
+
+        # 監控股票很多時 (SSR 最多100支) 分成多則訊息，每則都在 Discord 的欄位數與字數限制內
+        embeds = []
+        embed = None
+        used = 0
+        for name, value in fields:
+            if embed is None or len(embed.fields) >= EMBED_MAX_FIELDS or used + len(name) + len(value) > EMBED_CHAR_BUDGET:
+                embed = discord.Embed(
+                    title=title if not embeds else f"{title} (續)",
+                    description=description if not embeds else None,
+                    color=discord.Color.teal()
+                )
+                embeds.append(embed)
+                used = len(embed.title) + len(embed.description or "") + len(footer)
+            embed.add_field(name=name, value=value, inline=False)
+            used += len(name) + len(value)
+
+        if not embeds:
+            embeds.append(discord.Embed(title=title, description=description, color=discord.Color.teal()))
+        embeds[-1].set_footer(text=footer)
+
+        for embed in embeds:
+            await interaction.followup.send(embed=embed, ephemeral=True)
+
     @app_commands.command(name="draw_assistant", description="抽取一位股票交易助理 (花費2000 Silva幣)")
     async def draw_assistant(self, interaction: discord.Interaction):
         """抽取一位股票交易助理"""
@@ -321,26 +321,14 @@ class DividendModal(Modal):
         except Exception as e:
             await interaction.response.send_message(f"發生錯誤：{str(e)}", ephemeral=True)
 
-class StockCog(commands.Cog):
-    """股票系統指令"""
-
-    def __init__(self, bot):
-        self.bot = bot
-        self.stock = Stock(bot)
-        self.currency = Currency(bot)
-        # 啟動股票價格更新任務
-        self.update_stock_prices.start()
-    
-    def cog_unload(self):
-        """Cog卸載時停止任務"""
-        self.update_stock_prices.cancel()
-    # 先定義分頁視圖類
 class StockPaginationView(discord.ui.View):
-    def __init__(self, cog, current_page, total_pages):
+    def __init__(self, cog, current_page, has_next, first_key, last_key):
         super().__init__(timeout=180)
         self.cog = cog
         self.current_page = current_page
-        self.total_pages = total_pages
+        # 本頁第一筆與最後一筆的 (stock_code, stock_id)，作為翻頁游標
+        self.first_key = first_key
+        self.last_key = last_key
         
         # 添加上一頁按鈕
         self.prev_button = discord.ui.Button(
@@ -356,7 +344,7 @@ class StockPaginationView(discord.ui.View):
         self.next_button = discord.ui.Button(
             label="下一頁", 
             style=discord.ButtonStyle.primary,
-            disabled=(current_page >= total_pages),
+            disabled=not has_next,
             custom_id="next_page"
         )
         self.next_button.callback = self.next_page
@@ -364,28 +352,105 @@ class StockPaginationView(discord.ui.View):
     
     async def previous_page(self, interaction: discord.Interaction):
         await interaction.response.defer()
-        await self.cog._show_stocks_page(interaction, self.current_page - 1)
-        
+        await self.cog._show_stocks_page(interaction, self.current_page - 1, before=self.first_key)
+
+    async def next_page(self, interaction: discord.Interaction):
+        await interaction.response.defer()
+        await self.cog._show_stocks_page(interaction, self.current_page + 1, after=self.last_key)
+
+
+class OrderPaginationView(discord.ui.View):
+    def __init__(self, cog, user_id, active_only, current_page, has_next, first_key, last_key):
+        super().__init__(timeout=180)
+        self.cog = cog
+        self.user_id = user_id
+        self.active_only = active_only
+        self.current_page = current_page
+        # 本頁第一筆與最後一筆的 (created_at, order_id)，作為翻頁游標
+        self.first_key = first_key
+        self.last_key = last_key
+
+        self.prev_button = discord.ui.Button(
+            label="上一頁",
+            style=discord.ButtonStyle.primary,
+            disabled=(current_page <= 1),
+            row=1
+        )
+        self.prev_button.callback = self.previous_page
+        self.add_item(self.prev_button)
+
+        self.next_button = discord.ui.Button(
+            label="下一頁",
+            style=discord.ButtonStyle.primary,
+            disabled=not has_next,
+            row=1
+        )
+        self.next_button.callback = self.next_page
+        self.add_item(self.next_button)
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        if interaction.user.id != self.user_id:
+            await interaction.response.send_message("這不是你的委託單列表！", ephemeral=True)
+            return False
+        return True
+
+    async def previous_page(self, interaction: discord.Interaction):
+        await interaction.response.defer()
+        await self.cog._show_orders_page(
+            interaction, self.active_only, self.current_page - 1, before=self.first_key
+        )
+
     async def next_page(self, interaction: discord.Interaction):
         await interaction.response.defer()
-        await self.cog._show_stocks_page(interaction, self.current_page + 1)
+        await self.cog._show_orders_page(
+            interaction, self.active_only, self.current_page + 1, after=self.last_key
+        )
 
 
-# 然後在 StockCog 類中定義方法
 class StockCog(commands.Cog):
+    """股票系統指令"""
 
+    def __init__(self, bot):
+        self.bot = bot
+        self.stock = Stock(bot)
+        self.currency = Currency(bot)
+        # 啟動股票價格更新任務
+        self.update_stock_prices.start()
+        # 啟動歷史資料歸檔任務
+        self.archive_stock_history.start()
+        # 啟動集合競價任務
+        self.auction_due = {}  # {stock_id: 下次競價時間}
+        self.run_call_auctions.start()
+    
+    def cog_unload(self):
+        """Cog卸載時停止任務"""
+        self.update_stock_prices.cancel()
+        self.archive_stock_history.cancel()
+        self.run_call_auctions.cancel()
+
+    async def _show_stocks_page(self, interaction, page: int = 1, after=None, before=None):
+        """顯示股票市場的特定頁
 
-    async def _show_stocks_page(self, interaction, page: int = 1):
-        """顯示股票市場的特定頁"""
+        翻頁時以上一頁的游標 (after/before) 做索引範圍查詢；
+        只有直接指定頁碼時才需要用 OFFSET 定位一次。
+        """
         try:
             page = max(1, page)  # 確保頁碼至少為1
             page_size = 5  # 每頁顯示5個股票
-            
-            # 獲取分頁數據和總計
-            stocks = await Stock.get_stocks_paged(page_size, page)
-            total_count = await Stock.get_total_stocks_count()
+
+            # 獲取分頁數據和總計 (總數為快取的大約值)
+            total_count = await self.stock.get_total_stocks_count()
             total_pages = (total_count + page_size - 1) // page_size  # 計算總頁數
-            
+
+            if after is None and before is None and page > 1:
+                stocks = await self.stock.get_stocks_paged(page_size, page)
+                has_next = page < total_pages
+            else:
+                stocks, has_more = await self.stock.get_stocks_keyset(page_size, after=after, before=before)
+                # 往回翻時，來源頁一定還在後面
+                has_next = True if before is not None else has_more
+            total_pages = max(page, total_pages)
+
             if not stocks:
                 if page > 1:
                     await interaction.followup.send(f"頁碼 {page} 超出範圍，股票數據共有 {total_pages} 頁", ephemeral=True)
@@ -414,16 +479,16 @@ class StockCog(commands.Cog):
                 )
             
             # 添加導航按鈕
-            view = StockPaginationView(self, page, total_pages)
-            
-            if hasattr(interaction, 'response') and hasattr(interaction.response, 'is_done'):
-                if interaction.response.is_done():
-                    await interaction.followup.send(embed=embed, view=view)
-                else:
-                    await interaction.response.send_message(embed=embed, view=view)
+            view = StockPaginationView(
+                self, page, has_next,
+                (stocks[0][1], stocks[0][0]), (stocks[-1][1], stocks[-1][0])
+            )
+
+            if interaction.response.is_done():
+                # 指令與翻頁都已延遲回應，直接更新原訊息
+                await interaction.edit_original_response(embed=embed, view=view)
             else:
-                # 如果是編輯消息
-                await interaction.edit(embed=embed, view=view)
+                await interaction.response.send_message(embed=embed, view=view)
         except Exception as e:
             print(f"顯示股票頁面時發生錯誤: {e}")
             try:
@@ -551,9 +616,9 @@ class StockCog(commands.Cog):
     async def my_stock(self, interaction: discord.Interaction):
         """查看你持有的股票"""
         try:
-            # 獲取用戶持股
-            stocks = await self.stock.get_user_stocks(interaction.user.id)
-            
+            # 獲取用戶持股與成本
+            stocks, realized_pnl = await self.stock.get_portfolio_pnl(interaction.user.id)
+
             if not stocks:
                 await interaction.response.send_message("你目前沒有持有任何股票！", ephemeral=True)
                 return
@@ -564,18 +629,27 @@ class StockCog(commands.Cog):
             )
             
             total_value = 0
-            
-            for stock_id, code, name, shares, price in stocks:
+            total_cost = 0
+
+            for stock_id, code, name, shares, price, cost in stocks:
                 value = shares * price
                 total_value += value
-                
+                total_cost += cost
+                pnl = value - cost
+                pnl_percent = (pnl / cost * 100) if cost else 0
+
                 embed.add_field(
                     name=f"{code} - {name}",
-                    value=f"持有: {shares:,} 股\n價格: {price} Silva幣\n價值: {value:,.2f} Silva幣",
+                    value=(
+                        f"持有: {shares:,} 股\n價格: {price} Silva幣\n價值: {value:,.2f} Silva幣\n"
+                        f"均價: {cost / shares:,.2f} | 損益: {pnl:+,.2f} ({pnl_percent:+.2f}%)"
+                    ),
                     inline=True
                 )
-            
+
             embed.add_field(name="總投資價值", value=f"{total_value:,.2f} Silva幣", inline=False)
+            embed.add_field(name="未實現損益", value=f"{total_value - total_cost:+,.2f} Silva幣", inline=True)
+            embed.add_field(name="已實現損益", value=f"{realized_pnl:+,.2f} Silva幣", inline=True)
             
             # 獲取用戶餘額
             balance = await self.currency.get_balance(interaction.user.id)
@@ -590,23 +664,40 @@ class StockCog(commands.Cog):
     @app_commands.describe(active_only="是否只顯示活躍的委託單")
     async def orders(self, interaction: discord.Interaction, active_only: bool = True):
         """查看你的委託單"""
+        await interaction.response.defer()
+        await self._show_orders_page(interaction, active_only)
+
+    async def _show_orders_page(self, interaction, active_only: bool, page: int = 1, after=None, before=None):
+        """顯示用戶委託單的特定頁 (由新到舊，以游標翻頁)"""
         try:
+            page = max(1, page)
+            page_size = 10  # 每頁顯示10筆委託單
+
             # 獲取用戶委託單
-            orders = await self.stock.get_user_orders(interaction.user.id, active_only)
-            
+            orders, has_more = await self.stock.get_user_orders_keyset(
+                interaction.user.id, active_only, page_size, after=after, before=before
+            )
+
             if not orders:
                 message = "你目前沒有活躍的委託單！" if active_only else "你沒有任何委託單歷史！"
-                await interaction.response.send_message(message, ephemeral=True)
+                await interaction.edit_original_response(content=message, embed=None, view=None)
                 return
-            
+
+            total_count = await self.stock.count_user_orders(interaction.user.id, active_only)
+            total_pages = max(page, (total_count + page_size - 1) // page_size)
+
             embed = discord.Embed(
                 title="📝 你的股票委託單",
-                description="以下是你的委託單列表" + (" (只顯示活躍的)" if active_only else ""),
+                description="以下是你的委託單列表" + (" (只顯示活躍的)" if active_only else "") + f" (第 {page}/{total_pages} 頁)",
                 color=discord.Color.blue()
             )
-            
-            # 創建視圖用於取消委託單
-            view = discord.ui.View(timeout=180)
+
+            # 創建視圖用於翻頁及取消委託單
+            view = OrderPaginationView(
+                self, interaction.user.id, active_only, page,
+                True if before is not None else has_more,
+                (orders[0][7], orders[0][0]), (orders[-1][7], orders[-1][0])
+            )
             
             for i, (order_id, stock_code, stock_name, order_type, shares, price, status, created_at) in enumerate(orders):
                 type_emoji = "🟢" if order_type == "buy" else "🔴"
@@ -650,16 +741,10 @@ class StockCog(commands.Cog):
                     cancel_button.callback = await create_cancel_callback(order_id)
                     view.add_item(cancel_button)
             
-            # 如果沒有活躍訂單，不顯示視圖
-            has_active = any(status == "active" for _, _, _, _, _, _, status, _ in orders)
-            
-            await interaction.response.send_message(
-                embed=embed, 
-                view=view if has_active else None
-            )
+            await interaction.edit_original_response(content=None, embed=embed, view=view)
         except Exception as e:
             print(f"執行 orders 指令時發生錯誤: {e}")
-            await interaction.response.send_message(f"獲取委託單資訊時發生錯誤，請通知管理員檢查。", ephemeral=True)
+            await interaction.followup.send(f"獲取委託單資訊時發生錯誤，請通知管理員檢查。", ephemeral=True)
 
     @app_commands.command(name="buystock", description="購買股票")
     @app_commands.describe(stock_code="股票代號")
@@ -760,6 +845,43 @@ class StockCog(commands.Cog):
             print(f"執行 topstocks 指令時發生錯誤: {e}")
             await interaction.response.send_message(f"獲取股票排行榜時發生錯誤，請通知管理員檢查。", ephemeral=True)
 
+    @app_commands.command(name="networth", description="顯示總資產排行榜 (現金 + 股票市值)")
+    async def net_worth_ranking(self, interaction: discord.Interaction):
+        """顯示總資產排行榜"""
+        try:
+            ranking = await self.stock.get_net_worth_ranking(10)
+
+            if not ranking:
+                await interaction.response.send_message("還沒有任何紀錄！")
+                return
+
+            embed = discord.Embed(
+                title="🏆 總資產排行榜",
+                description="現金餘額 + 股票市值",
+                color=discord.Color.gold()
+            )
+
+            rank_formats = {
+                1: "🥇 第1名",
+                2: "🥈 第2名",
+                3: "🥉 第3名"
+            }
+
+            for idx, (user_id, username, balance, equity_value, net_worth) in enumerate(ranking, 1):
+                embed.add_field(
+                    name=rank_formats.get(idx, f"第{idx}名"),
+                    value=(
+                        f"{username or f'<@{user_id}>'}: **{net_worth:,.2f}** Silva幣\n"
+                        f"現金 {balance:,} | 股票 {equity_value:,.2f}"
+                    ),
+                    inline=False
+                )
+
+            await interaction.response.send_message(embed=embed)
+        except Exception as e:
+            print(f"執行 networth 指令時發生錯誤: {e}")
+            await interaction.response.send_message("獲取排行榜時發生錯誤，請通知管理員檢查。", ephemeral=True)
+
     @app_commands.command(name="dividend", description="為你發行的股票派發股息")
     @app_commands.describe(stock_code="股票代號")
     async def dividend(self, interaction: discord.Interaction, stock_code: str):
@@ -859,6 +981,84 @@ class StockCog(commands.Cog):
         """等待機器人準備好後再開始任務"""
         await self.bot.wait_until_ready()
 
+    @tasks.loop(hours=24)  # 每天歸檔一次
+    async def archive_stock_history(self):
+        """將已結束的委託單與過期成交紀錄移至冷資料表"""
+        try:
+            result = await self.stock.archive_history()
+            if result:
+                print(
+                    f"已歸檔 {result['orders']} 筆委託單、{result['transactions']} 筆成交紀錄"
+                )
+
+            # 校正增量維護的持股市值
+            await self.stock.rebuild_portfolio_values()
+        except Exception as e:
+            print(f"歸檔股票歷史資料時發生錯誤: {e}")
+
+    @archive_stock_history.before_loop
+    async def before_archive_stock_history(self):
+        """等待機器人準備好後再開始任務"""
+        await self.bot.wait_until_ready()
+
+    @tasks.loop(seconds=5)
+    async def run_call_auctions(self):
+        """為到期的集合競價股票執行撮合"""
+        try:
+            now = asyncio.get_running_loop().time()
+            auction_stocks = await self.stock.get_auction_stocks()
+            active_ids = set()
+            
+            for stock_id, code, interval in auction_stocks:
+                active_ids.add(stock_id)
+                due = self.auction_due.get(stock_id)
+                
+                if due is None:
+                    self.auction_due[stock_id] = now + interval
+                    continue
+                
+                if now < due:
+                    continue
+                
+                self.auction_due[stock_id] = now + interval
+                if await self.stock.run_call_auction(stock_id):
+                    print(f"股票 {code} 完成集合競價撮合")
+            
+            # 移除已改回連續撮合的股票
+            for stock_id in list(self.auction_due):
+                if stock_id not in active_ids:
+                    del self.auction_due[stock_id]
+        except Exception as e:
+            print(f"執行集合競價時發生錯誤: {e}")
+
+    @run_call_auctions.before_loop
+    async def before_run_call_auctions(self):
+        """等待機器人準備好並確保資料庫已設置後再開始任務"""
+        await self.bot.wait_until_ready()
+        await self.stock.setup_database()
+
+    @app_commands.command(name="set_auction_mode", description="設定股票的集合競價間隔 (管理員專用)")
+    @app_commands.describe(stock_code="股票代號", interval="競價間隔秒數 (0 表示改回連續撮合)")
+    @app_commands.default_permissions(administrator=True)
+    async def set_auction_mode(self, interaction: discord.Interaction, stock_code: str, interval: int = 0):
+        """設定股票的集合競價間隔"""
+        if not interaction.user.guild_permissions.administrator:
+            await interaction.response.send_message("你沒有權限使用此指令！", ephemeral=True)
+            return
+        
+        if interval < 0:
+            await interaction.response.send_message("❌ 競價間隔不能為負數！", ephemeral=True)
+            return
+        
+        try:
+            await interaction.response.defer(thinking=True)
+            
+            success, message = await self.stock.set_auction_mode(stock_code.upper(), interval)
+            await interaction.followup.send(f"{'✅' if success else '❌'} {message}")
+        except Exception as e:
+            print(f"設定集合競價時發生錯誤: {e}")
+            await interaction.followup.send(f"設定集合競價時發生錯誤: {str(e)}")
+
     # 以下是管理員用於診斷問題的指令
     @app_commands.command(name="check_stock_db", description="檢查股票資料庫狀態 (管理員專用)")
     @app_commands.default_permissions(administrator=True)
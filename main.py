@@ -1,9 +1,10 @@
 import discord
 from discord.ext import commands
-import json
 import asyncio
 import os
 from config import load_config
+from models.role_panels import role_panel_store
+from utils.components import component_router
 
 # 設置機器人權限
 intents = discord.Intents.default()
@@ -17,12 +18,31 @@ intents.presences = True
 # 初始化機器人
 bot = commands.Bot(command_prefix='!', intents=intents)
 
+# 按鈕互動依 custom_id 分派，不需要在啟動時重新註冊持久化視圖
+bot.add_listener(component_router.dispatch, 'on_interaction')
+
 # 載入設定
 config = load_config()
 
 # 全域變數 (可以考慮改成更好的管理方式)
 currency_instance = None
 
+@bot.event
+async def setup_hook():
+    """連線前執行一次：載入身分組面板設定"""
+    try:
+        await role_panel_store.setup_database()
+
+        # 舊版的 role_buttons_{guild_id}.json 只會匯入一次 (在背景執行緒讀取)
+        imported = await role_panel_store.import_legacy_files()
+        if imported:
+            print(f"已匯入 {imported} 個舊版身分組面板")
+
+        await role_panel_store.load()
+    except Exception as e:
+        print(f"載入身分組面板時發生錯誤: {e}")
+
+
 @bot.event
 async def on_ready():
     """機器人啟動時執行"""
@@ -38,9 +58,6 @@ async def on_ready():
         synced = await bot.tree.sync()
         print(f"同步了 {len(synced)} 個指令")
         
-        # 初始化持久化視圖 (可以移至 roles cog)
-        await reload_persistent_views()
-        
         # 設定狀態
         await bot.change_presence(
             activity=discord.Activity(type=discord.ActivityType.playing, name="SilvA"),
@@ -51,33 +68,6 @@ async def on_ready():
         print(f"初始化過程中發生錯誤: {e}")
 
 
-async def reload_persistent_views():
-    """重新載入持久化按鈕視圖"""
-    try:
-        persistent_views = {}
-        
-        for guild in bot.guilds:
-            try:
-                # 讀取該伺服器的持久化按鈕配置
-                with open(f'role_buttons_{guild.id}.json', 'r', encoding='utf8') as f:
-                    role_data = json.load(f)
-                    
-                    # 實際的視圖載入需要移至 roles cog
-                    # 這裡只是佔位，實際實現時需要導入正確的類別
-                    from cogs.roles import RoleButtonView
-                    
-                    for channel_id, roles in role_data.items():
-                        view = RoleButtonView(roles)
-                        persistent_views[int(channel_id)] = view
-                        bot.add_view(view)
-            except FileNotFoundError:
-                continue  # 如果檔案不存在，跳過該伺服器
-            except Exception as e:
-                print(f"加載伺服器 {guild.id} 的持久化按鈕時出錯: {e}")
-    except Exception as e:
-        print(f"重新載入持久化視圖時發生錯誤: {e}")
-
-
 @bot.event
 async def on_member_join(member):
     """新成員加入時執行"""
@@ -0,0 +1,500 @@
+import math
+import random
+import time
+from typing import Dict, List, Optional
+from utils.database import execute_query
+
+
+class PriceSeries:
+    """價格序列與其前綴和，所有視窗平均值都能以 O(1) 取得"""
+    __slots__ = ('stock_code', 'prices', 'price_sums', 'gain_sums', 'loss_sums', 'change_pct_sums')
+
+    def __init__(self, stock_code: str, prices: List[float]):
+        self.stock_code = stock_code
+        self.prices = prices
+
+        # price_sums[i] = prices[0] + ... + prices[i-1]
+        self.price_sums = [0.0]
+        # gain_sums[i] / loss_sums[i] / change_pct_sums[i] = 第1到第i個變動的累計
+        self.gain_sums = [0.0]
+        self.loss_sums = [0.0]
+        self.change_pct_sums = [0.0]
+
+        total = 0.0
+        for price in prices:
+            total += price
+            self.price_sums.append(total)
+
+        for i in range(1, len(prices)):
+            change = prices[i] - prices[i - 1]
+            self.gain_sums.append(self.gain_sums[-1] + max(0.0, change))
+            self.loss_sums.append(self.loss_sums[-1] + max(0.0, -change))
+            previous = prices[i - 1]
+            self.change_pct_sums.append(self.change_pct_sums[-1] + (abs(change) / previous if previous else 0.0))
+
+    def __len__(self):
+        return len(self.prices)
+
+    def window_sum(self, start: int, end: int) -> float:
+        """prices[start:end] 的總和"""
+        return self.price_sums[end] - self.price_sums[start]
+
+    def tail_sum(self, t: int, n: int, window_start: int = 0) -> float:
+        """在 prices[window_start:t+1] 中取最後 n 個價格的總和 (不足 n 個時取全部)"""
+        return self.window_sum(max(window_start, t + 1 - n), t + 1)
+
+
+class BacktestResult:
+    """單一股票、單一參數組合的回測結果"""
+
+    def __init__(self, rarity: str, stock_code: str, params: dict, initial_cash: float):
+        self.rarity = rarity
+        self.stock_code = stock_code
+        self.params = params
+        self.initial_cash = initial_cash
+        self.final_value = initial_cash
+        self.max_drawdown = 0.0
+        self.buys = 0
+        self.sells = 0
+        self.ticks = 0
+
+    @property
+    def trades(self) -> int:
+        return self.buys + self.sells
+
+    @property
+    def pnl(self) -> float:
+        return self.final_value - self.initial_cash
+
+    @property
+    def pnl_pct(self) -> float:
+        return self.pnl / self.initial_cash * 100 if self.initial_cash else 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            'rarity': self.rarity,
+            'stock_code': self.stock_code,
+            'params': self.params,
+            'final_value': self.final_value,
+            'pnl': self.pnl,
+            'pnl_pct': self.pnl_pct,
+            'max_drawdown': self.max_drawdown,
+            'trades': self.trades,
+            'buys': self.buys,
+            'sells': self.sells,
+            'ticks': self.ticks
+        }
+
+    def __repr__(self):
+        return (f"BacktestResult({self.rarity} {self.stock_code} pnl={self.pnl:,.2f} "
+                f"({self.pnl_pct:+.2f}%) dd={self.max_drawdown:.2%} trades={self.trades})")
+
+
+class Account:
+    """回測用的模擬帳戶，成交價即為當下價格"""
+    __slots__ = ('cash', 'shares', 'cost')
+
+    def __init__(self, cash: float):
+        self.cash = cash
+        self.shares = 0
+        self.cost = 0.0  # 持股總成本
+
+    @property
+    def avg_cost(self) -> float:
+        return self.cost / self.shares if self.shares else 0.0
+
+    def buy(self, price: float, percentage: float) -> bool:
+        """與 _execute_buy_trade 相同的下單規則"""
+        if self.cash <= 0:
+            return False
+
+        buy_amount = self.cash * percentage
+        if buy_amount < price:
+            return False
+
+        shares = int(buy_amount / price)
+        total_amount = shares * price
+        if shares <= 0 or total_amount > self.cash:
+            return False
+
+        self.cash -= total_amount
+        self.shares += shares
+        self.cost += total_amount
+        return True
+
+    def sell(self, price: float, percentage: float) -> bool:
+        """與 _execute_sell_trade 相同的下單規則"""
+        if self.shares <= 0:
+            return False
+
+        sell_shares = min(self.shares, max(1, int(self.shares * percentage)))
+        self.cost -= self.avg_cost * sell_shares
+        self.shares -= sell_shares
+        self.cash += sell_shares * price
+        if self.shares == 0:
+            self.cost = 0.0
+        return True
+
+
+def _flag(settings: dict, key: str, default: str = 'true') -> bool:
+    return str(settings.get(key, default)).lower() == 'true'
+
+
+def _n_decision(series: PriceSeries, t: int, account: Account, p: dict, rng: random.Random):
+    """N級策略：價格門檻"""
+    price = series.prices[t]
+    buy_pct = sell_pct = 0.0
+
+    if p['buy_threshold'] > 0 and price <= p['buy_threshold']:
+        buy_pct = p['trade_percentage']
+    if p['sell_threshold'] < float('inf') and price >= p['sell_threshold']:
+        sell_pct = p['trade_percentage']
+
+    return buy_pct, sell_pct
+
+
+def _r_decision(series: PriceSeries, t: int, account: Account, p: dict, rng: random.Random):
+    """R級策略：價格門檻、均線交叉與止損"""
+    prices = series.prices
+    price = prices[t]
+    ma_short, ma_long = p['ma_short'], p['ma_long']
+    window_start = max(0, t + 1 - 30)  # 線上只取30日歷史
+    length = t + 1 - window_start
+    buy_pct = sell_pct = 0.0
+
+    if length < max(ma_short, ma_long):
+        return buy_pct, sell_pct
+
+    ma_short_value = series.tail_sum(t, ma_short, window_start) / ma_short
+    ma_long_value = series.tail_sum(t, ma_long, window_start) / ma_long
+    previous = prices[t - 1] if length > 1 else None
+
+    ma_crossover_buy = ma_short_value > ma_long_value and previous is not None and previous <= ma_long_value
+    ma_crossover_sell = ma_short_value < ma_long_value and previous is not None and previous >= ma_long_value
+    recent_avg = series.window_sum(t - 5, t) / 5 if length >= 6 else None
+
+    if (p['buy_threshold'] > 0 and price <= p['buy_threshold']) or ma_crossover_buy:
+        buy_pct = p['trade_percentage']
+        if recent_avg is not None and ma_short_value < recent_avg:
+            buy_pct *= 1.5
+
+    if (p['sell_threshold'] < float('inf') and price >= p['sell_threshold']) or ma_crossover_sell:
+        sell_pct = p['trade_percentage']
+        if recent_avg is not None and ma_short_value > recent_avg:
+            sell_pct *= 0.8
+
+    # 止損：賣出所有持股
+    if p['stop_loss'] > 0 and account.shares > 0:
+        if price <= account.avg_cost * (1 - p['stop_loss'] / 100):
+            sell_pct = 1.0
+
+    return buy_pct, sell_pct
+
+
+def _volatility(series: PriceSeries, window_start: int, length: int) -> float:
+    """與線上邏輯相同，取歷史視窗最早的19個變動計算平均波動率"""
+    count = min(19, length - 1)
+    if count <= 0:
+        return 0.0
+    return (series.change_pct_sums[window_start + count] - series.change_pct_sums[window_start]) / count
+
+
+def _sr_decision(series: PriceSeries, t: int, account: Account, p: dict, rng: random.Random):
+    """SR級策略：RSI、MACD與形態投票"""
+    prices = series.prices
+    window_start = max(0, t + 1 - 60)
+    length = t + 1 - window_start
+    buy_pct = sell_pct = 0.0
+
+    if length < 30:
+        return buy_pct, sell_pct
+
+    buy_signals = sell_signals = 0
+
+    if p['use_rsi']:
+        start = max(window_start, t - 14)
+        avg_gain = (series.gain_sums[t] - series.gain_sums[start]) / 14
+        avg_loss = (series.loss_sums[t] - series.loss_sums[start]) / 14
+        rsi = 100 if avg_loss == 0 else 100 - (100 / (1 + avg_gain / avg_loss))
+        if rsi <= p['rsi_buy']:
+            buy_signals += 1
+        elif rsi >= p['rsi_sell']:
+            sell_signals += 1
+
+    if p['use_macd']:
+        macd = series.tail_sum(t, 12, window_start) / 12 - series.tail_sum(t, 26, window_start) / 26
+        signal = (prices[t] - prices[t - 9]) / 9
+        histogram = macd - signal
+        if histogram > 0:
+            buy_signals += 1
+        elif histogram < 0:
+            sell_signals += 1
+
+    if p['use_pattern']:
+        p1, p2, p3, p4, p5 = prices[t], prices[t - 1], prices[t - 2], prices[t - 3], prices[t - 4]
+        if p3 < p4 < p5 and p1 > p2 > p3:
+            buy_signals += 1
+        elif p3 > p4 > p5 and p1 < p2 < p3:
+            sell_signals += 1
+
+    trade_percentage = p['trade_percentage']
+    if _volatility(series, window_start, length) > 0.02:
+        trade_percentage *= 0.8
+
+    total_signals = p['use_rsi'] + p['use_macd'] + p['use_pattern']
+    if total_signals > 0:
+        if buy_signals > total_signals / 2:
+            buy_pct = trade_percentage * (buy_signals / total_signals) * (1 + p['risk_reward'])
+        if sell_signals > total_signals / 2:
+            sell_pct = trade_percentage * (sell_signals / total_signals)
+
+    return buy_pct, sell_pct
+
+
+def _ssr_decision(series: PriceSeries, t: int, account: Account, p: dict, rng: random.Random):
+    """SSR級策略：多重均線、異常偵測、情緒與投資組合平衡
+
+    單一股票回測時以 現金 + 持股市值 作為投資組合總值。
+    """
+    prices = series.prices
+    price = prices[t]
+    window_start = max(0, t + 1 - 90)
+    length = t + 1 - window_start
+    buy_pct = sell_pct = 0.0
+
+    if length < 30:
+        return buy_pct, sell_pct
+
+    ma_short = series.tail_sum(t, 5, window_start) / 5
+    ma_medium = series.tail_sum(t, 20, window_start) / 20
+    ma_long = series.tail_sum(t, 50, window_start) / 50
+    volatility = _volatility(series, window_start, length)
+
+    if ma_short > ma_medium > ma_long:
+        market_cycle = 1
+    elif ma_short < ma_medium < ma_long:
+        market_cycle = -1
+    else:
+        market_cycle = 0
+
+    monthly_avg = series.tail_sum(t, 30, window_start) / 30
+    price_anomaly = abs(ma_short - monthly_avg) / monthly_avg > 0.15
+
+    sentiment_score = rng.uniform(-1, 1) if p['use_sentiment'] else 0
+    lucky_trade = rng.random() < 0.05
+    luck_bonus = rng.uniform(0.1, 0.5) if lucky_trade else 0
+
+    trade_percentage = p['trade_percentage']
+    risk_level = p['risk_level']
+    if p['strategy_type'] == 'aggressive':
+        trade_percentage *= 1.5
+        risk_level *= 1.3
+    elif p['strategy_type'] == 'conservative':
+        trade_percentage *= 0.7
+        risk_level *= 0.7
+
+    buy_score = sell_score = 0.0
+
+    if price < ma_short < ma_medium:
+        buy_score += 0.2
+    elif price > ma_short > ma_medium:
+        sell_score += 0.2
+
+    if market_cycle == 1:
+        buy_score += 0.15
+    elif market_cycle == -1:
+        sell_score += 0.15
+
+    if price_anomaly:
+        if price < monthly_avg:
+            buy_score += 0.3
+        else:
+            sell_score += 0.3
+
+    buy_score += sentiment_score * 0.2
+    sell_score -= sentiment_score * 0.2
+
+    if volatility > 0.03:
+        trade_percentage *= 1 - volatility * 5
+
+    holding_value = account.shares * price
+    portfolio_value = holding_value + account.cash
+    if p['auto_balance'] and portfolio_value > 0:
+        target_percentage = 0.2 * risk_level
+        current_percentage = holding_value / portfolio_value
+        if current_percentage < target_percentage * 0.8:
+            buy_score += 0.25
+        elif current_percentage > target_percentage * 1.2:
+            sell_score += 0.25
+
+    if buy_score > 0.5 or (lucky_trade and rng.random() < 0.7):
+        buy_pct = trade_percentage * (1 + buy_score * risk_level) * (1 + luck_bonus)
+    if sell_score > 0.5 or (lucky_trade and rng.random() >= 0.7):
+        sell_pct = trade_percentage * (1 + sell_score * risk_level) * (1 + luck_bonus)
+
+    return buy_pct, sell_pct
+
+
+def _parse_params(rarity: str, settings: dict) -> dict:
+    """將助理設定 (字串) 轉換為回測參數，預設值與線上策略相同"""
+    if rarity == 'N':
+        return {
+            'buy_threshold': float(settings.get('buy_threshold', 0)),
+            'sell_threshold': float(settings.get('sell_threshold', float('inf'))),
+            'trade_percentage': float(settings.get('trade_percentage', 10)) / 100
+        }
+    if rarity == 'R':
+        return {
+            'buy_threshold': float(settings.get('buy_threshold', 0)),
+            'sell_threshold': float(settings.get('sell_threshold', float('inf'))),
+            'stop_loss': float(settings.get('stop_loss', 0)),
+            'ma_short': int(settings.get('ma_short', 5)),
+            'ma_long': int(settings.get('ma_long', 20)),
+            'trade_percentage': float(settings.get('trade_percentage', 15)) / 100
+        }
+    if rarity == 'SR':
+        return {
+            'use_rsi': _flag(settings, 'use_rsi'),
+            'rsi_buy': float(settings.get('rsi_buy', 30)),
+            'rsi_sell': float(settings.get('rsi_sell', 70)),
+            'use_macd': _flag(settings, 'use_macd'),
+            'use_pattern': _flag(settings, 'use_pattern'),
+            'risk_reward': float(settings.get('risk_reward', 2)),
+            'trade_percentage': float(settings.get('trade_percentage', 20)) / 100
+        }
+    if rarity == 'SSR':
+        return {
+            'strategy_type': settings.get('strategy_type', 'balanced'),
+            'risk_level': float(settings.get('risk_level', 0.5)),
+            'use_sentiment': _flag(settings, 'use_sentiment'),
+            'trade_percentage': float(settings.get('trade_percentage', 25)) / 100,
+            'auto_balance': _flag(settings, 'auto_balance')
+        }
+    raise ValueError(f"未知的助理稀有度: {rarity}")
+
+
+STRATEGIES = {
+    'N': _n_decision,
+    'R': _r_decision,
+    'SR': _sr_decision,
+    'SSR': _ssr_decision
+}
+
+
+def backtest_series(series: PriceSeries, rarity: str, settings: dict,
+                    initial_cash: float = 100000, seed: int = 0) -> BacktestResult:
+    """以單一參數組合回測一條價格序列"""
+    decide = STRATEGIES[rarity]
+    params = _parse_params(rarity, settings)
+    rng = random.Random(seed)
+    account = Account(initial_cash)
+    result = BacktestResult(rarity, series.stock_code, settings, initial_cash)
+
+    peak = initial_cash
+    max_drawdown = 0.0
+
+    for t, price in enumerate(series.prices):
+        buy_pct, sell_pct = decide(series, t, account, params, rng)
+
+        if buy_pct > 0 and account.buy(price, buy_pct):
+            result.buys += 1
+        if sell_pct > 0 and account.sell(price, sell_pct):
+            result.sells += 1
+
+        equity = account.cash + account.shares * price
+        if equity > peak:
+            peak = equity
+        elif peak > 0:
+            drawdown = (peak - equity) / peak
+            if drawdown > max_drawdown:
+                max_drawdown = drawdown
+
+    result.ticks = len(series)
+    result.max_drawdown = max_drawdown
+    if series.prices:
+        result.final_value = account.cash + account.shares * series.prices[-1]
+    return result
+
+
+def run_backtest(series_by_code: Dict[str, List[float]], rarity: str, param_sets: List[dict],
+                 initial_cash: float = 100000, seed: int = 0) -> List[BacktestResult]:
+    """在多支股票 × 多組參數上回測，前綴和每支股票只計算一次"""
+    prepared = [PriceSeries(code, prices) for code, prices in series_by_code.items()]
+    results = []
+
+    for settings in param_sets:
+        for series in prepared:
+            results.append(backtest_series(series, rarity, settings, initial_cash, seed))
+
+    return results
+
+
+def summarize(results: List[BacktestResult]) -> List[dict]:
+    """依參數組合彙總回測結果，以平均報酬率排序"""
+    groups = {}
+    for result in results:
+        key = tuple(sorted((k, str(v)) for k, v in result.params.items()))
+        groups.setdefault(key, []).append(result)
+
+    summary = []
+    for key, group in groups.items():
+        summary.append({
+            'params': group[0].params,
+            'stocks': len(group),
+            'avg_pnl_pct': sum(r.pnl_pct for r in group) / len(group),
+            'worst_drawdown': max(r.max_drawdown for r in group),
+            'total_trades': sum(r.trades for r in group)
+        })
+
+    summary.sort(key=lambda item: item['avg_pnl_pct'], reverse=True)
+    return summary
+
+
+def generate_synthetic_series(length: int, start_price: float = 100.0, drift: float = 0.0,
+                              volatility: float = 0.02, seed: Optional[int] = None) -> List[float]:
+    """以幾何布朗運動產生模擬價格序列"""
+    rng = random.Random(seed)
+    prices = [start_price]
+    price = start_price
+
+    for _ in range(length - 1):
+        price *= math.exp(drift - volatility * volatility / 2 + volatility * rng.gauss(0, 1))
+        prices.append(round(max(price, 0.01), 2))
+
+    return prices
+
+
+async def load_price_series(stock_codes: List[str] = None, min_length: int = 30) -> Dict[str, List[float]]:
+    """從 stock_price_history 載入每支股票由舊到新的價格序列"""
+    query = '''
+    SELECT s.stock_code, h.price
+    FROM stock_price_history h
+    JOIN stocks s ON s.stock_id = h.stock_id
+    ORDER BY h.stock_id, h.date
+    '''
+
+    rows = await execute_query("stock", query, fetch_type='all')
+    series = {}
+
+    for stock_code, price in rows or []:
+        if stock_codes and stock_code not in stock_codes:
+            continue
+        series.setdefault(stock_code, []).append(price)
+
+    return {code: prices for code, prices in series.items() if len(prices) >= min_length}
+
+
+if __name__ == "__main__":
+    # 以模擬資料做簡單的效能測試
+    series = {f"SIM{i}": generate_synthetic_series(365 * 5, seed=i) for i in range(20)}
+    param_sets = [{'use_rsi': 'true', 'rsi_buy': str(buy), 'rsi_sell': str(sell)}
+                  for buy in (20, 25, 30, 35) for sell in (65, 70, 75, 80)]
+
+    start = time.perf_counter()
+    results = run_backtest(series, 'SR', param_sets)
+    elapsed = time.perf_counter() - start
+
+    ticks = sum(r.ticks for r in results)
+    print(f"回測 {len(results)} 組，共 {ticks:,} 個時間點，耗時 {elapsed:.2f} 秒")
+    for row in summarize(results)[:5]:
+        print(row)
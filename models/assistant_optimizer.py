@@ -0,0 +1,235 @@
+import os
+import asyncio
+import itertools
+import random
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+from models.assistant_backtest import PriceSeries, backtest_series, load_price_series
+
+# 各稀有度可調整的參數，門檻以股價中位數的倍數表示，回測前轉換成實際價格
+SEARCH_SPACES = {
+    'N': {
+        'buy_threshold': [0.8, 0.85, 0.9, 0.95],
+        'sell_threshold': [1.05, 1.1, 1.15, 1.2, 1.3],
+        'trade_percentage': [5, 10, 20, 30]
+    },
+    'R': {
+        'buy_threshold': [0, 0.85, 0.9, 0.95],
+        'sell_threshold': [0, 1.05, 1.1, 1.2],
+        'ma_short': [3, 5, 7, 10],
+        'ma_long': [15, 20, 25, 30],
+        'stop_loss': [0, 5, 10, 15],
+        'trade_percentage': [10, 15, 25]
+    },
+    'SR': {
+        'rsi_buy': [20, 25, 30, 35],
+        'rsi_sell': [65, 70, 75, 80],
+        'risk_reward': [1, 2, 3],
+        'trade_percentage': [10, 20, 30]
+    },
+    'SSR': {
+        'strategy_type': ['conservative', 'balanced', 'aggressive'],
+        'risk_level': [0.3, 0.5, 0.7, 0.9],
+        'trade_percentage': [10, 25, 40]
+    }
+}
+
+# 以股價倍數表示的門檻參數
+RELATIVE_KEYS = ('buy_threshold', 'sell_threshold')
+
+_executor: Optional[ProcessPoolExecutor] = None
+_workers = max(1, (os.cpu_count() or 2) - 1)
+_result_cache: OrderedDict = OrderedDict()
+_RESULT_CACHE_SIZE = 20000
+
+
+def get_executor() -> ProcessPoolExecutor:
+    """獲取共用的行程池"""
+    global _executor
+    if _executor is None:
+        # 機器人行程已有 aiosqlite 執行緒與事件迴圈，fork 多執行緒的行程可能讓子行程死結，改用 spawn
+        _executor = ProcessPoolExecutor(max_workers=_workers, mp_context=multiprocessing.get_context("spawn"))
+    return _executor
+
+
+def shutdown_executor():
+    """關閉行程池 (Cog 卸載時呼叫)"""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def _median(values: List[float]) -> float:
+    ordered = sorted(values)
+    middle = len(ordered) // 2
+    if len(ordered) % 2:
+        return ordered[middle]
+    return (ordered[middle - 1] + ordered[middle]) / 2
+
+
+def _materialize(candidate: dict, reference_price: float) -> dict:
+    """將相對門檻轉換成實際價格，並轉成與助理設定相同的字串格式"""
+    settings = {}
+    for key, value in candidate.items():
+        if key in RELATIVE_KEYS:
+            # 0 表示不使用門檻
+            if not value:
+                continue
+            value = round(reference_price * value, 2)
+        settings[key] = str(value)
+    return settings
+
+
+def _is_valid(rarity: str, candidate: dict) -> bool:
+    if rarity == 'R' and candidate.get('ma_short', 0) >= candidate.get('ma_long', 1):
+        return False
+    if rarity == 'SR' and candidate.get('rsi_buy', 0) >= candidate.get('rsi_sell', 100):
+        return False
+    return True
+
+
+def grid_candidates(rarity: str) -> List[dict]:
+    """網格搜尋的所有組合"""
+    space = SEARCH_SPACES[rarity]
+    keys = list(space)
+    candidates = [dict(zip(keys, values)) for values in itertools.product(*(space[k] for k in keys))]
+    return [c for c in candidates if _is_valid(rarity, c)]
+
+
+def random_candidates(rarity: str, samples: int, seed: Optional[int] = None) -> List[dict]:
+    """隨機搜尋的組合 (不重複)"""
+    space = SEARCH_SPACES[rarity]
+    rng = random.Random(seed)
+    seen = set()
+    candidates = []
+
+    # 避免在組合數不足時無限迴圈
+    for _ in range(samples * 20):
+        if len(candidates) >= samples:
+            break
+        candidate = {key: rng.choice(values) for key, values in space.items()}
+        key = tuple(sorted(candidate.items()))
+        if key in seen or not _is_valid(rarity, candidate):
+            continue
+        seen.add(key)
+        candidates.append(candidate)
+
+    return candidates
+
+
+def score(result: dict, drawdown_penalty: float = 0.5) -> float:
+    """排序分數：報酬率扣除部分最大回撤"""
+    return result['pnl_pct'] - drawdown_penalty * result['max_drawdown'] * 100
+
+
+def _evaluate_batch(stock_code: str, prices: List[float], rarity: str, settings_list: List[dict],
+                    initial_cash: float) -> List[dict]:
+    """在子行程中回測一批參數組合"""
+    series = PriceSeries(stock_code, prices)
+    results = []
+    for settings in settings_list:
+        result = backtest_series(series, rarity, settings, initial_cash)
+        results.append({
+            'settings': settings,
+            'pnl_pct': result.pnl_pct,
+            'max_drawdown': result.max_drawdown,
+            'trades': result.trades
+        })
+    return results
+
+
+def _series_fingerprint(prices: List[float]) -> tuple:
+    return (len(prices), round(sum(prices), 4), prices[-1] if prices else None)
+
+
+def _cache_key(stock_code: str, fingerprint: tuple, rarity: str, settings: dict, initial_cash: float) -> tuple:
+    return (stock_code, fingerprint, rarity, initial_cash, tuple(sorted(settings.items())))
+
+
+def _cache_put(key: tuple, value: dict):
+    _result_cache[key] = value
+    _result_cache.move_to_end(key)
+    while len(_result_cache) > _RESULT_CACHE_SIZE:
+        _result_cache.popitem(last=False)
+
+
+async def optimize_stock(stock_code: str, prices: List[float], rarity: str, method: str = 'grid',
+                         samples: int = 100, top_n: int = 3, batch_size: int = 16, patience: int = 3,
+                         min_improvement: float = 0.1, initial_cash: float = 100000,
+                         seed: Optional[int] = None) -> List[dict]:
+    """對單一股票搜尋最佳參數
+
+    候選組合分批送到行程池回測，連續 patience 輪最佳分數進步不到 min_improvement 時提早停止。
+    """
+    if method == 'random':
+        candidates = random_candidates(rarity, samples, seed)
+    else:
+        # 打亂網格順序，提早停止時已回測的組合才會分散在整個搜尋空間，而不是集中在前幾個參數值
+        candidates = grid_candidates(rarity)
+        random.Random(seed).shuffle(candidates)
+
+    reference_price = _median(prices)
+    fingerprint = _series_fingerprint(prices)
+    loop = asyncio.get_running_loop()
+    executor = get_executor()
+
+    results = []
+    best = float('-inf')
+    stale_rounds = 0
+
+    # 每一輪送出與工作行程數量相同的批次
+    round_size = batch_size * _workers
+    for round_start in range(0, len(candidates), round_size):
+        pending = []
+        for candidate in candidates[round_start:round_start + round_size]:
+            settings = _materialize(candidate, reference_price)
+            cached = _result_cache.get(_cache_key(stock_code, fingerprint, rarity, settings, initial_cash))
+            if cached is not None:
+                results.append(cached)
+            else:
+                pending.append(settings)
+
+        batches = [pending[i:i + batch_size] for i in range(0, len(pending), batch_size)]
+        batch_results = await asyncio.gather(*(
+            loop.run_in_executor(executor, _evaluate_batch, stock_code, prices, rarity, batch, initial_cash)
+            for batch in batches
+        ))
+
+        for batch in batch_results:
+            for result in batch:
+                _cache_put(_cache_key(stock_code, fingerprint, rarity, result['settings'], initial_cash), result)
+                results.append(result)
+
+        round_best = max((score(r) for r in results), default=float('-inf'))
+        if round_best > best + min_improvement:
+            best = round_best
+            stale_rounds = 0
+        else:
+            stale_rounds += 1
+            if stale_rounds >= patience:
+                break
+
+    results.sort(key=score, reverse=True)
+    return results[:top_n]
+
+
+async def optimize_assistant_settings(rarity: str, stock_codes: List[str], method: str = 'grid',
+                                      samples: int = 100, top_n: int = 3, min_length: int = 60,
+                                      seed: Optional[int] = None) -> Dict[str, List[dict]]:
+    """以資料庫中的價格歷史為每支股票找出最佳設定"""
+    series = await load_price_series(stock_codes, min_length)
+    top_configs = {}
+
+    for stock_code in stock_codes:
+        prices = series.get(stock_code)
+        if not prices:
+            top_configs[stock_code] = []
+            continue
+        top_configs[stock_code] = await optimize_stock(
+            stock_code, prices, rarity, method, samples, top_n, seed=seed
+        )
+
+    return top_configs
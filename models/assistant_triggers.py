@@ -0,0 +1,83 @@
+from bisect import bisect_left, bisect_right
+from typing import Dict, List, Set, Tuple
+
+
+class StockTriggers:
+    """單一股票的買入/賣出門檻，各自依門檻排序"""
+    __slots__ = ('buy_thresholds', 'buy_ids', 'sell_thresholds', 'sell_ids')
+
+    def __init__(self):
+        self.buy_thresholds: List[float] = []
+        self.buy_ids: List[int] = []
+        self.sell_thresholds: List[float] = []
+        self.sell_ids: List[int] = []
+
+    def add(self, assistant_id: int, buy_threshold: float, sell_threshold: float):
+        """加入一位助理的門檻"""
+        if buy_threshold > 0:
+            index = bisect_right(self.buy_thresholds, buy_threshold)
+            self.buy_thresholds.insert(index, buy_threshold)
+            self.buy_ids.insert(index, assistant_id)
+
+        if sell_threshold < float('inf'):
+            index = bisect_right(self.sell_thresholds, sell_threshold)
+            self.sell_thresholds.insert(index, sell_threshold)
+            self.sell_ids.insert(index, assistant_id)
+
+
+class ThresholdTriggerIndex:
+    """依價格穿越門檻觸發助理的索引
+
+    買入條件為 價格 <= 門檻，價格由 old 下跌到 new 時，門檻落在 [new, old) 的助理由不符合變為符合；
+    賣出條件為 價格 >= 門檻，價格由 old 上漲到 new 時，門檻落在 (old, new] 的助理由不符合變為符合。
+    """
+
+    def __init__(self):
+        self._stocks: Dict[str, StockTriggers] = {}
+        self.source = None  # 建立索引時使用的設定快照
+        self.evaluated_versions: Dict[int, int] = {}  # assistant_id -> 已評估過的設定版本
+
+    def rebuild(self, configs: dict, rarities: Tuple[str, ...] = ('N',)):
+        """依助理設定快照重建索引"""
+        stocks: Dict[str, StockTriggers] = {}
+
+        for config in configs.values():
+            if config.rarity not in rarities:
+                continue
+
+            for stock_code in config.monitored_stocks:
+                settings = config.settings_for(stock_code)
+                try:
+                    buy_threshold = float(settings.get('buy_threshold', 0))
+                    sell_threshold = float(settings.get('sell_threshold', float('inf')))
+                except (ValueError, TypeError):
+                    continue
+
+                if stock_code not in stocks:
+                    stocks[stock_code] = StockTriggers()
+                stocks[stock_code].add(config.assistant_id, buy_threshold, sell_threshold)
+
+        self._stocks = stocks
+        self.source = configs
+
+    def is_current(self, configs) -> bool:
+        """索引是否由目前的設定快照建立"""
+        return configs is not None and self.source is configs
+
+    def crossed(self, stock_code: str, old_price: float, new_price: float) -> Set[int]:
+        """獲取價格由 old_price 變為 new_price 時條件成立的助理ID"""
+        triggers = self._stocks.get(stock_code)
+        if not triggers or old_price is None or new_price == old_price:
+            return set()
+
+        if new_price < old_price:
+            start = bisect_left(triggers.buy_thresholds, new_price)
+            end = bisect_left(triggers.buy_thresholds, old_price)
+            return set(triggers.buy_ids[start:end])
+
+        start = bisect_right(triggers.sell_thresholds, old_price)
+        end = bisect_right(triggers.sell_thresholds, new_price)
+        return set(triggers.sell_ids[start:end])
+
+    def __contains__(self, stock_code: str) -> bool:
+        return stock_code in self._stocks
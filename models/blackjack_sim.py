@@ -0,0 +1,179 @@
+import os
+import math
+import time
+import random
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Tuple
+from models.games import Shoe, Hand, CARD_VALUES
+
+# 與 cogs/games/blackjack 相同的規則：
+# - 玩家兩張牌、莊家一張明牌 (沒有暗牌，莊家在玩家停牌後才補牌)
+# - 玩家只能抽牌或停牌，沒有加倍、分牌、投降，21點也沒有 3:2 獎勵
+# - 莊家 17 點 (含軟17) 以上停牌
+# - 贏了淨賺 1 倍下注，平手退還下注
+DEALER_STANDS_ON = 17
+WIN_PAYOUT = 1
+
+# 基本策略 (只有抽牌/停牌)：{玩家點數: 莊家明牌點數在此集合中時停牌}
+# 莊家明牌點數 A 以 1 表示
+HARD_STAND = {
+    12: frozenset((4, 5, 6)),
+    13: frozenset((2, 3, 4, 5, 6)),
+    14: frozenset((2, 3, 4, 5, 6)),
+    15: frozenset((2, 3, 4, 5, 6)),
+    16: frozenset((2, 3, 4, 5, 6)),
+}
+SOFT_STAND = {
+    18: frozenset((2, 3, 4, 5, 6, 7, 8)),
+}
+
+
+def should_hit(hand: Hand, dealer_up: int) -> bool:
+    """依基本策略決定是否抽牌"""
+    total = hand.get_value()
+
+    if hand.is_soft:
+        if total >= 19:
+            return False
+        if total in SOFT_STAND:
+            return dealer_up not in SOFT_STAND[total]
+        return True
+
+    if total >= 17:
+        return False
+    if total in HARD_STAND:
+        return dealer_up not in HARD_STAND[total]
+    return True
+
+
+def play_hand(shoe: Shoe, player: Hand, dealer: Hand) -> int:
+    """模擬一手牌，返回以下注為單位的淨輸贏 (1 / 0 / -1)"""
+    player.clear()
+    dealer.clear()
+    shoe.reshuffle_if_needed()
+
+    player.add_card(shoe.draw())
+    player.add_card(shoe.draw())
+    up_card = shoe.draw()
+    dealer.add_card(up_card)
+    dealer_up = CARD_VALUES[up_card]
+
+    while should_hit(player, dealer_up):
+        player.add_card(shoe.draw())
+
+    player_value = player.get_value()
+    if player_value > 21:
+        return -1
+
+    while dealer.get_value() < DEALER_STANDS_ON:
+        dealer.add_card(shoe.draw())
+
+    dealer_value = dealer.get_value()
+    if dealer_value > 21 or player_value > dealer_value:
+        return WIN_PAYOUT
+    if player_value < dealer_value:
+        return -1
+    return 0
+
+
+def simulate_chunk(hands: int, seed: int, decks: int = 1, penetration: float = 0.0) -> Tuple[int, int, int, int]:
+    """模擬一批牌局，返回 (總淨輸贏, 勝場, 平手, 敗場)
+
+    penetration 為 0 時每手都重新洗牌 (與遊戲中每局新牌組相同)。
+    """
+    shoe = Shoe(decks, penetration, random.Random(seed))
+    player = Hand()
+    dealer = Hand()
+
+    net = wins = pushes = losses = 0
+    for _ in range(hands):
+        result = play_hand(shoe, player, dealer)
+        net += result
+        if result > 0:
+            wins += 1
+        elif result < 0:
+            losses += 1
+        else:
+            pushes += 1
+
+    return net, wins, pushes, losses
+
+
+def estimate_house_edge(hands: int = 1000000, workers: int = None, seed: int = 0,
+                        decks: int = 1, penetration: float = 0.0, chunk_size: int = 50000) -> Dict:
+    """以多個行程平行模擬，估計莊家優勢與 95% 信賴區間"""
+    workers = workers or max(1, (os.cpu_count() or 2) - 1)
+    chunks = [chunk_size] * (hands // chunk_size)
+    if hands % chunk_size:
+        chunks.append(hands % chunk_size)
+
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(simulate_chunk, size, seed * 1000003 + i, decks, penetration)
+            for i, size in enumerate(chunks)
+        ]
+        results = [future.result() for future in futures]
+    elapsed = time.perf_counter() - started
+
+    net = sum(r[0] for r in results)
+    wins = sum(r[1] for r in results)
+    pushes = sum(r[2] for r in results)
+    losses = sum(r[3] for r in results)
+
+    # 每手結果只有 1 / 0 / -1，平方和等於非平手的手數
+    mean = net / hands
+    variance = (wins + losses) / hands - mean ** 2
+    margin = 1.96 * math.sqrt(variance / hands)
+
+    return {
+        'hands': hands,
+        'house_edge': -mean,
+        'ci_low': -mean - margin,
+        'ci_high': -mean + margin,
+        'win_rate': wins / hands,
+        'push_rate': pushes / hands,
+        'loss_rate': losses / hands,
+        'std_per_hand': math.sqrt(variance),
+        'elapsed': elapsed,
+        'workers': workers
+    }
+
+
+def money_sink(report: Dict, bet_sizes: List[int], hands_per_day: int = 1) -> List[Tuple[int, float, float, float]]:
+    """每種下注金額的預期回收量，返回 [(下注, 每手期望, 下限, 上限)]"""
+    return [
+        (
+            bet,
+            report['house_edge'] * bet * hands_per_day,
+            report['ci_low'] * bet * hands_per_day,
+            report['ci_high'] * bet * hands_per_day
+        )
+        for bet in bet_sizes
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="21點莊家優勢模擬")
+    parser.add_argument('--hands', type=int, default=1000000, help="模擬手數")
+    parser.add_argument('--workers', type=int, default=None, help="平行行程數")
+    parser.add_argument('--seed', type=int, default=0, help="隨機種子")
+    parser.add_argument('--decks', type=int, default=1, help="牌靴中的牌副數")
+    parser.add_argument('--penetration', type=float, default=0.0, help="切牌位置 (0 表示每手重新洗牌)")
+    parser.add_argument('--bets', type=int, nargs='+', default=[100, 1000, 10000], help="計算回收量的下注金額")
+    parser.add_argument('--hands-per-day', type=int, default=1, help="每天每位玩家的手數")
+    args = parser.parse_args()
+
+    report = estimate_house_edge(args.hands, args.workers, args.seed, args.decks, args.penetration)
+
+    print(f"模擬 {report['hands']:,} 手，{report['workers']} 個行程，耗時 {report['elapsed']:.2f} 秒")
+    print(f"莊家優勢: {report['house_edge']:.3%} (95% 信賴區間 {report['ci_low']:.3%} ~ {report['ci_high']:.3%})")
+    print(f"勝 {report['win_rate']:.2%} | 平 {report['push_rate']:.2%} | 敗 {report['loss_rate']:.2%} | 每手標準差 {report['std_per_hand']:.3f}")
+    print("預期回收 Silva幣:")
+    for bet, expected, low, high in money_sink(report, args.bets, args.hands_per_day):
+        print(f"  下注 {bet:,}: {expected:,.2f} ({low:,.2f} ~ {high:,.2f}) / {args.hands_per_day} 手")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,5 @@
 import datetime
-from utils.database import get_db_connection, execute_query, execute_transaction, table_exists, column_exists
+from utils.database import get_db_connection, execute_query, execute_transaction, execute_batch, table_exists, column_exists
 
 class Currency:
     """Silva幣系統模型"""
@@ -129,6 +129,49 @@ class Currency:
             print(f"更新餘額時發生錯誤: {e}")
             return False
 
+    async def apply_balance_changes(self, changes, description: str, usernames: dict = None) -> bool:
+        """在同一個交易中批次調整多個用戶的餘額
+
+        Args:
+            changes: {user_id: 變動金額} 或 (user_id, 變動金額) 的列表
+            description (str): 寫入交易歷史的說明
+            usernames (dict): 選填，{user_id: 用戶名稱}
+        """
+        await self.setup_database()
+
+        # 合併同一用戶的多筆變動
+        totals = {}
+        for user_id, amount in (changes.items() if isinstance(changes, dict) else changes):
+            totals[user_id] = totals.get(user_id, 0) + int(amount)
+
+        totals = {user_id: amount for user_id, amount in totals.items() if amount}
+        if not totals:
+            return True
+
+        usernames = usernames or {}
+
+        return await execute_batch(self.db_name, [
+            (
+                '''
+                INSERT INTO user_currency (user_id, balance, username, updated_at)
+                VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+                ON CONFLICT(user_id)
+                DO UPDATE SET
+                    balance = balance + excluded.balance,
+                    username = COALESCE(excluded.username, username),
+                    updated_at = CURRENT_TIMESTAMP
+                ''',
+                [(user_id, amount, usernames.get(user_id)) for user_id, amount in totals.items()]
+            ),
+            (
+                '''
+                INSERT INTO transaction_history (user_id, amount, balance_after, description)
+                VALUES (?, ?, (SELECT balance FROM user_currency WHERE user_id = ?), ?)
+                ''',
+                [(user_id, amount, user_id, description) for user_id, amount in totals.items()]
+            )
+        ])
+
     async def get_transaction_history(self, user_id: int, limit: int = 10) -> list:
         """獲取用戶的交易歷史"""
         # 確保資料庫已設置
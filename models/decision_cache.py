@@ -0,0 +1,55 @@
+from collections import OrderedDict
+from typing import Hashable
+
+
+class DecisionCache:
+    """助理交易決策的 LRU 快取
+
+    鍵為 (assistant_id, stock_id, price_version, settings_version)，
+    同一組輸入已經決策過時直接略過，不重新計算也不重複下單。
+    """
+
+    def __init__(self, maxsize: int = 2048):
+        self.maxsize = maxsize
+        self._entries: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def seen(self, key: Hashable) -> bool:
+        """檢查輸入是否已決策過，同時更新命中統計"""
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return True
+
+        self.misses += 1
+        return False
+
+    def record(self, key: Hashable, decision=None):
+        """記錄一次決策，超過容量時淘汰最久未使用的項目"""
+        self._entries[key] = decision
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        """清空快取 (保留統計)"""
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        """獲取快取統計"""
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups else 0.0
+        }
+
+    def __len__(self):
+        return len(self._entries)
@@ -1,71 +1,123 @@
 import random
-from typing import List, Optional, Dict, Set
+from array import array
+from functools import lru_cache
+from typing import List, Optional, Dict, Set, Tuple
 
 # 卡牌遊戲相關類別
-class Card:
-    """卡牌類別"""
-    def __init__(self, suit: str, value: str):
-        self.suit = suit
-        self.value = value
-        
-    def __str__(self):
-        suit_emoji = {
-            "♠": "♠️",
-            "♥": "♥️",
-            "♦": "♦️",
-            "♣": "♣️"
-        }
-        return f"{suit_emoji[self.suit]}{self.value}"
-
-class Deck:
-    """牌組類別"""
-    def __init__(self):
-        suits = ["♠", "♥", "♦", "♣"]
-        values = ["A", "2", "3", "4", "5", "6", "7", "8", "9", "10", "J", "Q", "K"]
-        self.cards = [Card(suit, value) for suit in suits for value in values]
-        random.shuffle(self.cards)
-        
-    def draw(self) -> Optional[Card]:
-        """抽一張牌"""
-        if not self.cards:
-            return None
-        return self.cards.pop()
+# 卡牌以 0-51 的整數表示：花色 = card // 13，點數 = card % 13 (0 為 A，12 為 K)
+SUITS = ("♠️", "♥️", "♦️", "♣️")
+RANKS = ("A", "2", "3", "4", "5", "6", "7", "8", "9", "10", "J", "Q", "K")
+
+# 預先計算的查表
+CARD_STRINGS = tuple(f"{suit}{rank}" for suit in SUITS for rank in RANKS)
+CARD_VALUES = tuple(min(rank + 1, 10) for _ in SUITS for rank in range(13))  # A 先算 1 點
+CARD_IS_ACE = tuple(rank == 0 for _ in SUITS for rank in range(13))
+
+def card_str(card: int) -> str:
+    """卡牌的顯示文字"""
+    return CARD_STRINGS[card]
+
+class Shoe:
+    """牌靴：以位元組陣列儲存多副牌，抽到切牌位置後於下一局前重新洗牌"""
+    __slots__ = ('decks', 'cards', 'position', 'cut_position', 'rng')
+
+    def __init__(self, decks: int = 1, penetration: float = 0.75, rng: random.Random = None):
+        self.decks = decks
+        self.cards = array('B', range(52)) * decks
+        self.cut_position = int(len(self.cards) * penetration)
+        self.rng = rng or random
+        self.position = 0
+        self.shuffle()
+
+    def shuffle(self):
+        """重新洗牌
+
+        採用延遲洗牌：每次抽牌時才從剩餘的牌中隨機交換一張到目前位置，
+        結果與完整洗牌相同，但只需處理實際抽出的牌。
+        """
+        self.position = 0
+
+    @property
+    def needs_shuffle(self) -> bool:
+        """是否已經抽過切牌"""
+        return self.position >= self.cut_position
+
+    def reshuffle_if_needed(self):
+        """每局開始前呼叫，抽過切牌就重新洗牌"""
+        if self.position >= self.cut_position:
+            self.shuffle()
+
+    def remaining(self) -> int:
+        """剩餘牌數"""
+        return len(self.cards) - self.position
+
+    def draw(self) -> int:
+        """抽一張牌 (牌用完時立即重新洗牌)"""
+        cards = self.cards
+        position = self.position
+        if position >= len(cards):
+            self.shuffle()
+            position = 0
+
+        swap = self.rng.randrange(position, len(cards))
+        card = cards[swap]
+        cards[swap] = cards[position]
+        cards[position] = card
+        self.position = position + 1
+        return card
 
 class Hand:
-    """手牌類別"""
+    """手牌類別 (點數隨加牌增量計算)"""
+    __slots__ = ('cards', 'hard_total', 'has_ace')
+
     def __init__(self):
-        self.cards: List[Card] = []
-        
-    def add_card(self, card: Card):
+        self.cards: List[int] = []
+        self.hard_total = 0   # A 全部算 1 點的總和
+        self.has_ace = False
+
+    def add_card(self, card: int):
         """添加一張牌到手牌"""
         self.cards.append(card)
-        
+        self.hard_total += CARD_VALUES[card]
+        if CARD_IS_ACE[card]:
+            self.has_ace = True
+
+    def clear(self):
+        """清空手牌以便重複使用"""
+        self.cards.clear()
+        self.hard_total = 0
+        self.has_ace = False
+
     def get_value(self) -> int:
-        """計算手牌點數"""
-        value = 0
-        aces = 0
-        
-        for card in self.cards:
-            if card.value in ["J", "Q", "K"]:
-                value += 10
-            elif card.value == "A":
-                aces += 1
-            else:
-                value += int(card.value)
-                
-        for _ in range(aces):
-            if value + 11 <= 21:
-                value += 11
-            else:
-                value += 1
-                
-        return value
-    
+        """計算手牌點數 (最多一張 A 可算 11 點)"""
+        if self.has_ace and self.hard_total <= 11:
+            return self.hard_total + 10
+        return self.hard_total
+
+    @property
+    def is_soft(self) -> bool:
+        """是否有 A 算作 11 點"""
+        return self.has_ace and self.hard_total <= 11
+
     def __str__(self) -> str:
         """返回手牌字串表示"""
-        return " ".join(str(card) for card in self.cards)
+        return " ".join(CARD_STRINGS[card] for card in self.cards)
 
 # 賽馬遊戲相關類別
+@lru_cache(maxsize=1024)
+def render_track(track_length: int, position: int, emoji: str) -> str:
+    """產生一匹馬的賽道字串 (位置與馬匹固定時直接取快取)"""
+    position = min(position, track_length - 1)
+    return "." * position + emoji + "." * (track_length - position - 1)
+
+def event_effect(event: str) -> int:
+    """特殊事件對移動的影響：1 為加速、-1 為後退、0 為無影響"""
+    if "向前" in event or "提升" in event or "大增" in event:
+        return 1
+    if "後退" in event or "滑倒" in event or "停下" in event or "繞路" in event:
+        return -1
+    return 0
+
 class Horse:
     """馬匹類別"""
     def __init__(self, name: str, emoji: str, number: int):
@@ -83,6 +135,8 @@ class HorseRace:
         self.is_race_active = False
         self.betting_open = False
         self.bets: Dict[int, Dict[int, int]] = {}  # {user_id: {horse_number: amount}}
+        self.settlement = None  # 結算任務
+        self.settled = False    # 獎金是否已發放
         self.horses = [
             Horse("damn", "🐎", 1),
             Horse("gayco", "🏃", 2),
@@ -92,6 +146,7 @@ class HorseRace:
         ]
         self.race_channel = None
         self.track_length = 20
+        self.event_chance = 0.1  # 每格觸發特殊事件的機率 (每匹馬每場最多一次)
         self.special_events = [
             "突然加速！向前衝了3格！",
             "被絆了一下...後退1格",
@@ -105,6 +160,68 @@ class HorseRace:
             "被蜜蜂追趕，速度大增！"
         ]
         
+    def simulate_race(self, rng: random.Random = None) -> Tuple[List[str], List[Horse]]:
+        """預先模擬整場比賽
+
+        返回 (每一格畫面的賽道文字, 依抵達順序排列的馬匹)，
+        顯示時只需要依序送出畫面，結果在比賽開始前就已確定。
+        """
+        rng = rng or random
+        track_length = self.track_length
+        horse_count = len(self.horses)
+
+        positions = [0] * horse_count
+        finished = [False] * horse_count
+        events: List[Optional[str]] = [None] * horse_count
+        finish_order: List[int] = []
+        frames: List[str] = []
+
+        while len(finish_order) < horse_count:
+            arrivals = []
+            for i in range(horse_count):
+                if finished[i]:
+                    continue
+
+                # 隨機移動1-3格
+                move = rng.randint(1, 3)
+
+                # 依機率觸發特殊事件
+                if not events[i] and rng.random() < self.event_chance:
+                    event = rng.choice(self.special_events)
+                    events[i] = event
+                    effect = event_effect(event)
+                    if effect > 0:
+                        move += rng.randint(2, 3)
+                    elif effect < 0:
+                        move = -rng.randint(1, 2)
+
+                new_position = positions[i] + move
+                positions[i] = max(0, min(track_length, new_position))
+
+                # 檢查是否到達終點
+                if positions[i] >= track_length:
+                    finished[i] = True
+                    arrivals.append((new_position - track_length, rng.random(), i))
+
+            # 同一格內抵達的馬匹依衝過終點的距離排名，距離相同時隨機決定 (不偏袒編號小的馬)
+            arrivals.sort(reverse=True)
+            finish_order.extend(i for _, _, i in arrivals)
+
+            # 產生這一格的畫面
+            lines = []
+            for i, horse in enumerate(self.horses):
+                event_display = f" 👉 {events[i]}" if events[i] else ""
+                lines.append(f"#{horse.number} {render_track(track_length, positions[i], horse.emoji)}{event_display}")
+            frames.append("\n".join(lines) + "\n")
+
+        # 同步最終狀態到馬匹物件
+        for i, horse in enumerate(self.horses):
+            horse.position = positions[i]
+            horse.finished = finished[i]
+            horse.special_event = events[i]
+
+        return frames, [self.horses[i] for i in finish_order]
+
     def place_bet(self, user_id: int, horse_number: int, amount: int) -> bool:
         """玩家下注"""
         if not self.betting_open:
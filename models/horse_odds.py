@@ -0,0 +1,198 @@
+import math
+import time
+import random
+import asyncio
+from functools import lru_cache
+from typing import List, Tuple
+from models.games import event_effect
+
+# numpy 不是本專案的依賴，預設部署走純 Python 模擬 (FALLBACK_SAMPLES 場)；
+# 另外安裝 numpy 時才會改用向量化模擬並使用 DEFAULT_SAMPLES 場
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# 預設模擬場數 (需要 numpy)
+DEFAULT_SAMPLES = 200000
+# 純 Python 模擬的場數上限 (相同參數只模擬一次)，五匹馬時勝率誤差約 ±0.4%
+FALLBACK_SAMPLES = 40000
+# 顯示賠率時可用的刻度，依抽樣誤差選擇
+ODDS_STEPS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+
+class RaceOdds:
+    """一組比賽參數下各馬匹的勝率估計"""
+    __slots__ = ('win', 'place', 'samples', 'elapsed')
+
+    def __init__(self, win: Tuple[float, ...], place: Tuple[float, ...], samples: int, elapsed: float):
+        self.win = win          # 第一名機率
+        self.place = place      # 前二名機率
+        self.samples = samples  # 實際模擬場數
+        self.elapsed = elapsed  # 模擬耗時 (秒)
+
+    def fair_odds(self, index: int) -> float:
+        """以勝率換算的公平賠率 (含本金)"""
+        probability = self.win[index]
+        return 1 / probability if probability > 0 else float('inf')
+
+    def odds_margin(self, index: int) -> float:
+        """公平賠率的 95% 信賴區間半寬 (抽樣誤差)"""
+        probability = self.win[index]
+        if probability <= 0:
+            return float('inf')
+        return 1.96 * math.sqrt(probability * (1 - probability) / self.samples) / probability ** 2
+
+    def display_odds(self, index: int) -> float:
+        """依抽樣誤差取整的公平賠率，避免把模擬誤差顯示成馬匹間的差異"""
+        odds = self.fair_odds(index)
+        if odds == float('inf'):
+            return odds
+
+        # 所有馬匹使用同一個刻度，刻度至少是誤差區間的寬度
+        margin = max(self.odds_margin(i) for i in range(len(self.win)) if self.win[i] > 0)
+        step = next((step for step in ODDS_STEPS if step >= 2 * margin), ODDS_STEPS[-1])
+        return round(round(odds / step) * step, 2)
+
+
+def _simulate_numpy(horse_count: int, track_length: int, event_chance: float,
+                    effects: Tuple[int, ...], samples: int, seed=None):
+    """以 numpy 同時模擬所有比賽，返回每場每匹馬的名次 (0 為第一名)"""
+    rng = np.random.default_rng(seed)
+    shape = (samples, horse_count)
+    effect_table = np.array(effects or (0,), dtype=np.int8)
+    # 賽道較短時用 int8 減少記憶體頻寬
+    position_type = np.int8 if track_length < 120 else np.int16
+
+    positions = np.zeros(shape, dtype=position_type)
+    finished = np.zeros(shape, dtype=bool)
+    has_event = np.zeros(shape, dtype=bool)
+    ranks = np.full(shape, -1, dtype=np.int8)
+    finished_count = np.zeros(samples, dtype=np.int8)
+
+    while not finished.all():
+        active = ~finished
+
+        # 隨機移動1-3格
+        move = rng.integers(1, 4, size=shape, dtype=position_type)
+
+        # 特殊事件 (每匹馬每場最多一次)，只對觸發的位置抽取事件
+        rows, cols = np.nonzero(active & ~has_event & (rng.random(shape, dtype=np.float32) < event_chance))
+        if len(rows):
+            has_event[rows, cols] = True
+            effect = effect_table[rng.integers(0, len(effect_table), size=len(rows))]
+            triggered_move = move[rows, cols]
+            triggered_move = np.where(effect > 0, triggered_move + rng.integers(2, 4, size=len(rows), dtype=position_type), triggered_move)
+            triggered_move = np.where(effect < 0, -rng.integers(1, 3, size=len(rows), dtype=position_type), triggered_move)
+            move[rows, cols] = triggered_move
+
+        move[finished] = 0
+        raw_positions = positions.astype(np.int16) + move
+        positions = np.clip(raw_positions, 0, track_length).astype(position_type)
+
+        arrived = active & (positions >= track_length)
+        rows = np.nonzero(arrived.any(axis=1))[0]
+        if len(rows):
+            # 同一格內抵達的馬匹依衝過終點的距離排名，距離相同時隨機決定，與 HorseRace.simulate_race 相同
+            # 只處理這一格有馬匹抵達的場次
+            row_arrived = arrived[rows]
+            overshoot = raw_positions[rows] - track_length
+            key = np.where(row_arrived, overshoot + rng.random(row_arrived.shape, dtype=np.float32), -np.inf)
+            order = (key[:, None, :] > key[:, :, None]).sum(axis=2, dtype=np.int8)
+            ranks[rows] = np.where(row_arrived, finished_count[rows, None] + order, ranks[rows])
+            finished_count[rows] += row_arrived.sum(axis=1, dtype=np.int8)
+            finished |= arrived
+
+    return ranks
+
+
+def _simulate_python(horse_count: int, track_length: int, event_chance: float,
+                     effects: Tuple[int, ...], samples: int, seed=None):
+    """純 Python 逐場模擬，返回 (第一名次數, 前二名次數)"""
+    rng = random.Random(seed)
+    effects = effects or (0,)
+    wins = [0] * horse_count
+    places = [0] * horse_count
+
+    for _ in range(samples):
+        positions = [0] * horse_count
+        has_event = [False] * horse_count
+        finish_order: List[int] = []
+
+        while len(finish_order) < horse_count:
+            arrivals = []
+            for i in range(horse_count):
+                if positions[i] >= track_length:
+                    continue
+
+                move = rng.randint(1, 3)
+
+                if not has_event[i] and rng.random() < event_chance:
+                    has_event[i] = True
+                    effect = rng.choice(effects)
+                    if effect > 0:
+                        move += rng.randint(2, 3)
+                    elif effect < 0:
+                        move = -rng.randint(1, 2)
+
+                new_position = positions[i] + move
+                positions[i] = max(0, min(track_length, new_position))
+                if positions[i] >= track_length:
+                    arrivals.append((new_position - track_length, rng.random(), i))
+
+            arrivals.sort(reverse=True)
+            finish_order.extend(i for _, _, i in arrivals)
+
+        wins[finish_order[0]] += 1
+        places[finish_order[0]] += 1
+        if horse_count > 1:
+            places[finish_order[1]] += 1
+
+    return wins, places
+
+
+@lru_cache(maxsize=64)
+def estimate_odds(horse_count: int, track_length: int, event_chance: float,
+                  effects: Tuple[int, ...], samples: int = DEFAULT_SAMPLES, seed=None) -> RaceOdds:
+    """以蒙地卡羅模擬估計各馬匹的勝率 (相同參數的結果會被快取)"""
+    started = time.perf_counter()
+
+    if np is not None:
+        ranks = _simulate_numpy(horse_count, track_length, event_chance, effects, samples, seed)
+        win = tuple(float(p) for p in (ranks == 0).mean(axis=0))
+        place = tuple(float(p) for p in (ranks <= 1).mean(axis=0))
+    else:
+        samples = min(samples, FALLBACK_SAMPLES)
+        wins, places = _simulate_python(horse_count, track_length, event_chance, effects, samples, seed)
+        win = tuple(count / samples for count in wins)
+        place = tuple(count / samples for count in places)
+
+    return RaceOdds(win, place, samples, time.perf_counter() - started)
+
+
+def race_parameters(race) -> tuple:
+    """從 HorseRace 取出影響勝率的參數，作為快取鍵"""
+    return (
+        len(race.horses),
+        race.track_length,
+        race.event_chance,
+        tuple(event_effect(event) for event in race.special_events)
+    )
+
+
+async def get_race_odds(race, samples: int = DEFAULT_SAMPLES) -> RaceOdds:
+    """在背景執行緒估計比賽勝率，不阻塞事件循環"""
+    return await asyncio.to_thread(estimate_odds, *race_parameters(race), samples)
+
+
+if __name__ == "__main__":
+    from models.games import HorseRace
+
+    race = HorseRace(None)
+    odds = estimate_odds(*race_parameters(race), DEFAULT_SAMPLES, 42)
+    print(f"模擬 {odds.samples:,} 場，耗時 {odds.elapsed:.3f} 秒 ({'numpy' if np is not None else '純 Python'})")
+    for i, horse in enumerate(race.horses):
+        print(
+            f"#{horse.number} {horse.name}: 勝率 {odds.win[i]:.2%} | 前二名 {odds.place[i]:.2%} | "
+            f"公平賠率 {odds.fair_odds(i):.2f}x ±{odds.odds_margin(i):.2f} (顯示為 {odds.display_odds(i):g}x)"
+        )
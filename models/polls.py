@@ -0,0 +1,202 @@
+import json
+import asyncio
+import datetime
+from typing import List, Optional, Tuple
+from utils.database import get_db_connection, execute_query, table_exists
+
+class PollStore:
+    """投票資料模型"""
+
+    # 投票的讀取與寫入需在同一個交易中完成，共用連接上的交易不能重疊
+    _vote_lock = asyncio.Lock()
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.db_name = "polls"
+
+    async def setup_database(self):
+        """初始化資料庫表格"""
+        conn = await get_db_connection(self.db_name)
+        cursor = await conn.cursor()
+        has_counts = await table_exists(self.db_name, "poll_option_counts")
+
+        # 投票
+        await cursor.execute('''
+        CREATE TABLE IF NOT EXISTS polls (
+            poll_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            guild_id INTEGER,
+            channel_id INTEGER NOT NULL,
+            message_id INTEGER,
+            creator_id INTEGER NOT NULL,
+            title TEXT NOT NULL,
+            options TEXT NOT NULL,
+            ends_at TIMESTAMP,
+            closed INTEGER DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''')
+
+        # 投票紀錄 (每人每個投票一票)
+        await cursor.execute('''
+        CREATE TABLE IF NOT EXISTS poll_votes (
+            poll_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            option_index INTEGER NOT NULL,
+            voted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (poll_id, user_id),
+            FOREIGN KEY (poll_id) REFERENCES polls(poll_id)
+        )
+        ''')
+
+        # 各選項的票數 (投票時同步更新，顯示按鈕時不需要重新計算)
+        await cursor.execute('''
+        CREATE TABLE IF NOT EXISTS poll_option_counts (
+            poll_id INTEGER NOT NULL,
+            option_index INTEGER NOT NULL,
+            votes INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (poll_id, option_index)
+        )
+        ''')
+
+        await cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_polls_open_ends ON polls(closed, ends_at)
+        ''')
+
+        # 票數表剛建立時，從既有的投票紀錄補上票數
+        if not has_counts:
+            await cursor.execute('''
+            INSERT OR IGNORE INTO poll_option_counts (poll_id, option_index, votes)
+            SELECT poll_id, option_index, COUNT(*) FROM poll_votes
+            GROUP BY poll_id, option_index
+            ''')
+
+        await conn.commit()
+
+    async def create_poll(self, guild_id: int, channel_id: int, creator_id: int,
+                          title: str, options: List[str], duration: int = None) -> Optional[int]:
+        """建立投票，返回投票ID (duration 為分鐘，None 表示永久有效)"""
+        ends_at = None
+        if duration:
+            ends_at = (datetime.datetime.utcnow() + datetime.timedelta(minutes=duration)).strftime('%Y-%m-%d %H:%M:%S')
+
+        query = '''
+        INSERT INTO polls (guild_id, channel_id, creator_id, title, options, ends_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+        '''
+        return await execute_query(
+            self.db_name, query,
+            (guild_id, channel_id, creator_id, title, json.dumps(options, ensure_ascii=False), ends_at)
+        )
+
+    async def set_message(self, poll_id: int, message_id: int):
+        """記錄投票訊息的ID"""
+        query = 'UPDATE polls SET message_id = ? WHERE poll_id = ?'
+        await execute_query(self.db_name, query, (message_id, poll_id))
+
+    async def get_poll(self, poll_id: int) -> Optional[dict]:
+        """取得投票資料"""
+        query = '''
+        SELECT poll_id, channel_id, message_id, title, options, closed
+        FROM polls WHERE poll_id = ?
+        '''
+        row = await execute_query(self.db_name, query, (poll_id,), 'one')
+        return self._to_dict(row) if row else None
+
+    async def cast_vote(self, poll_id: int, user_id: int, option_index: int,
+                        option_count: int) -> Tuple[Optional[str], List[int]]:
+        """投票或取消投票，返回 (動作, 各選項票數)
+
+        動作為 'added'、'changed' 或 'removed'，失敗時為 None。
+        投票紀錄與票數在同一個交易中更新。
+        """
+        vote_query = 'SELECT option_index FROM poll_votes WHERE poll_id = ? AND user_id = ?'
+        delete_query = 'DELETE FROM poll_votes WHERE poll_id = ? AND user_id = ?'
+        upsert_query = '''
+        INSERT INTO poll_votes (poll_id, user_id, option_index)
+        VALUES (?, ?, ?)
+        ON CONFLICT(poll_id, user_id) DO UPDATE SET
+            option_index = excluded.option_index,
+            voted_at = CURRENT_TIMESTAMP
+        '''
+        count_query = '''
+        INSERT INTO poll_option_counts (poll_id, option_index, votes)
+        VALUES (?, ?, ?)
+        ON CONFLICT(poll_id, option_index) DO UPDATE SET
+            votes = MAX(0, votes + excluded.votes)
+        '''
+        counts_query = 'SELECT option_index, votes FROM poll_option_counts WHERE poll_id = ?'
+
+        async with self._vote_lock:
+            conn = await get_db_connection(self.db_name)
+
+            try:
+                async with conn.cursor() as cursor:
+                    await conn.execute("BEGIN TRANSACTION")
+
+                    await cursor.execute(vote_query, (poll_id, user_id))
+                    existing = await cursor.fetchone()
+                    previous = existing[0] if existing else None
+
+                    if previous == option_index:
+                        # 再次點擊同一個選項表示取消
+                        await cursor.execute(delete_query, (poll_id, user_id))
+                        await cursor.execute(count_query, (poll_id, option_index, -1))
+                        action = 'removed'
+                    else:
+                        await cursor.execute(upsert_query, (poll_id, user_id, option_index))
+                        await cursor.execute(count_query, (poll_id, option_index, 1))
+                        if previous is not None:
+                            await cursor.execute(count_query, (poll_id, previous, -1))
+                        action = 'changed' if previous is not None else 'added'
+
+                    await cursor.execute(counts_query, (poll_id,))
+                    rows = await cursor.fetchall()
+
+                    await conn.commit()
+            except Exception as e:
+                await conn.rollback()
+                print(f"投票時發生錯誤: {e}")
+                return None, []
+
+        return action, self._to_counts(rows, option_count)
+
+    async def get_counts(self, poll_id: int, option_count: int) -> List[int]:
+        """各選項的票數"""
+        query = 'SELECT option_index, votes FROM poll_option_counts WHERE poll_id = ?'
+        rows = await execute_query(self.db_name, query, (poll_id,), 'all') or []
+        return self._to_counts(rows, option_count)
+
+    async def get_expired_polls(self) -> List[dict]:
+        """取得已到期但尚未結算的投票"""
+        query = '''
+        SELECT poll_id, channel_id, message_id, title, options, closed
+        FROM polls
+        WHERE closed = 0 AND ends_at IS NOT NULL AND ends_at <= CURRENT_TIMESTAMP
+        '''
+        rows = await execute_query(self.db_name, query, (), 'all') or []
+        return [self._to_dict(row) for row in rows]
+
+    async def close_poll(self, poll_id: int) -> bool:
+        """將投票標記為已結束，已經結束過時返回 False"""
+        query = 'UPDATE polls SET closed = 1 WHERE poll_id = ? AND closed = 0'
+        return bool(await execute_query(self.db_name, query, (poll_id,)))
+
+    @staticmethod
+    def _to_counts(rows, option_count: int) -> List[int]:
+        counts = [0] * option_count
+        for option_index, votes in rows:
+            if 0 <= option_index < option_count:
+                counts[option_index] = votes
+        return counts
+
+    @staticmethod
+    def _to_dict(row) -> dict:
+        poll_id, channel_id, message_id, title, options, closed = row
+        return {
+            'poll_id': poll_id,
+            'channel_id': channel_id,
+            'message_id': message_id,
+            'title': title,
+            'options': json.loads(options),
+            'closed': bool(closed)
+        }
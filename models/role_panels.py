@@ -0,0 +1,155 @@
+import os
+import glob
+import json
+import asyncio
+from typing import Dict, List, Optional, Set, Tuple
+from utils.database import get_db_connection, execute_query, execute_batch
+
+# 舊版每個伺服器一個的設定檔：role_buttons_{guild_id}.json
+LEGACY_FILE_PATTERN = 'role_buttons_*.json'
+
+
+def _read_legacy_files(directory: str) -> List[Tuple[int, dict, str]]:
+    """讀取所有舊版設定檔 (在背景執行緒中執行)，返回 [(伺服器ID, 設定, 檔案路徑)]"""
+    results = []
+    for file_path in glob.glob(os.path.join(directory, LEGACY_FILE_PATTERN)):
+        try:
+            guild_id = int(os.path.basename(file_path)[len('role_buttons_'):-len('.json')])
+            with open(file_path, 'r', encoding='utf8') as f:
+                results.append((guild_id, json.load(f), file_path))
+        except Exception as e:
+            print(f"讀取身分組設定檔 {file_path} 時發生錯誤: {e}")
+    return results
+
+
+def _mark_migrated(file_paths: List[str]):
+    """將已匯入的設定檔改名，避免重複匯入"""
+    for file_path in file_paths:
+        os.replace(file_path, file_path + '.migrated')
+
+
+class RolePanelStore:
+    """身分組按鈕面板的設定，啟動時一次載入各伺服器可切換的身分組"""
+
+    def __init__(self):
+        self.db_name = "role_panels"
+        self._roles_by_guild: Dict[int, Set[int]] = {}
+        self.loaded = False
+        self.legacy_pending = False  # 有舊版設定檔尚未完整匯入
+
+    async def setup_database(self):
+        """初始化資料庫表格"""
+        conn = await get_db_connection(self.db_name)
+        cursor = await conn.cursor()
+
+        # 面板 (每則身分組按鈕訊息一筆)
+        await cursor.execute('''
+        CREATE TABLE IF NOT EXISTS role_panels (
+            panel_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            guild_id INTEGER NOT NULL,
+            channel_id INTEGER NOT NULL,
+            message_id INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''')
+
+        # 面板上的身分組按鈕
+        await cursor.execute('''
+        CREATE TABLE IF NOT EXISTS role_panel_roles (
+            panel_id INTEGER NOT NULL,
+            role_id INTEGER NOT NULL,
+            role_name TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            PRIMARY KEY (panel_id, role_id),
+            FOREIGN KEY (panel_id) REFERENCES role_panels(panel_id)
+        )
+        ''')
+
+        await cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_role_panels_guild_channel ON role_panels(guild_id, channel_id)
+        ''')
+
+        await conn.commit()
+
+    async def import_legacy_files(self, directory: str = '.') -> int:
+        """將舊版的 JSON 設定檔匯入資料庫，返回匯入的面板數"""
+        legacy = await asyncio.to_thread(_read_legacy_files, directory)
+        if not legacy:
+            return 0
+
+        query = 'SELECT panel_id FROM role_panels WHERE guild_id = ? AND channel_id = ?'
+
+        imported = 0
+        migrated_files = []
+        for guild_id, role_data, file_path in legacy:
+            complete = True
+            for channel_id, roles in role_data.items():
+                # 上次已匯入但檔案未改名時跳過，避免重複建立面板
+                if await execute_query(self.db_name, query, (guild_id, int(channel_id)), 'one'):
+                    continue
+
+                if await self.create_panel(guild_id, int(channel_id), [(int(role_id), name) for role_id, name in roles]):
+                    imported += 1
+                else:
+                    complete = False
+
+            # 有面板匯入失敗時保留檔案，下次啟動再試
+            if complete:
+                migrated_files.append(file_path)
+            else:
+                self.legacy_pending = True
+
+        await asyncio.to_thread(_mark_migrated, migrated_files)
+        return imported
+
+    async def load(self):
+        """一次查詢載入所有面板的身分組"""
+        query = '''
+        SELECT p.guild_id, r.role_id
+        FROM role_panel_roles r
+        JOIN role_panels p ON p.panel_id = r.panel_id
+        '''
+        rows = await execute_query(self.db_name, query, (), 'all')
+        if rows is None:
+            return
+
+        roles_by_guild: Dict[int, Set[int]] = {}
+        for guild_id, role_id in rows:
+            roles_by_guild.setdefault(guild_id, set()).add(role_id)
+
+        self._roles_by_guild = roles_by_guild
+        self.loaded = True
+
+    async def create_panel(self, guild_id: int, channel_id: int, roles: List[Tuple[int, str]]) -> Optional[int]:
+        """建立面板，返回面板ID"""
+        query = 'INSERT INTO role_panels (guild_id, channel_id) VALUES (?, ?)'
+        panel_id = await execute_query(self.db_name, query, (guild_id, channel_id))
+        if not panel_id:
+            return None
+
+        success = await execute_batch(self.db_name, [(
+            'INSERT OR REPLACE INTO role_panel_roles (panel_id, role_id, role_name, position) VALUES (?, ?, ?, ?)',
+            [(panel_id, role_id, role_name, position) for position, (role_id, role_name) in enumerate(roles)]
+        )])
+        if not success:
+            # 不留下沒有身分組的面板，否則重新匯入時會被當成已存在
+            await execute_query(self.db_name, 'DELETE FROM role_panels WHERE panel_id = ?', (panel_id,))
+            return None
+
+        self._roles_by_guild.setdefault(guild_id, set()).update(role_id for role_id, _ in roles)
+        return panel_id
+
+    async def set_message(self, panel_id: int, message_id: int):
+        """記錄面板訊息的ID"""
+        query = 'UPDATE role_panels SET message_id = ? WHERE panel_id = ?'
+        await execute_query(self.db_name, query, (message_id, panel_id))
+
+    def allows(self, guild_id: int, role_id: int) -> bool:
+        """身分組是否出現在該伺服器的任一面板上 (尚未載入或舊版設定未匯入完成時不做限制)"""
+        if not self.loaded or self.legacy_pending:
+            return True
+        return role_id in self._roles_by_guild.get(guild_id, ())
+
+
+# 全域共用的身分組面板設定
+role_panel_store = RolePanelStore()
@@ -0,0 +1,162 @@
+import sys
+import asyncio
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional
+from utils.database import execute_query
+
+
+@lru_cache(maxsize=4096)
+def normalize_stock_code(stock_code: str) -> str:
+    """清理股票代碼並駐留 (intern) 字串，相同代碼只會處理一次"""
+    if not stock_code:
+        return ""
+
+    # 移除可能導致SQL問題的字符
+    cleaned_code = stock_code.replace("#", "").replace("'", "").replace('"', "")
+    return sys.intern(cleaned_code)
+
+
+class StockEntry:
+    """股票快取項目"""
+    __slots__ = (
+        'stock_id', 'stock_code', 'stock_name', 'issuer_id', 'total_shares',
+        'available_shares', 'price', 'initial_price', 'description', 'created_at',
+        'version'
+    )
+
+    def __init__(self, stock_id, stock_code, stock_name, issuer_id, total_shares,
+                 available_shares, price, initial_price, description, created_at):
+        self.stock_id = stock_id
+        self.stock_code = stock_code
+        self.stock_name = stock_name
+        self.issuer_id = issuer_id
+        self.total_shares = total_shares
+        self.available_shares = available_shares
+        self.price = price
+        self.initial_price = initial_price
+        self.description = description
+        self.created_at = created_at
+        self.version = 0  # 每次價格變動遞增
+
+    def to_info(self) -> dict:
+        """轉換成 Stock.get_stock_info 的回傳格式"""
+        return {
+            'stock_id': self.stock_id,
+            'stock_name': self.stock_name,
+            'issuer_id': self.issuer_id,
+            'total_shares': self.total_shares,
+            'available_shares': self.available_shares,
+            'price': self.price,
+            'initial_price': self.initial_price,
+            'description': self.description,
+            'created_at': self.created_at
+        }
+
+
+class StockRegistry:
+    """行程內的股票註冊表，以代碼和ID快取股票的基本資料"""
+
+    def __init__(self):
+        self._by_id: Dict[int, StockEntry] = {}
+        self._id_by_code: Dict[str, int] = {}
+        self._price_listeners: List[Callable[[int, float, float], None]] = []
+        self._load_lock: Optional[asyncio.Lock] = None
+        self.loaded = False
+
+    async def ensure_loaded(self, stock_system):
+        """第一次使用時從資料庫載入所有股票"""
+        if self.loaded:
+            return
+
+        if self._load_lock is None:
+            self._load_lock = asyncio.Lock()
+
+        async with self._load_lock:
+            if self.loaded:
+                return
+
+            await stock_system.setup_database()
+
+            query = '''
+            SELECT
+                stock_id, stock_code, stock_name, issuer_id, total_shares, available_shares,
+                price, initial_price, description, created_at
+            FROM stocks
+            '''
+
+            rows = await execute_query(stock_system.db_name, query, fetch_type='all')
+            if rows is None:
+                # 查詢失敗時不標記為已載入，下次再重試
+                return
+
+            for row in rows:
+                self.register(row)
+
+            self.loaded = True
+
+    def register(self, row) -> StockEntry:
+        """加入或覆蓋一支股票，row 的欄位順序與 ensure_loaded 的查詢相同"""
+        entry = StockEntry(*row)
+        entry.stock_code = sys.intern(entry.stock_code)
+
+        previous = self._by_id.get(entry.stock_id)
+        if previous:
+            entry.version = previous.version + 1
+            self._id_by_code.pop(previous.stock_code, None)
+
+        self._by_id[entry.stock_id] = entry
+        self._id_by_code[entry.stock_code] = entry.stock_id
+        return entry
+
+    def get(self, stock_code: str) -> Optional[StockEntry]:
+        """以股票代碼查詢"""
+        stock_id = self._id_by_code.get(stock_code)
+        if stock_id is None:
+            return None
+        return self._by_id.get(stock_id)
+
+    def get_by_id(self, stock_id: int) -> Optional[StockEntry]:
+        """以股票ID查詢"""
+        return self._by_id.get(stock_id)
+
+    def get_id(self, stock_code: str) -> Optional[int]:
+        """將股票代碼轉換為股票ID"""
+        return self._id_by_code.get(stock_code)
+
+    def get_version(self, stock_id: int) -> int:
+        """獲取股票價格版本，不存在時返回 -1"""
+        entry = self._by_id.get(stock_id)
+        return entry.version if entry else -1
+
+    def update_price(self, stock_id: int, new_price: float):
+        """價格變動時更新快取並通知監聽者"""
+        entry = self._by_id.get(stock_id)
+        if not entry:
+            return
+
+        old_price = entry.price
+        entry.price = new_price
+        entry.version += 1
+
+        for listener in list(self._price_listeners):
+            try:
+                listener(stock_id, old_price, new_price)
+            except Exception as e:
+                print(f"股價監聽器執行時發生錯誤: {e}")
+
+    def add_price_listener(self, listener: Callable[[int, float, float], None]):
+        """註冊價格變動監聽器 listener(stock_id, old_price, new_price)"""
+        if listener not in self._price_listeners:
+            self._price_listeners.append(listener)
+
+    def remove_price_listener(self, listener: Callable[[int, float, float], None]):
+        """移除價格變動監聽器"""
+        if listener in self._price_listeners:
+            self._price_listeners.remove(listener)
+
+    def __len__(self):
+        return len(self._by_id)
+
+
+# 全域股票註冊表
+stock_registry = StockRegistry()
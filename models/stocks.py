@@ -1,11 +1,21 @@
 import datetime
 import random
-from utils.database import get_db_connection, execute_query, table_exists, column_exists
+import time
+from bisect import bisect_left, bisect_right
+from utils.database import get_db_connection, execute_query, execute_transaction, attach_database, table_exists, column_exists
 from models.currency import Currency
+from models.stock_registry import stock_registry
 
 class Stock:
     """股票系統模型"""
-    
+
+    # 計數快取 {key: (數量, 過期時間)}，用於分頁顯示的大約總數
+    _count_cache = {}
+    COUNT_CACHE_TTL = 60
+
+    # 單次查詢使用的 IN (...) 參數上限
+    MAX_QUERY_PARAMS = 900
+
     def __init__(self, bot):
         self.bot = bot
         self.db_name = "stock"
@@ -15,6 +25,7 @@ class Stock:
         """初始化資料庫表格"""
         conn = await get_db_connection(self.db_name)
         cursor = await conn.cursor()
+        portfolio_table_missing = not await table_exists(self.db_name, "portfolio_values")
         
         # 股票表格
         await cursor.execute('''
@@ -100,12 +111,105 @@ class Stock:
             FOREIGN KEY (stock_id) REFERENCES stocks(stock_id)
         )
         ''')
+
+        # 已結束委託單的冷資料表
+        await cursor.execute('''
+        CREATE TABLE IF NOT EXISTS stock_orders_archive (
+            order_id INTEGER PRIMARY KEY,
+            user_id INTEGER,
+            stock_id INTEGER,
+            order_type TEXT,
+            shares INTEGER,
+            price REAL,
+            created_at TIMESTAMP,
+            status TEXT,
+            archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''')
+
+        # 過期成交紀錄的冷資料表
+        await cursor.execute('''
+        CREATE TABLE IF NOT EXISTS stock_transactions_archive (
+            transaction_id INTEGER PRIMARY KEY,
+            stock_id INTEGER,
+            seller_id INTEGER,
+            buyer_id INTEGER,
+            shares INTEGER,
+            price_per_share REAL,
+            total_amount REAL,
+            transaction_type TEXT,
+            created_at TIMESTAMP,
+            archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''')
+
+        # 每日成交彙總表格 (歸檔時累計，供分析使用)
+        await cursor.execute('''
+        CREATE TABLE IF NOT EXISTS stock_trade_rollups (
+            stock_id INTEGER,
+            date DATE,
+            trade_count INTEGER DEFAULT 0,
+            volume INTEGER DEFAULT 0,
+            turnover REAL DEFAULT 0,
+            high_price REAL,
+            low_price REAL,
+            PRIMARY KEY (stock_id, date)
+        )
+        ''')
+
+        # 集合競價設定表格 (有紀錄的股票改為定期集合競價撮合)
+        await cursor.execute('''
+        CREATE TABLE IF NOT EXISTS stock_auction_settings (
+            stock_id INTEGER PRIMARY KEY,
+            interval_seconds INTEGER,
+            FOREIGN KEY (stock_id) REFERENCES stocks(stock_id)
+        )
+        ''')
+
+        # 持股批次表格 (先進先出計算成本)
+        await cursor.execute('''
+        CREATE TABLE IF NOT EXISTS stock_lots (
+            lot_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            stock_id INTEGER,
+            shares INTEGER,  -- 剩餘股數
+            price REAL,      -- 每股取得成本
+            acquired_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (stock_id) REFERENCES stocks(stock_id)
+        )
+        ''')
+
+        # 持股成本彙總表格 (由 stock_lots 增量維護)
+        await cursor.execute('''
+        CREATE TABLE IF NOT EXISTS stock_cost_basis (
+            user_id INTEGER,
+            stock_id INTEGER,
+            shares INTEGER DEFAULT 0,
+            total_cost REAL DEFAULT 0,
+            realized_pnl REAL DEFAULT 0,
+            PRIMARY KEY (user_id, stock_id)
+        )
+        ''')
+
+        # 用戶持股市值表格 (股價或持股變動時增量更新)
+        await cursor.execute('''
+        CREATE TABLE IF NOT EXISTS portfolio_values (
+            user_id INTEGER PRIMARY KEY,
+            equity_value REAL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''')
         await self.optimize_database()
         await conn.commit()
+
+        # 第一次建立表格時從現有持股計算
+        if portfolio_table_missing:
+            await self.rebuild_portfolio_values()
     async def update_stock_price_directly(self, stock_id: int, new_price: float):
         """直接更新股票價格（用於定時波動）"""
         # 確保資料庫已設置
         await self.setup_database()
+        await stock_registry.ensure_loaded(self)
         
         # 獲取當前價格
         query = 'SELECT price FROM stocks WHERE stock_id = ?'
@@ -124,7 +228,9 @@ class Stock:
         '''
         
         await execute_query(self.db_name, query, (new_price, stock_id))
-        
+        await self.apply_price_to_portfolios(stock_id, current_price, new_price)
+        stock_registry.update_price(stock_id, new_price)
+
         # 記錄每日價格
         today = datetime.date.today()
         
@@ -144,15 +250,24 @@ class Stock:
         # 常用查詢索引
         await cursor.execute('CREATE INDEX IF NOT EXISTS idx_stock_orders_user_id ON stock_orders(user_id)')
         await cursor.execute('CREATE INDEX IF NOT EXISTS idx_stock_holdings_user_id ON stock_holdings(user_id)')
+        await cursor.execute('CREATE INDEX IF NOT EXISTS idx_stock_holdings_stock_id ON stock_holdings(stock_id, user_id)')
+        await cursor.execute('CREATE INDEX IF NOT EXISTS idx_portfolio_values_equity ON portfolio_values(equity_value)')
         await cursor.execute('CREATE INDEX IF NOT EXISTS idx_stock_transactions_stock_id ON stock_transactions(stock_id)')
         await cursor.execute('CREATE INDEX IF NOT EXISTS idx_price_history_stock_date ON stock_price_history(stock_id, date)')
-        
+        await cursor.execute('CREATE INDEX IF NOT EXISTS idx_stock_transactions_stock_created ON stock_transactions(stock_id, created_at)')
+        await cursor.execute('CREATE INDEX IF NOT EXISTS idx_stock_transactions_created ON stock_transactions(created_at)')
+
         # 用於排序和過濾的索引
         await cursor.execute('CREATE INDEX IF NOT EXISTS idx_stocks_price ON stocks(price)')
         await cursor.execute('CREATE INDEX IF NOT EXISTS idx_orders_status ON stock_orders(status)')
         
         # 複合索引用於複雜查詢
         await cursor.execute('CREATE INDEX IF NOT EXISTS idx_orders_user_status ON stock_orders(user_id, status)')
+        await cursor.execute('CREATE INDEX IF NOT EXISTS idx_orders_archive_user ON stock_orders_archive(user_id, created_at)')
+        await cursor.execute('CREATE INDEX IF NOT EXISTS idx_orders_user_created ON stock_orders(user_id, created_at, order_id)')
+        await cursor.execute('CREATE INDEX IF NOT EXISTS idx_orders_archive_user_created ON stock_orders_archive(user_id, created_at, order_id)')
+        await cursor.execute('CREATE INDEX IF NOT EXISTS idx_stocks_code_id ON stocks(stock_code, stock_id)')
+        await cursor.execute('CREATE INDEX IF NOT EXISTS idx_stock_lots_user_stock ON stock_lots(user_id, stock_id, lot_id)')
         
         await conn.commit()
         print("資料庫索引優化完成")
@@ -163,10 +278,8 @@ class Stock:
         await self.setup_database()
         
         # 檢查代碼是否已存在
-        query = 'SELECT stock_id FROM stocks WHERE stock_code = ?'
-        result = await execute_query(self.db_name, query, (stock_code,), 'one')
-        
-        if result:
+        await stock_registry.ensure_loaded(self)
+        if stock_registry.get_id(stock_code) is not None:
             return False, "股票代碼已存在！"
         
         # 計算發行成本
@@ -190,16 +303,22 @@ class Stock:
         VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
         '''
         
-        await execute_query(
+        stock_id = await execute_query(
             self.db_name,
             query,
             (stock_code, stock_name, user_id, total_shares, 0, initial_price, initial_price, initial_price, now, description)
         )
-        
-        # 獲取新增的股票ID
-        query = 'SELECT stock_id FROM stocks WHERE stock_code = ?'
-        result = await execute_query(self.db_name, query, (stock_code,), 'one')
-        stock_id = result[0]
+
+        # 加入股票註冊表
+        query = '''
+        SELECT
+            stock_id, stock_code, stock_name, issuer_id, total_shares, available_shares,
+            price, initial_price, description, created_at
+        FROM stocks
+        WHERE stock_id = ?
+        '''
+        result = await execute_query(self.db_name, query, (stock_id,), 'one')
+        stock_registry.register(result)
         
         # 為發行人分配全部股份
         query = '''
@@ -208,7 +327,11 @@ class Stock:
         '''
         
         await execute_query(self.db_name, query, (user_id, stock_id, total_shares))
-        
+        await self.adjust_portfolio_value(user_id, stock_id, total_shares)
+
+        # 發行人的持股成本以發行價計算
+        await self.add_lot(user_id, stock_id, total_shares, initial_price)
+
         # 記錄股價歷史
         today = datetime.date.today()
         query = '''
@@ -221,34 +344,14 @@ class Stock:
         return True, f"成功發行 {stock_name}({stock_code}) 股票，總股數: {total_shares}，價格: {initial_price} Silva幣"
     
     async def get_stock_info(self, stock_code: str):
-        """獲取股票信息"""
-        # 確保資料庫已設置
-        await self.setup_database()
-        
-        query = '''
-        SELECT 
-            stock_id, stock_name, issuer_id, total_shares, available_shares, 
-            price, initial_price, description, created_at
-        FROM stocks 
-        WHERE stock_code = ?
-        '''
-        
-        result = await execute_query(self.db_name, query, (stock_code,), 'one')
-        
-        if not result:
+        """獲取股票信息 (從註冊表讀取，不需查詢資料庫)"""
+        await stock_registry.ensure_loaded(self)
+
+        entry = stock_registry.get(stock_code)
+        if not entry:
             return None
-        
-        return {
-            'stock_id': result[0],
-            'stock_name': result[1],
-            'issuer_id': result[2],
-            'total_shares': result[3],
-            'available_shares': result[4],
-            'price': result[5],
-            'initial_price': result[6],
-            'description': result[7],
-            'created_at': result[8]
-        }
+
+        return entry.to_info()
     async def get_stocks_paged(self, page_size=5, page=1):
         """分頁獲取股票列表"""
         await self.setup_database()
@@ -266,13 +369,71 @@ class Stock:
         result = await execute_query(self.db_name, query, (page_size, offset), 'all')
         return result
 
+    async def get_stocks_keyset(self, page_size=5, after=None, before=None):
+        """以 (stock_code, stock_id) 為游標分頁獲取股票列表
+
+        after/before 為上一頁最後一筆或下一頁第一筆的 (stock_code, stock_id)，
+        多取一筆用來判斷是否還有下一頁。返回 (股票列表, 是否還有更多)
+        """
+        await self.setup_database()
+
+        columns = 'stock_id, stock_code, stock_name, price, total_shares, issuer_id'
+
+        if before is not None:
+            query = f'''
+            SELECT {columns}
+            FROM stocks
+            WHERE (stock_code, stock_id) < (?, ?)
+            ORDER BY stock_code DESC, stock_id DESC
+            LIMIT ?
+            '''
+            parameters = (*before, page_size + 1)
+        elif after is not None:
+            query = f'''
+            SELECT {columns}
+            FROM stocks
+            WHERE (stock_code, stock_id) > (?, ?)
+            ORDER BY stock_code, stock_id
+            LIMIT ?
+            '''
+            parameters = (*after, page_size + 1)
+        else:
+            query = f'''
+            SELECT {columns}
+            FROM stocks
+            ORDER BY stock_code, stock_id
+            LIMIT ?
+            '''
+            parameters = (page_size + 1,)
+
+        result = await execute_query(self.db_name, query, parameters, 'all') or []
+        has_more = len(result) > page_size
+        result = result[:page_size]
+
+        if before is not None:
+            result.reverse()
+
+        return result, has_more
+
     async def get_total_stocks_count(self):
         """獲取股票總數"""
-        await self.setup_database()
-        
-        query = 'SELECT COUNT(*) FROM stocks'
-        result = await execute_query(self.db_name, query, fetch_type='one')
-        return result[0] if result else 0
+        await stock_registry.ensure_loaded(self)
+        if stock_registry.loaded:
+            return len(stock_registry)
+
+        return await self._cached_count('stocks', 'SELECT COUNT(*) FROM stocks')
+
+    async def _cached_count(self, key, query: str, parameters: tuple = ()):
+        """在 COUNT_CACHE_TTL 秒內重複使用同一個計數結果"""
+        cached = Stock._count_cache.get(key)
+        now = time.monotonic()
+        if cached and cached[1] > now:
+            return cached[0]
+
+        result = await execute_query(self.db_name, query, parameters, 'one')
+        count = result[0] if result else 0
+        Stock._count_cache[key] = (count, now + self.COUNT_CACHE_TTL)
+        return count
     async def get_all_stocks(self, limit=100):
         """獲取所有股票列表 - 優化版"""
         # 確保資料庫已設置
@@ -369,6 +530,10 @@ class Stock:
         
         await execute_query(self.db_name, query, (user_id, stock_id, order_type, shares, price))
         
+        # 集合競價模式的股票不即時撮合，留待下次競價統一成交
+        if await self.get_auction_interval(stock_id):
+            return True, "委託單已提交，將於下次集合競價時撮合！"
+        
         # 嘗試撮合訂單 (多次嘗試以確保交易機會)
         for i in range(3):
             matched = await self.match_orders(stock_id)
@@ -459,18 +624,18 @@ class Stock:
         
         return matched
     
-    async def execute_trade(self, stock_id: int, buyer_id: int, seller_id: int, shares: int, price: float):
+    async def execute_trade(self, stock_id: int, buyer_id: int, seller_id: int, shares: int, price: float, buy_price: float = None):
         """執行交易"""
         total_amount = shares * price
         
         # 獲取股票資訊
-        query = 'SELECT stock_code FROM stocks WHERE stock_id = ?'
-        result = await execute_query(self.db_name, query, (stock_id,), 'one')
-        stock_code = result[0] if result else "未知股票"
+        entry = stock_registry.get_by_id(stock_id)
+        stock_code = entry.stock_code if entry else "未知股票"
         
         # 買家已經在下單時扣除了資金，現在返回多扣的部分
         currency = Currency(self.bot)
-        refund = (price - price) * shares  # 如果買入價高於實際交易價，返回差額
+        # 如果買入價高於實際交易價，返回差額
+        refund = ((buy_price if buy_price is not None else price) - price) * shares
         
         if refund > 0:
             await currency.update_balance(buyer_id, refund, f"股票 {stock_code} 交易退款")
@@ -481,6 +646,10 @@ class Stock:
         # 更新股權
         await self.update_holdings(buyer_id, stock_id, shares)
         await self.update_holdings(seller_id, stock_id, -shares)
+
+        # 更新持股成本 (賣方先進先出沖銷，買方新增批次)
+        await self.consume_lots(seller_id, stock_id, shares, price)
+        await self.add_lot(buyer_id, stock_id, shares, price)
         
         # 記錄交易歷史
         query = '''
@@ -495,6 +664,174 @@ class Stock:
             (stock_id, seller_id, buyer_id, shares, price, total_amount)
         )
     
+    async def get_auction_interval(self, stock_id: int):
+        """獲取股票的集合競價間隔 (秒)，連續撮合的股票返回 None"""
+        query = 'SELECT interval_seconds FROM stock_auction_settings WHERE stock_id = ?'
+        result = await execute_query(self.db_name, query, (stock_id,), 'one')
+        
+        if not result or not result[0]:
+            return None
+        return result[0]
+    
+    async def get_auction_stocks(self):
+        """獲取所有集合競價模式的股票 (每5秒呼叫一次，資料表由 StockCog 在任務開始前建立)"""
+        query = '''
+        SELECT a.stock_id, s.stock_code, a.interval_seconds
+        FROM stock_auction_settings a
+        JOIN stocks s ON a.stock_id = s.stock_id
+        WHERE a.interval_seconds > 0
+        '''
+        
+        result = await execute_query(self.db_name, query, fetch_type='all')
+        return result or []
+    
+    async def set_auction_mode(self, stock_code: str, interval_seconds: int):
+        """設定股票的撮合模式，間隔為 0 表示改回連續撮合"""
+        # 確保資料庫已設置
+        await self.setup_database()
+        
+        stock_info = await self.get_stock_info(stock_code)
+        if not stock_info:
+            return False, "找不到該股票！"
+        
+        stock_id = stock_info['stock_id']
+        
+        if interval_seconds and interval_seconds > 0:
+            query = '''
+            INSERT INTO stock_auction_settings (stock_id, interval_seconds)
+            VALUES (?, ?)
+            ON CONFLICT(stock_id) DO UPDATE SET interval_seconds = ?
+            '''
+            await execute_query(self.db_name, query, (stock_id, interval_seconds, interval_seconds))
+            return True, f"{stock_code} 已改為每 {interval_seconds} 秒集合競價一次"
+        
+        query = 'DELETE FROM stock_auction_settings WHERE stock_id = ?'
+        await execute_query(self.db_name, query, (stock_id,))
+        
+        # 改回連續撮合前先把累積的委託單競價一次
+        await self.run_call_auction(stock_id)
+        return True, f"{stock_code} 已改回連續撮合"
+    
+    @staticmethod
+    def compute_clearing_price(buy_orders, sell_orders, reference_price: float = None):
+        """
+        計算集合競價的統一成交價
+        
+        選擇可成交量最大的價格；成交量相同時取買賣量差距最小者，
+        再相同則取最接近參考價 (通常為目前股價) 的價格。
+        
+        Returns:
+            (clearing_price, volume)，無法成交時返回 (None, 0)
+        """
+        if not buy_orders or not sell_orders:
+            return None, 0
+        
+        buy_prices = sorted(order[3] for order in buy_orders)
+        sell_prices = sorted(order[3] for order in sell_orders)
+        
+        # 買單量由高價往低價累計 (後綴和)，賣單量由低價往高價累計 (前綴和)
+        buy_shares_by_price = sorted((order[3], order[2]) for order in buy_orders)
+        buy_suffix = [0] * (len(buy_shares_by_price) + 1)
+        for i in range(len(buy_shares_by_price) - 1, -1, -1):
+            buy_suffix[i] = buy_suffix[i + 1] + buy_shares_by_price[i][1]
+        
+        sell_shares_by_price = sorted((order[3], order[2]) for order in sell_orders)
+        sell_prefix = [0]
+        for _, shares in sell_shares_by_price:
+            sell_prefix.append(sell_prefix[-1] + shares)
+        
+        best_key = None
+        best_price = None
+        best_volume = 0
+        
+        for price in sorted(set(buy_prices) | set(sell_prices)):
+            demand = buy_suffix[bisect_left(buy_prices, price)]
+            supply = sell_prefix[bisect_right(sell_prices, price)]
+            volume = min(demand, supply)
+            
+            if volume <= 0:
+                continue
+            
+            distance = abs(price - reference_price) if reference_price is not None else 0
+            key = (-volume, abs(demand - supply), distance, price)
+            
+            if best_key is None or key < best_key:
+                best_key = key
+                best_price = price
+                best_volume = volume
+        
+        return best_price, best_volume
+    
+    async def run_call_auction(self, stock_id: int):
+        """以單一成交價一次撮合所有可成交的委託單"""
+        query_buy = '''
+        SELECT order_id, user_id, shares, price 
+        FROM stock_orders 
+        WHERE stock_id = ? AND order_type = 'buy' AND status = 'active' AND shares > 0
+        ORDER BY price DESC, created_at ASC
+        '''
+        
+        query_sell = '''
+        SELECT order_id, user_id, shares, price 
+        FROM stock_orders 
+        WHERE stock_id = ? AND order_type = 'sell' AND status = 'active' AND shares > 0
+        ORDER BY price ASC, created_at ASC
+        '''
+        
+        buy_orders = await execute_query(self.db_name, query_buy, (stock_id,), 'all')
+        sell_orders = await execute_query(self.db_name, query_sell, (stock_id,), 'all')
+        
+        if not buy_orders or not sell_orders:
+            return False
+        
+        query = 'SELECT price FROM stocks WHERE stock_id = ?'
+        result = await execute_query(self.db_name, query, (stock_id,), 'one')
+        reference_price = result[0] if result else None
+        
+        clearing_price, volume = self.compute_clearing_price(buy_orders, sell_orders, reference_price)
+        if clearing_price is None:
+            return False
+        
+        # 只有願意以成交價成交的委託單才參與分配，依價格時間優先
+        eligible_buys = [list(order) for order in buy_orders if order[3] >= clearing_price]
+        eligible_sells = [list(order) for order in sell_orders if order[3] <= clearing_price]
+        
+        matched = False
+        first_open_sell = 0
+        
+        for buy in eligible_buys:
+            buy_id, buyer_id, _, buy_price = buy
+            
+            for index in range(first_open_sell, len(eligible_sells)):
+                if buy[2] <= 0:
+                    break
+                
+                sell = eligible_sells[index]
+                sell_id, seller_id, _, _ = sell
+                
+                # 買家不能是賣家
+                if sell[2] <= 0 or buyer_id == seller_id:
+                    continue
+                
+                trade_shares = min(buy[2], sell[2])
+                
+                await self.execute_trade(stock_id, buyer_id, seller_id, trade_shares, clearing_price, buy_price)
+                await self.update_order_after_trade(buy_id, sell_id, trade_shares)
+                
+                buy[2] -= trade_shares
+                sell[2] -= trade_shares
+                matched = True
+            
+            # 跳過已全部成交的賣單
+            while first_open_sell < len(eligible_sells) and eligible_sells[first_open_sell][2] <= 0:
+                first_open_sell += 1
+        
+        # 更新股票最新價格
+        if matched:
+            await self.update_stock_price(stock_id)
+        
+        return matched
+    
     async def update_order_after_trade(self, buy_order_id: int, sell_order_id: int, traded_shares: int):
         """交易後更新訂單狀態 - 改進版"""
         # 更新買單
@@ -537,17 +874,220 @@ class Stock:
         if result:
             holding_id, current_shares = result
             new_shares = current_shares + shares_change
-            
+
             if new_shares > 0:
                 query = 'UPDATE stock_holdings SET shares = ? WHERE holding_id = ?'
                 await execute_query(self.db_name, query, (new_shares, holding_id))
             else:
                 query = 'DELETE FROM stock_holdings WHERE holding_id = ?'
                 await execute_query(self.db_name, query, (holding_id,))
+
+            await self.adjust_portfolio_value(user_id, stock_id, max(new_shares, 0) - current_shares)
         elif shares_change > 0:
             query = 'INSERT INTO stock_holdings (user_id, stock_id, shares) VALUES (?, ?, ?)'
             await execute_query(self.db_name, query, (user_id, stock_id, shares_change))
+            await self.adjust_portfolio_value(user_id, stock_id, shares_change)
+
+    async def adjust_portfolio_value(self, user_id: int, stock_id: int, shares_change: int):
+        """持股變動時以目前股價調整用戶持股市值"""
+        if not shares_change:
+            return
+
+        query = '''
+        INSERT INTO portfolio_values (user_id, equity_value, updated_at)
+        VALUES (?, ? * (SELECT price FROM stocks WHERE stock_id = ?), CURRENT_TIMESTAMP)
+        ON CONFLICT(user_id)
+        DO UPDATE SET equity_value = equity_value + excluded.equity_value, updated_at = CURRENT_TIMESTAMP
+        '''
+
+        await execute_query(self.db_name, query, (user_id, shares_change, stock_id))
+
+    async def apply_price_to_portfolios(self, stock_id: int, old_price: float, new_price: float):
+        """股價變動時只更新持有該股票的用戶市值"""
+        if old_price is None or new_price == old_price:
+            return
+
+        query = '''
+        UPDATE portfolio_values
+        SET equity_value = equity_value + ? * (
+                SELECT h.shares FROM stock_holdings h
+                WHERE h.user_id = portfolio_values.user_id AND h.stock_id = ?
+            ),
+            updated_at = CURRENT_TIMESTAMP
+        WHERE user_id IN (SELECT user_id FROM stock_holdings WHERE stock_id = ? AND shares > 0)
+        '''
+
+        await execute_query(self.db_name, query, (new_price - old_price, stock_id, stock_id))
+
+    async def rebuild_portfolio_values(self):
+        """由持股資料重新計算所有用戶的持股市值 (用於初始化與定期校正)"""
+        queries = [
+            ('DELETE FROM portfolio_values', ()),
+            (
+                '''
+                INSERT INTO portfolio_values (user_id, equity_value)
+                SELECT h.user_id, SUM(h.shares * s.price)
+                FROM stock_holdings h
+                JOIN stocks s ON s.stock_id = h.stock_id
+                GROUP BY h.user_id
+                ''',
+                ()
+            )
+        ]
+
+        return await execute_transaction(self.db_name, queries)
+
+    async def get_net_worth_ranking(self, limit: int = 10):
+        """獲取總資產 (現金 + 股票市值) 排行榜"""
+        await self.setup_database()
+
+        # 確保貨幣資料表已建立
+        await Currency(self.bot).setup_database()
+
+        if not await attach_database(self.db_name, "currency", "currency_db"):
+            return []
+
+        query = '''
+        SELECT
+            u.user_id, u.username, u.balance,
+            COALESCE(p.equity_value, 0) AS equity_value,
+            u.balance + COALESCE(p.equity_value, 0) AS net_worth
+        FROM currency_db.user_currency u
+        LEFT JOIN portfolio_values p ON p.user_id = u.user_id
+        ORDER BY net_worth DESC
+        LIMIT ?
+        '''
+
+        result = await execute_query(self.db_name, query, (limit,), 'all')
+        return result or []
     
+    async def add_lot(self, user_id: int, stock_id: int, shares: int, price: float):
+        """新增一筆持股批次並更新成本彙總"""
+        queries = [
+            (
+                'INSERT INTO stock_lots (user_id, stock_id, shares, price) VALUES (?, ?, ?, ?)',
+                (user_id, stock_id, shares, price)
+            ),
+            (
+                '''
+                INSERT INTO stock_cost_basis (user_id, stock_id, shares, total_cost)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(user_id, stock_id)
+                DO UPDATE SET shares = shares + excluded.shares, total_cost = total_cost + excluded.total_cost
+                ''',
+                (user_id, stock_id, shares, shares * price)
+            )
+        ]
+
+        return await execute_transaction(self.db_name, queries)
+
+    async def consume_lots(self, user_id: int, stock_id: int, shares: int, price: float):
+        """以先進先出沖銷持股批次，返回已實現損益
+
+        帳本建立前就持有的股份沒有批次紀錄，以股票發行價作為成本。
+        """
+        query = '''
+        SELECT lot_id, shares, price
+        FROM stock_lots
+        WHERE user_id = ? AND stock_id = ? AND shares > 0
+        ORDER BY lot_id
+        '''
+
+        lots = await execute_query(self.db_name, query, (user_id, stock_id), 'all') or []
+
+        queries = []
+        remaining = shares
+        lot_shares_used = 0
+        lot_cost = 0.0
+
+        for lot_id, lot_shares, lot_price in lots:
+            if remaining <= 0:
+                break
+
+            used = min(remaining, lot_shares)
+            remaining -= used
+            lot_shares_used += used
+            lot_cost += used * lot_price
+
+            if used == lot_shares:
+                queries.append(('DELETE FROM stock_lots WHERE lot_id = ?', (lot_id,)))
+            else:
+                queries.append(('UPDATE stock_lots SET shares = shares - ? WHERE lot_id = ?', (used, lot_id)))
+
+        # 沒有批次紀錄的舊持股
+        legacy_cost = 0.0
+        if remaining > 0:
+            entry = stock_registry.get_by_id(stock_id)
+            legacy_cost = remaining * (entry.initial_price if entry else price)
+
+        realized = shares * price - lot_cost - legacy_cost
+
+        queries.append((
+            '''
+            INSERT INTO stock_cost_basis (user_id, stock_id, shares, total_cost, realized_pnl)
+            VALUES (?, ?, 0, 0, ?)
+            ON CONFLICT(user_id, stock_id)
+            DO UPDATE SET
+                shares = MAX(0, shares - ?),
+                total_cost = CASE WHEN shares - ? <= 0 THEN 0 ELSE total_cost - ? END,
+                realized_pnl = realized_pnl + excluded.realized_pnl
+            ''',
+            (user_id, stock_id, realized, lot_shares_used, lot_shares_used, lot_cost)
+        ))
+
+        await execute_transaction(self.db_name, queries)
+        return realized
+
+    async def get_cost_basis(self, user_id: int, stock_id: int):
+        """獲取用戶某支股票的持股成本，返回 (股數, 平均成本, 已實現損益)"""
+        await self.setup_database()
+
+        query = '''
+        SELECT
+            h.shares,
+            COALESCE(c.total_cost, 0) + MAX(0, h.shares - COALESCE(c.shares, 0)) * s.initial_price,
+            COALESCE(c.realized_pnl, 0)
+        FROM stock_holdings h
+        JOIN stocks s ON s.stock_id = h.stock_id
+        LEFT JOIN stock_cost_basis c ON c.user_id = h.user_id AND c.stock_id = h.stock_id
+        WHERE h.user_id = ? AND h.stock_id = ?
+        '''
+
+        result = await execute_query(self.db_name, query, (user_id, stock_id), 'one')
+
+        if not result or not result[0]:
+            return 0, 0, 0
+
+        shares, total_cost, realized = result
+        return shares, total_cost / shares, realized
+
+    async def get_portfolio_pnl(self, user_id: int):
+        """獲取用戶投資組合的成本與損益
+
+        返回 (持股列表, 已實現損益總計)，持股列表每列為
+        (stock_id, stock_code, stock_name, shares, price, total_cost)
+        """
+        await self.setup_database()
+
+        query = '''
+        SELECT
+            s.stock_id, s.stock_code, s.stock_name, h.shares, s.price,
+            COALESCE(c.total_cost, 0) + MAX(0, h.shares - COALESCE(c.shares, 0)) * s.initial_price
+        FROM stock_holdings h
+        JOIN stocks s ON h.stock_id = s.stock_id
+        LEFT JOIN stock_cost_basis c ON c.user_id = h.user_id AND c.stock_id = h.stock_id
+        WHERE h.user_id = ? AND h.shares > 0
+        ORDER BY s.stock_code
+        '''
+
+        holdings = await execute_query(self.db_name, query, (user_id,), 'all') or []
+
+        query = 'SELECT SUM(realized_pnl) FROM stock_cost_basis WHERE user_id = ?'
+        result = await execute_query(self.db_name, query, (user_id,), 'one')
+        realized = result[0] if result and result[0] else 0
+
+        return holdings, realized
+
     async def update_stock_price(self, stock_id: int):
         """更新股票價格"""
         # 獲取最近的交易價格
@@ -583,7 +1123,9 @@ class Stock:
         '''
         
         await execute_query(self.db_name, query, (last_trade_price, stock_id))
-        
+        await self.apply_price_to_portfolios(stock_id, current_price, last_trade_price)
+        stock_registry.update_price(stock_id, last_trade_price)
+
         # 記錄每日價格
         today = datetime.date.today()
         
@@ -609,15 +1151,140 @@ class Stock:
         JOIN stocks s ON o.stock_id = s.stock_id
         WHERE o.user_id = ?
         '''
+        parameters = (user_id,)
         
         if active_only:
             query += " AND o.status = 'active'"
+        else:
+            # 已結束的委託單已歸檔至冷資料表，查詢歷史時一併合併
+            query += '''
+        UNION ALL
+        SELECT 
+            a.order_id, s.stock_code, s.stock_name, a.order_type, 
+            a.shares, a.price, a.status, a.created_at
+        FROM stock_orders_archive a
+        JOIN stocks s ON a.stock_id = s.stock_id
+        WHERE a.user_id = ?
+        '''
+            parameters = (user_id, user_id)
             
-        query += " ORDER BY o.created_at DESC"
+        query += " ORDER BY created_at DESC"
         
-        result = await execute_query(self.db_name, query, (user_id,), 'all')
+        result = await execute_query(self.db_name, query, parameters, 'all')
         return result
     
+    async def get_orders_for_users_keyset(self, user_ids, page_size=10, after=None, before=None):
+        """以 (user_id, order_id) 為游標分頁獲取多個用戶的活躍委託單
+
+        after 為目前頁面最後一筆 (往後翻)，before 為目前頁面第一筆 (往前翻)。
+        返回 (委託單列表, 是否還有更多)，每筆欄位為 user_id 加上 get_user_orders 的欄位
+        """
+        await self.setup_database()
+
+        user_ids = sorted(set(user_ids))
+        if before is not None:
+            condition, order, cursor = "AND (o.user_id, o.order_id) < (?, ?)", "DESC", tuple(before)
+            user_ids.reverse()
+        elif after is not None:
+            condition, order, cursor = "AND (o.user_id, o.order_id) > (?, ?)", "ASC", tuple(after)
+        else:
+            condition, order, cursor = "", "ASC", ()
+
+        # SQLite 的參數數量有上限，依用戶ID順序分批查詢，湊滿一頁就停止
+        result = []
+        for i in range(0, len(user_ids), self.MAX_QUERY_PARAMS):
+            chunk = user_ids[i:i + self.MAX_QUERY_PARAMS]
+            placeholders = ', '.join('?' * len(chunk))
+
+            query = f'''
+            SELECT
+                o.user_id, o.order_id, s.stock_code, s.stock_name, o.order_type,
+                o.shares, o.price, o.status, o.created_at
+            FROM stock_orders o
+            JOIN stocks s ON o.stock_id = s.stock_id
+            WHERE o.user_id IN ({placeholders}) AND o.status = 'active' {condition}
+            ORDER BY o.user_id {order}, o.order_id {order}
+            LIMIT ?
+            '''
+            parameters = (*chunk, *cursor, page_size + 1 - len(result))
+
+            result += await execute_query(self.db_name, query, parameters, 'all') or []
+            if len(result) > page_size:
+                break
+
+        has_more = len(result) > page_size
+        result = result[:page_size]
+
+        if before is not None:
+            result.reverse()
+
+        return result, has_more
+
+    async def get_user_orders_keyset(self, user_id: int, active_only=False, page_size=10, after=None, before=None):
+        """以 (created_at, order_id) 為游標、由新到舊分頁獲取用戶的委託單
+
+        after 為目前頁面最後一筆 (往更舊的方向)，before 為目前頁面第一筆 (往較新的方向)。
+        返回 (委託單列表, 是否還有更多)
+        """
+        await self.setup_database()
+
+        if before is not None:
+            condition, order, cursor = "AND (created_at, order_id) > (?, ?)", "ASC", before
+        elif after is not None:
+            condition, order, cursor = "AND (created_at, order_id) < (?, ?)", "DESC", after
+        else:
+            condition, order, cursor = "", "DESC", ()
+
+        branches = [f'''
+        SELECT order_id, stock_id, order_type, shares, price, status, created_at
+        FROM stock_orders
+        WHERE user_id = ? {"AND status = 'active'" if active_only else ""} {condition}
+        ''']
+        parameters = [user_id, *cursor]
+
+        if not active_only:
+            # 已結束的委託單已歸檔至冷資料表，查詢歷史時一併合併
+            branches.append(f'''
+        SELECT order_id, stock_id, order_type, shares, price, status, created_at
+        FROM stock_orders_archive
+        WHERE user_id = ? {condition}
+        ''')
+            parameters += [user_id, *cursor]
+
+        query = f'''
+        SELECT o.order_id, s.stock_code, s.stock_name, o.order_type, o.shares, o.price, o.status, o.created_at
+        FROM ({" UNION ALL ".join(branches)}) o
+        JOIN stocks s ON o.stock_id = s.stock_id
+        ORDER BY o.created_at {order}, o.order_id {order}
+        LIMIT ?
+        '''
+        parameters.append(page_size + 1)
+
+        result = await execute_query(self.db_name, query, tuple(parameters), 'all') or []
+        has_more = len(result) > page_size
+        result = result[:page_size]
+
+        if before is not None:
+            result.reverse()
+
+        return result, has_more
+
+    async def count_user_orders(self, user_id: int, active_only=False):
+        """獲取用戶委託單的大約數量 (短時間快取)"""
+        await self.setup_database()
+
+        if active_only:
+            query = "SELECT COUNT(*) FROM stock_orders WHERE user_id = ? AND status = 'active'"
+            parameters = (user_id,)
+        else:
+            query = '''
+            SELECT (SELECT COUNT(*) FROM stock_orders WHERE user_id = ?)
+                 + (SELECT COUNT(*) FROM stock_orders_archive WHERE user_id = ?)
+            '''
+            parameters = (user_id, user_id)
+
+        return await self._cached_count(('orders', user_id, active_only), query, parameters)
+
     async def cancel_order(self, user_id: int, order_id: int):
         """取消委託單"""
         # 確保資料庫已設置
@@ -715,14 +1382,12 @@ class Stock:
         await self.setup_database()
         
         # 獲取股票ID
-        query = 'SELECT stock_id FROM stocks WHERE stock_code = ?'
-        result = await execute_query(self.db_name, query, (stock_code,), 'one')
-        
-        if not result:
+        await stock_registry.ensure_loaded(self)
+        stock_id = stock_registry.get_id(stock_code)
+
+        if stock_id is None:
             return None
         
-        stock_id = result[0]
-        
         # 獲取價格歷史
         query = '''
         SELECT date, price
@@ -740,13 +1405,7 @@ class Stock:
         # 確保資料庫已設置
         await self.setup_database()
         
-        query = '''
-        SELECT 
-            SUM(h.shares * s.price) as market_value
-        FROM stock_holdings h
-        JOIN stocks s ON h.stock_id = s.stock_id
-        WHERE h.user_id = ?
-        '''
+        query = 'SELECT equity_value FROM portfolio_values WHERE user_id = ?'
         
         result = await execute_query(self.db_name, query, (user_id,), 'one')
         
@@ -778,14 +1437,12 @@ class Stock:
         await self.setup_database()
         
         # 獲取股票ID
-        query = 'SELECT stock_id FROM stocks WHERE stock_code = ?'
-        result = await execute_query(self.db_name, query, (stock_code,), 'one')
-        
-        if not result:
+        await stock_registry.ensure_loaded(self)
+        stock_id = stock_registry.get_id(stock_code)
+
+        if stock_id is None:
             return None
         
-        stock_id = result[0]
-        
         # 獲取股東列表
         query = '''
         SELECT 
@@ -798,4 +1455,90 @@ class Stock:
         '''
         
         result = await execute_query(self.db_name, query, (stock_id, stock_id, limit), 'all')
-        return result
\ No newline at end of file
+        return result
+    async def archive_history(self, transaction_retention_days: int = 30):
+        """歸檔已結束的委託單與過期的成交紀錄，熱資料表只保留活躍資料"""
+        # 確保資料庫已設置
+        await self.setup_database()
+        
+        cutoff = f'-{int(transaction_retention_days)} days'
+        
+        # 統計本次要歸檔的筆數
+        query = "SELECT COUNT(*) FROM stock_orders WHERE status != 'active'"
+        result = await execute_query(self.db_name, query, fetch_type='one')
+        order_count = result[0] if result else 0
+        
+        query = "SELECT COUNT(*) FROM stock_transactions WHERE created_at < datetime('now', ?)"
+        result = await execute_query(self.db_name, query, (cutoff,), 'one')
+        transaction_count = result[0] if result else 0
+        
+        if not order_count and not transaction_count:
+            return {'orders': 0, 'transactions': 0}
+        
+        queries = [
+            # 已完成或已取消的委託單移至冷資料表
+            ('''
+            INSERT OR REPLACE INTO stock_orders_archive
+                (order_id, user_id, stock_id, order_type, shares, price, created_at, status)
+            SELECT order_id, user_id, stock_id, order_type, shares, price, created_at, status
+            FROM stock_orders
+            WHERE status != 'active'
+            ''', ()),
+            ("DELETE FROM stock_orders WHERE status != 'active'", ()),
+            # 先把過期成交紀錄累計到每日彙總
+            ('''
+            INSERT INTO stock_trade_rollups
+                (stock_id, date, trade_count, volume, turnover, high_price, low_price)
+            SELECT 
+                stock_id, DATE(created_at), COUNT(*), SUM(shares), SUM(total_amount),
+                MAX(price_per_share), MIN(price_per_share)
+            FROM stock_transactions
+            WHERE created_at < datetime('now', ?)
+            GROUP BY stock_id, DATE(created_at)
+            ON CONFLICT(stock_id, date) DO UPDATE SET
+                trade_count = trade_count + excluded.trade_count,
+                volume = volume + excluded.volume,
+                turnover = turnover + excluded.turnover,
+                high_price = MAX(high_price, excluded.high_price),
+                low_price = MIN(low_price, excluded.low_price)
+            ''', (cutoff,)),
+            ('''
+            INSERT OR REPLACE INTO stock_transactions_archive
+                (transaction_id, stock_id, seller_id, buyer_id, shares, price_per_share,
+                 total_amount, transaction_type, created_at)
+            SELECT 
+                transaction_id, stock_id, seller_id, buyer_id, shares, price_per_share,
+                total_amount, transaction_type, created_at
+            FROM stock_transactions
+            WHERE created_at < datetime('now', ?)
+            ''', (cutoff,)),
+            ("DELETE FROM stock_transactions WHERE created_at < datetime('now', ?)", (cutoff,)),
+        ]
+        
+        success = await execute_transaction(self.db_name, queries)
+        if not success:
+            return None
+        
+        return {'orders': order_count, 'transactions': transaction_count}
+
+    async def get_trade_rollups(self, stock_code: str, days=30):
+        """獲取股票的每日成交彙總 (僅包含已歸檔的日期)"""
+        # 確保資料庫已設置
+        await self.setup_database()
+        
+        await stock_registry.ensure_loaded(self)
+        stock_id = stock_registry.get_id(stock_code)
+
+        if stock_id is None:
+            return None
+
+        query = '''
+        SELECT date, trade_count, volume, turnover, high_price, low_price
+        FROM stock_trade_rollups
+        WHERE stock_id = ?
+        ORDER BY date DESC
+        LIMIT ?
+        '''
+        
+        result = await execute_query(self.db_name, query, (stock_id, days), 'all')
+        return result
@@ -0,0 +1,91 @@
+import discord
+from discord.ui import View
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+# 元件處理函數：await handler(interaction, entity_id, option)
+ComponentHandler = Callable[[discord.Interaction, str, str], Awaitable[None]]
+
+# custom_id 格式為 "類型:實體ID:選項"，Discord 限制最多100個字元
+SEPARATOR = ":"
+MAX_CUSTOM_ID_LENGTH = 100
+
+
+def static_view(*items) -> View:
+    """建立只用來送出元件的視圖
+
+    視圖在送出前就先停止，discord.py 不會把它保存在記憶體中，
+    按鈕點擊改由 ComponentRouter 依 custom_id 分派。
+    """
+    view = View(timeout=None)
+    for item in items:
+        view.add_item(item)
+    view.stop()
+    return view
+
+
+class ComponentRouter:
+    """依結構化 custom_id 將按鈕互動分派給無狀態的處理函數"""
+
+    def __init__(self):
+        self._handlers: Dict[str, ComponentHandler] = {}
+        self._legacy_prefixes: List[Tuple[str, str]] = []  # [(舊前綴, 類型)]
+
+    def register(self, kind: str, handler: ComponentHandler):
+        """註冊類型的處理函數"""
+        if SEPARATOR in kind:
+            raise ValueError(f"元件類型不能包含 '{SEPARATOR}': {kind}")
+        self._handlers[kind] = handler
+
+    def unregister(self, kind: str):
+        """移除類型的處理函數"""
+        self._handlers.pop(kind, None)
+
+    def register_legacy(self, prefix: str, kind: str):
+        """相容舊格式的 custom_id (例如 role_<id>)，前綴之後的部分視為選項"""
+        if (prefix, kind) not in self._legacy_prefixes:
+            self._legacy_prefixes.append((prefix, kind))
+
+    @staticmethod
+    def custom_id(kind: str, entity_id, option="") -> str:
+        """組合 custom_id"""
+        custom_id = f"{kind}{SEPARATOR}{entity_id}{SEPARATOR}{option}"
+        if len(custom_id) > MAX_CUSTOM_ID_LENGTH:
+            raise ValueError(f"custom_id 過長: {custom_id}")
+        return custom_id
+
+    def parse(self, custom_id: str) -> Optional[Tuple[str, str, str]]:
+        """解析 custom_id，返回 (類型, 實體ID, 選項)，無法辨識時返回 None"""
+        parts = custom_id.split(SEPARATOR, 2)
+        if len(parts) == 3:
+            return parts[0], parts[1], parts[2]
+
+        for prefix, kind in self._legacy_prefixes:
+            if custom_id.startswith(prefix):
+                return kind, "", custom_id[len(prefix):]
+
+        return None
+
+    async def dispatch(self, interaction: discord.Interaction):
+        """on_interaction 監聽器：處理已註冊類型的元件互動"""
+        if interaction.type != discord.InteractionType.component:
+            return
+
+        parsed = self.parse((interaction.data or {}).get("custom_id", ""))
+        if not parsed:
+            return
+
+        kind, entity_id, option = parsed
+        handler = self._handlers.get(kind)
+        if not handler:
+            return
+
+        try:
+            await handler(interaction, entity_id, option)
+        except Exception as e:
+            print(f"處理元件互動 {kind} 時發生錯誤: {e}")
+            if not interaction.response.is_done():
+                await interaction.response.send_message("處理按鈕時發生錯誤，請稍後再試！", ephemeral=True)
+
+
+# 全域共用的元件路由
+component_router = ComponentRouter()
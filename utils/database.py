@@ -122,6 +122,59 @@ async def execute_transaction(db_name: str, queries: list):
         print(f"執行交易時發生錯誤: {e}")
         return False
 
+async def execute_batch(db_name: str, batches: list):
+    """
+    在同一個交易中批次執行多組參數 (executemany)
+
+    Args:
+        db_name (str): 資料庫名稱
+        batches (list): 批次列表，每項是 (query, 參數列表) 的元組
+
+    Returns:
+        bool: 是否成功執行
+    """
+    conn = await get_db_connection(db_name)
+
+    try:
+        async with conn.cursor() as cursor:
+            await conn.execute("BEGIN TRANSACTION")
+
+            for query, parameter_list in batches:
+                if parameter_list:
+                    await cursor.executemany(query, parameter_list)
+
+            await conn.commit()
+            return True
+    except Exception as e:
+        await conn.rollback()
+        print(f"批次執行時發生錯誤: {e}")
+        return False
+
+async def attach_database(db_name: str, other_db_name: str, alias: str) -> bool:
+    """
+    將另一個資料庫附加到連接上，以便跨資料庫 JOIN
+
+    Args:
+        db_name (str): 資料庫名稱
+        other_db_name (str): 要附加的資料庫名稱
+        alias (str): 附加後使用的名稱
+
+    Returns:
+        bool: 是否成功附加
+    """
+    conn = await get_db_connection(db_name)
+
+    try:
+        async with conn.execute("PRAGMA database_list") as cursor:
+            attached = [row[1] for row in await cursor.fetchall()]
+
+        if alias not in attached:
+            await conn.execute(f"ATTACH DATABASE ? AS {alias}", (f'data/{other_db_name}.db',))
+        return True
+    except Exception as e:
+        print(f"附加資料庫時發生錯誤: {e}")
+        return False
+
 async def table_exists(db_name: str, table_name: str) -> bool:
     """
     檢查資料表是否存在
@@ -0,0 +1,140 @@
+import json
+import asyncio
+from collections import OrderedDict
+from typing import Dict, Tuple
+import discord
+
+
+def _fingerprint(kwargs: dict) -> str:
+    """將編輯內容轉成可比較的字串，用來略過沒有變化的編輯"""
+    payload = {}
+    for key, value in kwargs.items():
+        if isinstance(value, discord.Embed):
+            value = value.to_dict()
+        elif isinstance(value, list) and value and isinstance(value[0], discord.Embed):
+            value = [embed.to_dict() for embed in value]
+        elif isinstance(value, discord.ui.View):
+            value = value.to_components()
+        payload[key] = value
+    return json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+
+
+class RenderScheduler:
+    """訊息編輯排程器
+
+    同一則訊息的編輯請求會合併，只送出最新的狀態；
+    同一頻道的編輯之間至少間隔 min_interval 秒，遇到 429 時依 retry_after 延後。
+    內容與上次送出的相同時直接略過。
+    """
+
+    def __init__(self, min_interval: float = 1.0, default_retry: float = 5.0, history_size: int = 1024):
+        self.min_interval = min_interval
+        self.default_retry = default_retry
+        self.history_size = history_size
+
+        self._pending: Dict[int, Tuple[discord.Message, dict]] = {}  # {message_id: (訊息, 編輯內容)}
+        self._tasks: Dict[int, asyncio.Task] = {}                     # {message_id: 負責送出的任務}
+        self._channel_ready: Dict[int, float] = {}                    # {channel_id: 下次可編輯的時間}
+        self._last_payload: OrderedDict = OrderedDict()               # {message_id: 上次送出的內容}
+
+        self.requested = 0
+        self.coalesced = 0
+        self.skipped = 0
+        self.sent = 0
+        self.rate_limited = 0
+
+    def submit(self, message, **kwargs):
+        """排程一次訊息編輯，不等待送出"""
+        key = message.id
+        self.requested += 1
+
+        if key in self._pending:
+            self.coalesced += 1
+        self._pending[key] = (message, kwargs)
+
+        if key not in self._tasks:
+            self._tasks[key] = asyncio.create_task(self._run(key))
+
+    async def edit(self, message, **kwargs):
+        """排程一次訊息編輯，並等待最新狀態送出"""
+        self.submit(message, **kwargs)
+        task = self._tasks.get(message.id)
+        if task:
+            await asyncio.shield(task)
+
+    def forget(self, message_id: int):
+        """訊息不再更新時清除紀錄"""
+        self._pending.pop(message_id, None)
+        self._last_payload.pop(message_id, None)
+
+    def stats(self) -> dict:
+        """排程器統計"""
+        return {
+            'requested': self.requested,
+            'coalesced': self.coalesced,
+            'skipped': self.skipped,
+            'sent': self.sent,
+            'rate_limited': self.rate_limited,
+            'pending': len(self._pending)
+        }
+
+    async def _reserve_slot(self, channel_id: int):
+        """預約頻道的下一個編輯時段並等待"""
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        slot = max(now, self._channel_ready.get(channel_id, 0))
+        self._channel_ready[channel_id] = slot + self.min_interval
+
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    async def _run(self, key: int):
+        """持續送出該訊息最新的待編輯內容，直到沒有新的請求"""
+        try:
+            while key in self._pending:
+                message, _ = self._pending[key]
+                channel_id = getattr(message.channel, 'id', 0)
+                await self._reserve_slot(channel_id)
+
+                entry = self._pending.pop(key, None)
+                if entry is None:
+                    break
+                message, kwargs = entry
+
+                fingerprint = _fingerprint(kwargs)
+                if self._last_payload.get(key) == fingerprint:
+                    self.skipped += 1
+                    continue
+
+                try:
+                    await message.edit(**kwargs)
+                except discord.NotFound:
+                    # 訊息已被刪除
+                    self.forget(key)
+                    break
+                except discord.HTTPException as e:
+                    if e.status != 429:
+                        print(f"編輯訊息時發生錯誤: {e}")
+                        continue
+
+                    # 被限速時延後整個頻道，並保留內容重試 (期間若有更新的狀態則以新的為準)
+                    self.rate_limited += 1
+                    retry_after = getattr(e, 'retry_after', None) or self.default_retry
+                    loop = asyncio.get_running_loop()
+                    self._channel_ready[channel_id] = max(
+                        self._channel_ready.get(channel_id, 0), loop.time() + retry_after
+                    )
+                    self._pending.setdefault(key, (message, kwargs))
+                    continue
+
+                self.sent += 1
+                self._last_payload[key] = fingerprint
+                self._last_payload.move_to_end(key)
+                while len(self._last_payload) > self.history_size:
+                    self._last_payload.popitem(last=False)
+        finally:
+            self._tasks.pop(key, None)
+
+
+# 全域共用的排程器
+render_scheduler = RenderScheduler()
@@ -0,0 +1,178 @@
+import time
+import asyncio
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+# 過期回呼：await on_expire(session, reason)，reason 為 "timeout"、"capacity" 或 "replaced"
+ExpireCallback = Callable[['Session', str], Awaitable[None]]
+
+
+class Session:
+    """一個互動遊戲或投票的工作階段"""
+    __slots__ = ('kind', 'key', 'state', 'created_at', 'expires_at', 'on_expire')
+
+    def __init__(self, kind: str, key: Hashable, state: Any, ttl: float, on_expire: Optional[ExpireCallback]):
+        self.kind = kind
+        self.key = key
+        self.state = state
+        self.created_at = time.monotonic()
+        self.expires_at = self.created_at + ttl
+        self.on_expire = on_expire
+
+    @property
+    def remaining(self) -> float:
+        """距離過期的秒數"""
+        return max(0.0, self.expires_at - time.monotonic())
+
+
+class SessionKind:
+    """工作階段類型的設定與統計"""
+    __slots__ = ('ttl', 'capacity', 'on_expire', 'sessions', 'opened', 'closed', 'expired', 'evicted')
+
+    def __init__(self, ttl: float, capacity: int, on_expire: Optional[ExpireCallback]):
+        self.ttl = ttl
+        self.capacity = capacity
+        self.on_expire = on_expire
+        self.sessions: OrderedDict = OrderedDict()  # {key: Session}，依開啟順序
+        self.opened = 0
+        self.closed = 0
+        self.expired = 0
+        self.evicted = 0
+
+
+class SessionRegistry:
+    """集中管理互動工作階段
+
+    每種類型有各自的存活時間與數量上限，過期或超過上限的工作階段
+    由背景清理任務呼叫回呼 (退還下注、停用按鈕) 後移除。
+    """
+
+    def __init__(self, janitor_interval: float = 5.0):
+        self.janitor_interval = janitor_interval
+        self._kinds: Dict[str, SessionKind] = {}
+        self._janitor: Optional[asyncio.Task] = None
+
+    def configure(self, kind: str, ttl: float, capacity: int = 1000, on_expire: ExpireCallback = None):
+        """設定工作階段類型的預設存活時間、數量上限與過期回呼"""
+        settings = self._kinds.get(kind)
+        if settings is None:
+            self._kinds[kind] = SessionKind(ttl, capacity, on_expire)
+        else:
+            settings.ttl = ttl
+            settings.capacity = capacity
+            settings.on_expire = on_expire
+
+    def open(self, kind: str, key: Hashable, state: Any = None, ttl: float = None,
+             on_expire: ExpireCallback = None) -> Session:
+        """開啟工作階段 (同一個鍵已存在時，舊的工作階段以 replaced 結束)"""
+        settings = self._kinds.get(kind)
+        if settings is None:
+            raise KeyError(f"未設定的工作階段類型: {kind}")
+
+        self._ensure_janitor()
+
+        session = Session(kind, key, state, ttl or settings.ttl, on_expire or settings.on_expire)
+        replaced = settings.sessions.pop(key, None)
+        if replaced:
+            settings.evicted += 1
+            self._run_callback(replaced, "replaced")
+
+        settings.sessions[key] = session
+        settings.opened += 1
+
+        # 超過上限時淘汰最早開啟的工作階段
+        while len(settings.sessions) > settings.capacity:
+            _, oldest = settings.sessions.popitem(last=False)
+            settings.evicted += 1
+            self._run_callback(oldest, "capacity")
+
+        return session
+
+    def get(self, kind: str, key: Hashable) -> Optional[Session]:
+        """取得仍有效的工作階段"""
+        settings = self._kinds.get(kind)
+        if settings is None:
+            return None
+
+        session = settings.sessions.get(key)
+        if session and session.expires_at <= time.monotonic():
+            return None
+        return session
+
+    def touch(self, kind: str, key: Hashable, ttl: float = None) -> bool:
+        """延長工作階段的存活時間"""
+        session = self.get(kind, key)
+        if not session:
+            return False
+
+        session.expires_at = time.monotonic() + (ttl or self._kinds[kind].ttl)
+        return True
+
+    def close(self, kind: str, key: Hashable) -> Optional[Session]:
+        """正常結束工作階段 (不呼叫過期回呼)"""
+        settings = self._kinds.get(kind)
+        if settings is None:
+            return None
+
+        session = settings.sessions.pop(key, None)
+        if session:
+            settings.closed += 1
+        return session
+
+    async def sweep(self):
+        """移除所有已過期的工作階段並執行回呼"""
+        now = time.monotonic()
+        expired = []
+
+        # 先同步移除所有過期的工作階段，回呼期間重新開啟或關閉的工作階段不受影響
+        for settings in self._kinds.values():
+            for session in [session for session in settings.sessions.values() if session.expires_at <= now]:
+                del settings.sessions[session.key]
+                settings.expired += 1
+                expired.append(session)
+
+        for session in expired:
+            await self._call(session, "timeout")
+
+    def stats(self) -> Dict[str, dict]:
+        """各類型工作階段的統計"""
+        return {
+            kind: {
+                'live': len(settings.sessions),
+                'capacity': settings.capacity,
+                'ttl': settings.ttl,
+                'opened': settings.opened,
+                'closed': settings.closed,
+                'expired': settings.expired,
+                'evicted': settings.evicted
+            }
+            for kind, settings in self._kinds.items()
+        }
+
+    def _ensure_janitor(self):
+        if self._janitor is None or self._janitor.done():
+            self._janitor = asyncio.create_task(self._janitor_loop())
+
+    async def _janitor_loop(self):
+        while True:
+            await asyncio.sleep(self.janitor_interval)
+            try:
+                await self.sweep()
+            except Exception as e:
+                print(f"清理工作階段時發生錯誤: {e}")
+
+    def _run_callback(self, session: Session, reason: str):
+        if session.on_expire:
+            asyncio.create_task(self._call(session, reason))
+
+    async def _call(self, session: Session, reason: str):
+        if not session.on_expire:
+            return
+        try:
+            await session.on_expire(session, reason)
+        except Exception as e:
+            print(f"結束工作階段 {session.kind}:{session.key} 時發生錯誤: {e}")
+
+
+# 全域共用的工作階段註冊表
+session_registry = SessionRegistry()